@@ -0,0 +1,244 @@
+# alert_engine.py
+
+from collections import deque
+import threading
+
+from config import (ALERT_RSI_OVERBOUGHT, ALERT_RSI_OVERSOLD, ALERT_PRICE_CHANGE_THRESHOLD, ALERT_COOLDOWN,
+                    ALERT_QUEUE_SIZE, DEBUG)
+from metrics import registry
+
+ALERT_EVENTS = registry.counter('predict_alerts_total', "Eventos de alerta emitidos", ('symbol', 'rule', 'kind'))
+ALERTS_SUPPRESSED = registry.counter(
+    'predict_alerts_suppressed_total', "Alertas activadas dentro de su cooldown (sin evento)", ('rule',))
+
+# Prefijo de los mensajes por severidad (UI)
+SEVERITY_ICONS = {'info': 'ℹ️', 'warning': '⚠️', 'critical': '‼️'}
+
+
+class AlertRule:
+    """
+    Regla de alerta declarada una vez. Compara el campo `field` del
+    contexto de cada tick (ver AlertEngine.on_ticks) con `level`, un
+    número o el nombre de otro campo:
+
+    - 'above' / 'below': se activa al pasar el nivel y no se desactiva
+      hasta volver `hysteresis` por el otro lado (sin rebotes en el borde).
+    - 'cross': avisa de cada cambio de lado respecto al nivel, con la
+      misma banda muerta de `hysteresis`.
+
+    `when` exige valores de otros campos (p.ej. {'direction': 'up'}),
+    `symbols` limita la regla a esos símbolos y `cooldown` (s) es el
+    tiempo mínimo entre dos avisos de la regla en un símbolo.
+    """
+
+    OPS = ('above', 'below', 'cross')
+
+    __slots__ = ('name', 'field', 'op', 'level', 'hysteresis', 'cooldown_ms', 'severity', 'message', 'when',
+                 'symbols')
+
+    def __init__(self, name, field, op, level, hysteresis=0.0, cooldown=ALERT_COOLDOWN, severity='warning',
+                 message=None, when=None, symbols=None):
+        if op not in self.OPS:
+            raise ValueError(f"Operador de alerta desconocido: {op}")
+        if severity not in SEVERITY_ICONS:
+            raise ValueError(f"Severidad desconocida: {severity}")
+        self.name = name
+        self.field = field
+        self.op = op
+        self.level = level
+        self.hysteresis = hysteresis
+        self.cooldown_ms = int(cooldown * 1000)
+        self.severity = severity
+        self.message = message or f"{name.upper()} ({{value:.4g}})"
+        self.when = dict(when or {})
+        self.symbols = None if symbols is None else {s.upper() for s in symbols}
+
+    def applies_to(self, symbol_key):
+        return self.symbols is None or symbol_key in self.symbols
+
+
+class RuleState:
+    """Estado de una regla en un símbolo"""
+
+    __slots__ = ('active', 'side', 'last_fired', 'event')
+
+    def __init__(self):
+        self.active = False
+        self.side = 0           # Lado del nivel en reglas 'cross' (0 = aún no se sabe)
+        self.last_fired = None  # Timestamp (ms) del último aviso
+        self.event = None       # Evento que activó la regla (si se emitió)
+
+
+DEFAULT_RULES = (
+    AlertRule('rsi_overbought', 'rsi', 'above', ALERT_RSI_OVERBOUGHT, hysteresis=5,
+              message="OVERBOUGHT (RSI {value:.1f})"),
+    AlertRule('rsi_oversold', 'rsi', 'below', ALERT_RSI_OVERSOLD, hysteresis=5,
+              message="OVERSOLD (RSI {value:.1f})"),
+    # Posición en las bandas de Bollinger: 0 = banda inferior, 1 = superior
+    AlertRule('bb_upper', 'bb_position', 'above', 1.0, hysteresis=0.1,
+              message="UPPER BOLLINGER BAND ({price:.4f})"),
+    AlertRule('bb_lower', 'bb_position', 'below', 0.0, hysteresis=0.1,
+              message="LOWER BOLLINGER BAND ({price:.4f})"),
+    AlertRule('ema_cross', 'ema_gap', 'cross', 0.0, hysteresis=0.0005, severity='info',
+              message="PRICE CROSSED EMA {side} ({price:.4f})"),
+    # Divergencia con la predicción del horizonte principal
+    AlertRule('drop_vs_bullish', 'change', 'below', -ALERT_PRICE_CHANGE_THRESHOLD, severity='critical',
+              when={'direction': 'up'}, message="SHARP DROP ({value:+.2%}) DURING BULLISH PREDICTION"),
+    AlertRule('spike_vs_bearish', 'change', 'above', ALERT_PRICE_CHANGE_THRESHOLD, severity='critical',
+              when={'direction': 'down'}, message="SHARP SPIKE ({value:+.2%}) DURING BEARISH PREDICTION"),
+)
+
+
+class AlertEngine:
+    """
+    Evalúa las reglas de todos los símbolos tick a tick sobre el estado
+    ya calculado (indicadores incrementales, última predicción), así el
+    coste por tick es O(reglas del símbolo) y no depende del historial.
+    Ese estado se lee una vez por lote (ver on_ticks).
+
+    Cada activación (fuera de su cooldown) y su desactivación generan un
+    evento estructurado con número de secuencia, que se guarda en una cola
+    acotada; get_events(since) devuelve los posteriores a una secuencia.
+    """
+
+    def __init__(self, rules=None, queue_size=ALERT_QUEUE_SIZE):
+        self.rules = tuple(DEFAULT_RULES if rules is None else rules)
+        self.events = deque(maxlen=queue_size)
+        self.seq = 0              # Eventos emitidos
+        self.symbols = {}         # symbol -> [(regla, estado)] de las reglas que le aplican
+        self.last_price = {}
+        self.lock = threading.Lock()
+
+    def _bound(self, symbol_key):
+        bound = self.symbols.get(symbol_key)
+        if bound is None:
+            bound = self.symbols[symbol_key] = [
+                (rule, RuleState()) for rule in self.rules if rule.applies_to(symbol_key)
+            ]
+        return bound
+
+    def on_ticks(self, symbol, timestamps, prices, indicators=None, prediction=None):
+        """
+        Evalúa las reglas con cada tick nuevo del símbolo, en orden. El
+        contexto de un tick son los `indicators` (DataBuffer.get_indicators)
+        más price, change (respecto al tick anterior), bb_position, ema_gap
+        y, con `prediction` (precio predicho al horizonte principal),
+        predicted_move y direction. Devuelve los eventos emitidos.
+
+        Granularidad: `indicators` y `prediction` son una sola instantánea
+        para todo el lote (la última, tomada después de sus ticks), así que
+        las reglas sobre campos de indicadores (rsi) sólo ven un valor por
+        lote; price, change, bb_position y ema_gap sí cambian tick a tick,
+        aunque contra las bandas y la EMA de esa instantánea. El scheduler
+        pasa como mucho ALERT_MAX_TICKS ticks por pasada: si llegan más
+        entre dos pasadas, los anteriores no se evalúan.
+        """
+        symbol_key = symbol.upper()
+        context = dict(indicators or {})
+        lower, upper, ema = context.get('bb_lower'), context.get('bb_upper'), context.get('ema')
+        width = upper - lower if lower is not None and upper is not None else 0.0
+        emitted = []
+        with self.lock:
+            bound = self._bound(symbol_key)
+            if not bound:
+                return emitted
+            previous = self.last_price.get(symbol_key)
+            for timestamp, price in zip(timestamps, prices):
+                context['price'] = price
+                context['change'] = price / previous - 1 if previous else None
+                context['bb_position'] = (price - lower) / width if width > 0 else None
+                context['ema_gap'] = price / ema - 1 if ema else None
+                if prediction is not None:
+                    context['predicted_move'] = prediction / price - 1
+                    context['direction'] = 'up' if prediction > price else 'down'
+                for rule, state in bound:
+                    event = self._evaluate(rule, state, context, symbol_key, timestamp)
+                    if event is not None:
+                        emitted.append(event)
+                previous = price
+            self.last_price[symbol_key] = previous
+        return emitted
+
+    def _evaluate(self, rule, state, context, symbol_key, timestamp):
+        value = context.get(rule.field)
+        level = context.get(rule.level) if isinstance(rule.level, str) else rule.level
+        if value is None or level is None or value != value:
+            return None
+        if rule.op == 'cross':
+            h = rule.hysteresis
+            side = 1 if value > level + h else -1 if value < level - h else 0
+            if not side or side == state.side:
+                return None
+            crossed = state.side != 0
+            state.side = side
+            if not crossed:
+                return None
+            return self._trigger(rule, state, context, symbol_key, timestamp, value, level,
+                                 'up' if side > 0 else 'down')
+
+        distance = value - level if rule.op == 'above' else level - value
+        matches = all(context.get(k) == v for k, v in rule.when.items())
+        if not state.active:
+            if matches and distance > 0:
+                state.active = True
+                return self._trigger(rule, state, context, symbol_key, timestamp, value, level)
+        elif not matches or distance < -rule.hysteresis:
+            state.active = False
+            trigger, state.event = state.event, None
+            if trigger is not None:
+                return self._emit(rule, symbol_key, timestamp, 'cleared', value, level, trigger['message'])
+        return None
+
+    def _trigger(self, rule, state, context, symbol_key, timestamp, value, level, side=None):
+        if state.last_fired is not None and timestamp - state.last_fired < rule.cooldown_ms:
+            ALERTS_SUPPRESSED.labels(rule.name).inc()
+            return None
+        state.last_fired = timestamp
+        try:
+            text = rule.message.format_map({**context, 'value': value, 'level': level, 'side': side or ''})
+        except (KeyError, ValueError, TypeError) as e:
+            if DEBUG:
+                print(f"Error formatting alert {rule.name}: {e}")
+            text = rule.name
+        message = f"{SEVERITY_ICONS[rule.severity]} {symbol_key}: {text}"
+        event = self._emit(rule, symbol_key, timestamp, 'triggered', value, level, message, side)
+        if rule.op != 'cross':
+            state.event = event
+        return event
+
+    def _emit(self, rule, symbol_key, timestamp, kind, value, level, message, side=None):
+        self.seq += 1
+        event = {
+            'seq': self.seq,
+            'timestamp': int(timestamp),
+            'symbol': symbol_key,
+            'rule': rule.name,
+            'kind': kind,
+            'severity': rule.severity,
+            'value': float(value),
+            'level': float(level),
+            'side': side,            # Reglas 'cross': lado al que se cruzó ('up'/'down')
+            'message': message
+        }
+        self.events.append(event)
+        ALERT_EVENTS.labels(symbol_key, rule.name, kind).inc()
+        return event
+
+    def get_events(self, since=0, symbol=None, limit=None):
+        """Eventos con secuencia posterior a `since` (de un símbolo si se indica), del más antiguo al más nuevo"""
+        symbol_key = symbol.upper() if symbol else None
+        with self.lock:
+            events = [e for e in self.events
+                      if e['seq'] > since and (symbol_key is None or e['symbol'] == symbol_key)]
+        return events[-limit:] if limit else events
+
+    def active(self, symbol=None):
+        """Eventos de activación de las reglas que siguen activas (de todos los símbolos o de uno)"""
+        with self.lock:
+            symbols = [symbol.upper()] if symbol else list(self.symbols)
+            return [state.event for s in symbols for _, state in self.symbols.get(s, ())
+                    if state.active and state.event is not None]
+
+
+# Instancia global compartida por el scheduler y la API
+alert_engine = AlertEngine()
@@ -8,7 +8,12 @@ from config import (
     DEBUG
 )
 
-def check_alerts(symbol, price_series, prediction_direction):
+def check_alerts(symbol, price_series, prediction_direction, indicators=None):
+    """
+    Genera alertas para un símbolo. Si se pasa `indicators` (el snapshot de
+    DataBuffer.get_indicators) se usan sus valores en lugar de recalcular
+    RSI y Bollinger sobre toda la serie.
+    """
     alerts = []
     
     if len(price_series) < 20:
@@ -16,8 +21,12 @@ def check_alerts(symbol, price_series, prediction_direction):
     
     try:
         # Calcular indicadores
-        rsi = calculate_rsi(price_series)
-        lower_band, _, upper_band = calculate_bollinger_bands(price_series)
+        if indicators is not None:
+            rsi = indicators['rsi']
+            lower_band, upper_band = indicators['bb_lower'], indicators['bb_upper']
+        else:
+            rsi = calculate_rsi(price_series)
+            lower_band, _, upper_band = calculate_bollinger_bands(price_series)
         
         # Análisis de precios
         last_price = price_series[-1]
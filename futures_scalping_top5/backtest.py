@@ -0,0 +1,295 @@
+# backtest.py
+
+import argparse
+import json
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from alert_engine import AlertEngine
+from config import TOP_SYMBOLS, PREDICTION_INTERVAL, PREDICTION_HORIZON, PREDICTION_MIN_TICKS, ALERT_MAX_TICKS, DEBUG
+from data_buffer import DataBuffer
+from online_predictor import MODEL_TYPES, OnlinePredictor
+from prediction_buffer import PredictionBuffer, MATCH_WINDOW_MS
+from predictor import BatchPredictor, PREDICTION_WINDOW_TICKS, SAVGOL_WINDOW, SAVGOL_POLYORDER, WEIGHT_DECAY, _predict_block
+
+# Filas de ventanas que se resuelven por bloque en el modo rápido (acota la memoria)
+FAST_CHUNK_ROWS = 4096
+
+
+def load_ticks(store, symbols, since=None, until=None):
+    """Ticks grabados en un TickStore como {symbol: (timestamps, prices)}"""
+    data = {}
+    for symbol in symbols:
+        records = store.read(symbol, since, until)
+        data[symbol.upper()] = (np.array(records['timestamp']), np.array(records['price']))
+    return data
+
+
+def synthetic_ticks(symbols, hours=24, start_ms=1_700_000_000_000, seed=0, step_ms=100):
+    """Paseo aleatorio sintético de `hours` horas por símbolo"""
+    from fake_binance import synthetic_agg_trades
+    n = int(hours * 3_600_000 / step_ms)
+    columns = synthetic_agg_trades(symbols, n, start_ms, seed, step_ms)
+    return {symbol: (c['T'], c['p']) for symbol, c in columns.items()}
+
+
+def _match_indices(timestamps, targets, match_window_ms=MATCH_WINDOW_MS):
+    """
+    Índice del tick que resuelve cada predicción con la misma regla que
+    PredictionBuffer: el primero en o tras el objetivo, si llega antes de
+    match_window_ms. -1 si no hay ninguno.
+    """
+    idx = np.searchsorted(timestamps, targets, side='left')
+    found = idx < len(timestamps)
+    found[found] &= timestamps[idx[found]] < targets[found] + match_window_ms
+    return np.where(found, idx, -1)
+
+
+def _report(symbol, base, predicted, actual, elapsed):
+    """Métricas de un símbolo: MAE, acierto de dirección y latencia por predicción"""
+    matched = ~np.isnan(actual)
+    errors = np.abs(predicted[matched] - actual[matched])
+    predicted_move = np.sign(predicted[matched] - base[matched])
+    actual_move = np.sign(actual[matched] - base[matched])
+    n = len(predicted)
+    return {
+        'symbol': symbol,
+        'predictions': n,
+        'matched': int(matched.sum()),
+        'mae': float(errors.mean()) if len(errors) else None,
+        'mape': float((errors / actual[matched]).mean()) if len(errors) else None,
+        'hit_rate': float((predicted_move == actual_move).mean()) if len(errors) else None,
+        'latency_us': elapsed / n * 1e6 if n else None
+    }
+
+
+def fast_backtest(timestamps, prices, interval=PREDICTION_INTERVAL, horizon=PREDICTION_HORIZON,
+                  window_size=PREDICTION_WINDOW_TICKS, min_ticks=PREDICTION_MIN_TICKS,
+                  savgol_window=SAVGOL_WINDOW, polyorder=SAVGOL_POLYORDER, decay=WEIGHT_DECAY,
+                  match_window_ms=MATCH_WINDOW_MS):
+    """
+    Evalúa el predictor cada `interval` segundos sobre toda la serie en una
+    pasada vectorizada: todas las ventanas se apilan y se resuelven con
+    _predict_block. Devuelve (base, predicho, real) por instante evaluado
+    (real = NaN si no hubo tick para emparejar).
+
+    Sólo se evalúan instantes con `window_size` ticks previos (al principio
+    de la serie el predictor en vivo usa ventanas más cortas).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    empty = np.empty(0)
+    n = min(window_size, len(timestamps))
+    if n < min_ticks:
+        return empty, empty, empty
+
+    # Último tick disponible en cada instante de predicción
+    step = int(interval * 1000)
+    times = np.arange(timestamps[0] + step, timestamps[-1] + 1, step)
+    last = np.searchsorted(timestamps, times, side='right') - 1
+    last = np.unique(last[last >= n - 1])
+    if not len(last):
+        return empty, empty, empty
+
+    ts_windows = sliding_window_view(timestamps, n)
+    price_windows = sliding_window_view(prices, n)
+    predicted = np.empty(len(last))
+    for lo in range(0, len(last), FAST_CHUNK_ROWS):
+        rows = last[lo:lo + FAST_CHUNK_ROWS] - (n - 1)
+        predicted[lo:lo + FAST_CHUNK_ROWS] = _predict_block(
+            ts_windows[rows], price_windows[rows], horizon, savgol_window, polyorder, decay
+        )
+
+    targets = timestamps[last] + horizon * 1000
+    match = _match_indices(timestamps, targets, match_window_ms)
+    actual = np.where(match >= 0, prices[match], np.nan)
+    return prices[last], predicted, actual
+
+
+def online_backtest(timestamps, prices, kind, interval=PREDICTION_INTERVAL, horizon=PREDICTION_HORIZON,
+                    min_ticks=PREDICTION_MIN_TICKS, match_window_ms=MATCH_WINDOW_MS):
+    """
+    Evalúa el modelo online `kind` cada `interval` segundos: absorbe los
+    ticks hasta cada instante con update_many y predice desde su estado.
+    Mismo resultado que fast_backtest: (base, predicho, real).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    empty = np.empty(0)
+    if not len(timestamps):
+        return empty, empty, empty
+
+    step = int(interval * 1000)
+    times = np.arange(timestamps[0] + step, timestamps[-1] + 1, step)
+    ends = np.unique(np.searchsorted(timestamps, times, side='right'))
+    model = MODEL_TYPES[kind]()
+    ts_list, price_list = timestamps.tolist(), prices.tolist()
+    last, predicted = [], []
+    start = 0
+    for end in ends.tolist():
+        model.update_many(ts_list[start:end], price_list[start:end])
+        start = end
+        if model.count >= min_ticks:
+            last.append(end - 1)
+            predicted.append(model.forecast([horizon])[0][0])
+    if not last:
+        return empty, empty, empty
+
+    last = np.array(last)
+    targets = timestamps[last] + horizon * 1000
+    match = _match_indices(timestamps, targets, match_window_ms)
+    actual = np.where(match >= 0, prices[match], np.nan)
+    return prices[last], np.array(predicted), actual
+
+
+def replay_backtest(timestamps, prices, symbol, interval=PREDICTION_INTERVAL, horizon=PREDICTION_HORIZON,
+                    window_size=PREDICTION_WINDOW_TICKS, min_ticks=PREDICTION_MIN_TICKS,
+                    savgol_window=SAVGOL_WINDOW, polyorder=SAVGOL_POLYORDER, decay=WEIGHT_DECAY, poll_ms=1000,
+                    predictor='batch', alerts=None):
+    """
+    Reproduce la serie por la ruta real DataBuffer → predictor →
+    PredictionBuffer y AlertEngine, en lotes de `poll_ms` de tiempo
+    simulado (como el scheduler), lo más rápido posible. `predictor` es
+    'batch' o un modelo online ('rls', 'kalman'); `alerts` es el motor de
+    alertas (uno nuevo con las reglas por defecto si no se pasa). Devuelve
+    (base, predicho, real, segundos en predecir, eventos de alerta).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    symbol = symbol.upper()
+    buffer = DataBuffer(maxlen=max(window_size, 1000))
+    # Sin límite ni expiración: al final se leen todas las predicciones hechas
+    predictions = PredictionBuffer(maxlen=len(timestamps) + 1)
+    if predictor == 'batch':
+        predictor = BatchPredictor(profiles={symbol: {
+            'window_size': window_size, 'min_ticks': min_ticks,
+            'savgol_window': savgol_window, 'polyorder': polyorder, 'decay': decay
+        }})
+    else:
+        predictor = OnlinePredictor(buffer.models, predictor, min_ticks)
+    if alerts is None:
+        alerts = AlertEngine()
+
+    base = []
+    events = []
+    predict_time = 0.0
+    last_prediction = None
+    if not len(timestamps):
+        return np.empty(0), np.empty(0), np.empty(0), predict_time, events
+
+    # Fin de cada lote de poll_ms en tiempo simulado
+    polls = np.arange(timestamps[0], timestamps[-1] + poll_ms, poll_ms)
+    bounds = np.searchsorted(timestamps, polls, side='right')
+    next_prediction = timestamps[0] + interval * 1000
+    start = 0
+    for end in bounds:
+        if end > start:
+            buffer.add_ticks(symbol, timestamps[start:end].tolist(), prices[start:end].tolist())
+            # Como Scheduler.on_ticks: emparejar con todos los ticks del lote
+            # y evaluar las alertas con los últimos ALERT_MAX_TICKS
+            predictions.match_actual_prices(symbol, timestamps[start:end], prices[start:end])
+            alert_start = max(start, end - ALERT_MAX_TICKS)
+            events.extend(alerts.on_ticks(
+                symbol, timestamps[alert_start:end].tolist(), prices[alert_start:end].tolist(),
+                buffer.get_indicators(symbol), last_prediction
+            ))
+            start = end
+            tick = buffer.get_last_tick(symbol)
+            if tick['timestamp'] >= next_prediction:
+                window = buffer.get_window(symbol, predictor.window_for(symbol))
+                t0 = time.perf_counter()
+                future_price = predictor.predict([window], horizon, [symbol])[0]
+                predict_time += time.perf_counter() - t0
+                next_prediction += ((tick['timestamp'] - next_prediction) // (interval * 1000) + 1) * interval * 1000
+                if not np.isnan(future_price):
+                    target = tick['timestamp'] + horizon * 1000
+                    predictions.add_prediction(target, float(future_price), symbol)
+                    base.append(tick['price'])
+                    last_prediction = float(future_price)
+
+    entries = predictions.get_predictions(symbol)
+    predicted = np.array([e['predicted_price'] for e in entries])
+    actual = np.array([np.nan if e['actual_price'] is None else e['actual_price'] for e in entries])
+    return np.array(base), predicted, actual, predict_time, events
+
+
+def _alert_report(events):
+    """Alertas de un símbolo en el replay: activaciones por regla e instantes (ms) en que saltaron"""
+    triggered = [e for e in events if e['kind'] == 'triggered']
+    by_rule = {}
+    for event in triggered:
+        by_rule[event['rule']] = by_rule.get(event['rule'], 0) + 1
+    return {
+        'alerts': len(triggered),
+        'alerts_by_rule': by_rule,
+        'alert_times': [e['timestamp'] for e in triggered]
+    }
+
+
+def run_backtest(data, mode='fast', predictor='batch', **params):
+    """
+    Backtest de varios símbolos {symbol: (timestamps, prices)} con el
+    predictor 'batch' o un modelo online; una fila de métricas por símbolo.
+    """
+    results = []
+    for symbol, (timestamps, prices) in data.items():
+        t0 = time.perf_counter()
+        events = None
+        if mode == 'replay':
+            base, predicted, actual, elapsed, events = replay_backtest(timestamps, prices, symbol,
+                                                                       predictor=predictor, **params)
+        elif predictor == 'batch':
+            base, predicted, actual = fast_backtest(timestamps, prices, **params)
+            elapsed = time.perf_counter() - t0
+        else:
+            online = {k: v for k, v in params.items() if k in ('interval', 'horizon', 'min_ticks')}
+            base, predicted, actual = online_backtest(timestamps, prices, predictor, **online)
+            elapsed = time.perf_counter() - t0
+        result = _report(symbol, base, predicted, actual, elapsed)
+        result['predictor'] = predictor
+        if events is not None:
+            result.update(_alert_report(events))
+        result['ticks'] = len(timestamps)
+        result['wall_s'] = time.perf_counter() - t0
+        results.append(result)
+        if DEBUG:
+            print(json.dumps(result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest del predictor sobre ticks grabados o sintéticos")
+    parser.add_argument('--symbols', nargs='*', default=TOP_SYMBOLS)
+    parser.add_argument('--mode', choices=['fast', 'replay'], default='fast')
+    parser.add_argument('--predictor', nargs='+', choices=['batch', *MODEL_TYPES], default=['batch'],
+                        help="Predictores a comparar sobre los mismos ticks")
+    parser.add_argument('--synthetic-hours', type=float, help="Usar ticks sintéticos en vez de DATA_DIR")
+    parser.add_argument('--since', type=int, help="Inicio en ms (ticks grabados)")
+    parser.add_argument('--until', type=int, help="Fin en ms (ticks grabados)")
+    parser.add_argument('--interval', type=float, default=PREDICTION_INTERVAL)
+    parser.add_argument('--horizon', type=int, default=PREDICTION_HORIZON)
+    parser.add_argument('--window', type=int, default=PREDICTION_WINDOW_TICKS)
+    parser.add_argument('--output', help="Fichero JSON de resultados")
+    args = parser.parse_args()
+
+    if args.synthetic_hours:
+        data = synthetic_ticks(args.symbols, args.synthetic_hours)
+    else:
+        from tick_store import TickStore
+        data = load_ticks(TickStore(), args.symbols, args.since, args.until)
+
+    results = []
+    for predictor in args.predictor:
+        results.extend(run_backtest(data, args.mode, predictor, interval=args.interval, horizon=args.horizon,
+                                    window_size=args.window))
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
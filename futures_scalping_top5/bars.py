@@ -0,0 +1,254 @@
+# bars.py
+
+import threading
+import time
+
+import numpy as np
+
+from config import BAR_INTERVALS, BAR_TICKS, VOLUME_BAR_SIZES, BAR_CAPACITY
+from ring_buffer import TickWindow
+
+BAR_DTYPE = np.dtype([
+    ('time', '<i8'),         # Apertura: inicio del intervalo (barras de tiempo) o primer trade
+    ('close_time', '<i8'),   # Último trade de la barra
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+    ('trades', '<i8')
+])
+
+# Por debajo de este tamaño de lote el bucle escalar es más barato que NumPy
+VECTOR_MIN_BATCH = 16
+
+
+class BarSeries:
+    """
+    Barras OHLCV de un símbolo que se construyen incrementalmente.
+
+    Cada trade se asigna a la barra floor(reloj / size), donde el reloj es
+    el timestamp (barras de tiempo), el nº de trades previos (barras de N
+    trades) o el volumen acumulado previo (barras de volumen). La barra
+    abierta vive en escalares de Python (actualizarla cuesta O(1)); las
+    cerradas se escriben en un ring columnar de tamaño fijo con doble
+    escritura, como TickRing, para leer las últimas como un slice contiguo.
+
+    `version` es un seqlock (impar durante una actualización), así que
+    los lectores copian sin bloquear al escritor.
+    """
+
+    KINDS = ('time', 'tick', 'volume')
+
+    def __init__(self, kind, size, capacity=BAR_CAPACITY):
+        if kind not in self.KINDS:
+            raise ValueError(f"Tipo de barra desconocido: {kind}")
+        self.kind = kind
+        self.by_time = kind == 'time'
+        self.size = size
+        self.capacity = int(capacity)
+        self.records = np.zeros(2 * self.capacity, dtype=BAR_DTYPE)
+        self.closed = 0       # Barras cerradas escritas en el ring
+        self.bar = None       # Barra abierta: [key, time, close_time, open, high, low, close, volume, trades]
+        self.clock = 0        # Trades o volumen acumulados (barras de N trades / volumen)
+        self.version = 0
+
+    def __len__(self):
+        return min(self.closed, self.capacity) + (self.bar is not None)
+
+    def update(self, timestamp, price, qty=0.0):
+        """Añade un trade en O(1)"""
+        qty = qty or 0.0
+        if self.by_time:
+            key = timestamp // self.size
+        else:
+            key = int(self.clock // self.size)
+            self.clock += qty if self.kind == 'volume' else 1
+
+        bar = self.bar
+        if bar is not None and bar[0] == key:
+            # Caso habitual: el trade cae en la barra abierta
+            self.version += 1
+            if price > bar[4]:
+                bar[4] = price
+            elif price < bar[5]:
+                bar[5] = price
+            bar[2] = timestamp
+            bar[6] = price
+            bar[7] += qty
+            bar[8] += 1
+            self.version += 1
+            return
+
+        self.version += 1
+        if bar is not None:
+            self._write_bar(bar)
+        start = key * self.size if self.by_time else timestamp
+        self.bar = [key, start, timestamp, price, price, price, price, qty, 1]
+        self.version += 1
+
+    def update_many(self, timestamps, prices, qtys=None):
+        """Añade un lote de trades en orden; agrega cada barra con reduceat"""
+        n = len(timestamps)
+        if n < VECTOR_MIN_BATCH:
+            for i in range(n):
+                self.update(timestamps[i], prices[i], 0.0 if qtys is None else qtys[i])
+            return
+
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        qtys = np.zeros(n) if qtys is None else np.asarray(qtys, dtype=np.float64)
+        if self.kind == 'time':
+            keys = timestamps // self.size
+        elif self.kind == 'tick':
+            keys = (self.clock + np.arange(n)) // self.size
+            self.clock += n
+        else:
+            before = self.clock + np.concatenate(([0.0], np.cumsum(qtys)[:-1]))
+            keys = (before // self.size).astype(np.int64)
+            self.clock += float(qtys.sum())
+
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], n] - 1
+        segments = np.empty(len(starts), dtype=BAR_DTYPE)
+        segments['time'] = keys[starts] * self.size if self.kind == 'time' else timestamps[starts]
+        segments['close_time'] = timestamps[ends]
+        segments['open'] = prices[starts]
+        segments['high'] = np.maximum.reduceat(prices, starts)
+        segments['low'] = np.minimum.reduceat(prices, starts)
+        segments['close'] = prices[ends]
+        segments['volume'] = np.add.reduceat(qtys, starts)
+        segments['trades'] = ends - starts + 1
+
+        self.version += 1
+        bar = self.bar
+        if bar is not None:
+            if bar[0] == keys[0]:
+                # El primer tramo continúa la barra abierta
+                first = segments[0]
+                first['time'] = bar[1]
+                first['open'] = bar[3]
+                first['high'] = max(bar[4], first['high'])
+                first['low'] = min(bar[5], first['low'])
+                first['volume'] += bar[7]
+                first['trades'] += bar[8]
+            else:
+                self._write_bar(bar)
+        self._write(segments[:-1])
+        last = segments[-1]
+        self.bar = [int(keys[-1]), int(last['time']), int(last['close_time']), float(last['open']),
+                    float(last['high']), float(last['low']), float(last['close']),
+                    float(last['volume']), int(last['trades'])]
+        self.version += 1
+
+    def _write_bar(self, bar):
+        """Escribe en el ring la barra abierta al cerrarse"""
+        record = tuple(bar[1:])
+        start = self.closed % self.capacity
+        self.records[start] = record
+        self.records[start + self.capacity] = record
+        self.closed += 1
+
+    def _write(self, records):
+        """Escribe barras cerradas en el ring (doble escritura)"""
+        n = len(records)
+        if n == 0:
+            return
+        if n > self.capacity:
+            self.closed += n - self.capacity
+            records = records[-self.capacity:]
+            n = self.capacity
+        start = self.closed % self.capacity
+        first = min(n, self.capacity - start)
+        self.records[start:start + first] = records[:first]
+        self.records[start + self.capacity:start + self.capacity + first] = records[:first]
+        if first < n:
+            self.records[:n - first] = records[first:]
+            self.records[self.capacity:self.capacity + n - first] = records[first:]
+        self.closed += n
+
+    def _read(self, count, include_open):
+        bars = []
+        if include_open and self.bar is not None:
+            bars = [tuple(self.bar[1:])]
+        size = min(self.closed, self.capacity)
+        if count is not None:
+            size = min(size, max(count - len(bars), 0))
+        end = (self.closed - 1) % self.capacity + self.capacity + 1 if self.closed else 0
+        closed = self.records[end - size:end]
+        if not bars:
+            return closed.copy()
+        return np.concatenate((closed, np.array(bars, dtype=BAR_DTYPE)))
+
+    def window(self, count=None, include_open=True, retries=100):
+        """
+        Copia de las últimas `count` barras (todas si es None) como array
+        estructurado BAR_DTYPE, con la barra abierta al final si se pide.
+        """
+        for _ in range(retries):
+            version = self.version
+            if version % 2 == 0:
+                bars = self._read(count, include_open)
+                if self.version == version:
+                    return bars
+            time.sleep(0)
+        raise RuntimeError("BarSeries.window: el escritor no dejó leer un estado consistente")
+
+
+class BarEngine:
+    """
+    Series de barras de todos los símbolos, alimentadas por DataBuffer con
+    cada tick aceptado: barras de tiempo (BAR_INTERVALS), de BAR_TICKS
+    trades y de volumen (VOLUME_BAR_SIZES, sólo símbolos configurados).
+
+    Cada lote de la ingesta se agrega al llegar (update_many, vectorizado
+    en lotes grandes), así que los lectores nunca toman `lock` ni hacen
+    trabajo de escritura: sólo copian con el seqlock de cada BarSeries.
+    """
+
+    def __init__(self, intervals=None, ticks=BAR_TICKS, volume_sizes=None, capacity=BAR_CAPACITY):
+        self.intervals = BAR_INTERVALS if intervals is None else intervals
+        self.ticks = ticks
+        self.volume_sizes = VOLUME_BAR_SIZES if volume_sizes is None else volume_sizes
+        self.capacity = capacity
+        self.symbols = {}
+        self.lock = threading.Lock()  # Sólo para escritores
+
+    def _series(self, symbol_key):
+        series = self.symbols.get(symbol_key)
+        if series is None:
+            series = {name: BarSeries('time', ms, self.capacity) for name, ms in self.intervals.items()}
+            if self.ticks:
+                series[f"{self.ticks}t"] = BarSeries('tick', self.ticks, self.capacity)
+            if symbol_key in self.volume_sizes:
+                series['volume'] = BarSeries('volume', self.volume_sizes[symbol_key], self.capacity)
+            self.symbols[symbol_key] = series
+        return series
+
+    def update(self, symbol, timestamp, price, qty=0.0):
+        with self.lock:
+            for bars in self._series(symbol.upper()).values():
+                bars.update(timestamp, price, qty)
+
+    def update_many(self, symbol, timestamps, prices, qtys=None):
+        if not len(timestamps):
+            return
+        with self.lock:
+            for bars in self._series(symbol.upper()).values():
+                bars.update_many(timestamps, prices, qtys)
+
+    def kinds(self, symbol):
+        series = self.symbols.get(symbol.upper())
+        return list(series) if series is not None else []
+
+    def get(self, symbol, name, count=None, include_open=True):
+        """Últimas barras `name` del símbolo o None si no existen"""
+        series = self.symbols.get(symbol.upper(), {}).get(name)
+        if series is None:
+            return None
+        return series.window(count, include_open)
+
+
+def bars_window(bars):
+    """Barras como TickWindow (cierre en su último trade) para el predictor"""
+    return TickWindow(np.ascontiguousarray(bars['close_time']), np.ascontiguousarray(bars['close']))
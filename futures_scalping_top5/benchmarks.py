@@ -0,0 +1,516 @@
+# benchmarks.py
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from data_buffer import DataBuffer
+from metrics import Histogram
+
+# Tiempo mínimo de medida por caso en los microbenchmarks (s)
+MIN_TIME = 0.5
+
+
+def _synthetic_ticks(n, start_ms=1_700_000_000_000, start_price=3000.0, seed=0):
+    """Genera n ticks sintéticos (paseo aleatorio) como arrays"""
+    rng = np.random.default_rng(seed)
+    timestamps = start_ms + np.cumsum(rng.integers(0, 20, n))
+    prices = start_price * np.exp(np.cumsum(rng.normal(0, 1e-4, n)))
+    return timestamps, prices
+
+
+def _time_calls(fn, min_time=MIN_TIME, max_calls=1_000_000):
+    """
+    Llama a fn() repetidamente durante al menos `min_time` segundos y
+    devuelve la latencia por llamada en µs (media y percentiles).
+    """
+    fn()  # Calentamiento (cachés, compilación de rutas de NumPy)
+    durations = []
+    deadline = time.perf_counter() + min_time
+    while len(durations) < max_calls:
+        t0 = time.perf_counter()
+        fn()
+        t1 = time.perf_counter()
+        durations.append(t1 - t0)
+        if t1 >= deadline:
+            break
+    us = np.array(durations) * 1e6
+    return {
+        'calls': len(us),
+        'mean_us': float(us.mean()),
+        'p50_us': float(np.percentile(us, 50)),
+        'p99_us': float(np.percentile(us, 99))
+    }
+
+
+def _window(n, seed=0):
+    from ring_buffer import TickWindow
+    timestamps, prices = _synthetic_ticks(n, seed=seed)
+    return TickWindow(timestamps, prices)
+
+
+def bench_ingest_contention(duration=3.0, readers=4, poll_interval=0.001, maxlen=100_000,
+                            read_ticks=200, symbol='ETHUSDT'):
+    """
+    Mide la ingesta sostenida de un escritor (add_tick) mientras `readers`
+    hilos leen snapshots, vistas, indicadores y get_buffer cada
+    `poll_interval` segundos (0 = sin pausa, el peor caso para el GIL).
+    """
+    buffer = DataBuffer(maxlen=maxlen)
+    timestamps, prices = _synthetic_ticks(1_000_000)
+    ticks = [{'timestamp': int(t), 'price': float(p)} for t, p in zip(timestamps, prices)]
+    stop = threading.Event()
+    reads = [0] * readers
+    read_latency = [Histogram() for _ in range(readers)]
+    written = [0]
+
+    def writer():
+        i = 0
+        n = len(ticks)
+        while not stop.is_set():
+            buffer.add_tick(symbol, ticks[i % n])
+            i += 1
+        written[0] = i
+
+    def reader(k):
+        count = 0
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            buffer.get_snapshot(symbol, read_ticks)
+            buffer.get_window(symbol, read_ticks)
+            buffer.get_indicators(symbol)
+            buffer.get_buffer(symbol, read_ticks)
+            read_latency[k].record(time.perf_counter() - t0)
+            count += 1
+            if poll_interval:
+                time.sleep(poll_interval)
+        reads[k] = count
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader, args=(k,)) for k in range(readers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latency = Histogram()
+    for histogram in read_latency:
+        for i, n in enumerate(histogram.counts):
+            latency.counts[i] += n
+        latency.count += histogram.count
+
+    return {
+        'name': 'ingest_contention',
+        'readers': readers,
+        'poll_interval_s': poll_interval,
+        'duration_s': elapsed,
+        'ticks': written[0],
+        'ticks_per_s': written[0] / elapsed,
+        'reads_per_s': sum(reads) / elapsed,
+        'read_p50_us': (latency.quantile(0.5) or 0) * 1e6,
+        'read_p99_us': (latency.quantile(0.99) or 0) * 1e6,
+        'sequence': buffer.get_sequence(symbol)
+    }
+
+
+def bench_predictor(sizes=(100, 200, 500, 1000, 5000), symbol_counts=(1, 5, 20)):
+    """
+    predict_future_price por tamaño de la serie de entrada (usa como mucho
+    PREDICTION_WINDOW_TICKS ticks) y BatchPredictor.predict_curve por tamaño
+    de ventana y número de símbolos apilados. Después, los modelos online:
+    actualización por tick y predicción desde su estado.
+    """
+    from predictor import BatchPredictor, predict_future_price
+    results = []
+    for n in sizes:
+        window = _window(n)
+        results.append(dict(name='predict_future_price', size=n,
+                            **_time_calls(lambda: predict_future_price(window, 60))))
+    for n in sizes:
+        predictor = BatchPredictor(window_size=n, min_ticks=min(n, 100))
+        for count in symbol_counts:
+            windows = [_window(n, seed=k) for k in range(count)]
+            results.append(dict(name='predict_curve', size=n, symbols=count,
+                                **_time_calls(lambda: predictor.predict_curve(windows))))
+
+    # Modelos online: coste por tick de la actualización y predicción desde el estado
+    from online_predictor import MODEL_TYPES, OnlineModels, OnlinePredictor
+    timestamps, prices = _synthetic_ticks(100_000)
+    timestamps, prices = timestamps.tolist(), prices.tolist()
+    for kind, model_type in MODEL_TYPES.items():
+        model = model_type()
+        t0 = time.perf_counter()
+        model.update_many(timestamps, prices)
+        elapsed = time.perf_counter() - t0
+        results.append({'name': 'online_update', 'kind': kind, 'size': len(prices),
+                        'mean_us': elapsed / len(prices) * 1e6, 'ticks_per_s': len(prices) / elapsed})
+    for count in symbol_counts:
+        symbols = [f"SYM{k}" for k in range(count)]
+        models = OnlineModels()
+        for symbol in symbols:
+            models.update_many(symbol, timestamps[:1000], prices[:1000])
+        windows = [_window(1, seed=k) for k in range(count)]
+        for kind in models.kinds:
+            predictor = OnlinePredictor(models, kind)
+            results.append(dict(name='online_predict_curve', kind=kind, symbols=count,
+                                **_time_calls(lambda: predictor.predict_curve(windows, symbols=symbols))))
+    return results
+
+
+def bench_indicators(sizes=(100, 1_000, 10_000, 100_000)):
+    """calculate_rsi y calculate_bollinger_bands sobre series completas, y el motor incremental por tick"""
+    from indicators import calculate_rsi, calculate_bollinger_bands
+    from streaming_indicators import IndicatorEngine
+    results = []
+    for n in sizes:
+        prices = _window(n).price
+        results.append(dict(name='calculate_rsi', size=n, **_time_calls(lambda: calculate_rsi(prices))))
+        results.append(dict(name='calculate_bollinger_bands', size=n,
+                            **_time_calls(lambda: calculate_bollinger_bands(prices))))
+
+    engine = IndicatorEngine()
+    timestamps, prices = _synthetic_ticks(100_000)
+    timestamps, prices = timestamps.tolist(), prices.tolist()
+    t0 = time.perf_counter()
+    for ts, price in zip(timestamps, prices):
+        engine.update('ETHUSDT', ts, price)
+    elapsed = time.perf_counter() - t0
+    results.append({'name': 'indicator_engine_update', 'size': len(prices),
+                    'mean_us': elapsed / len(prices) * 1e6, 'ticks_per_s': len(prices) / elapsed})
+    return results
+
+
+def bench_match(pending_sizes=(10, 100, 1_000, 10_000)):
+    """
+    PredictionBuffer.match_actual_price con `pending` predicciones
+    pendientes: cada tick avanza 10 ms y resuelve las que vencen.
+    """
+    from prediction_buffer import PredictionBuffer
+    results = []
+    for pending in pending_sizes:
+        predictions = PredictionBuffer(maxlen=pending * 4)
+        start = 1_700_000_000_000
+        # Objetivos repartidos en los próximos `pending` segundos
+        for i in range(pending):
+            predictions.add_prediction(start + i * 1000, 100.0, 'ETHUSDT')
+        clock = [start]
+
+        def match():
+            clock[0] += 10
+            predictions.match_actual_price({'symbol': 'ETHUSDT', 'timestamp': clock[0], 'price': 100.0})
+
+        results.append(dict(name='match_actual_price', pending=pending,
+                            **_time_calls(match, max_calls=pending * 100)))
+    return results
+
+
+def bench_book(levels=(100, 1_000), changes=(10, 50), events=5_000):
+    """
+    OrderBook: aplicar diffs de profundidad sintéticos (`changes` niveles
+    por lado sobre un libro de `levels` niveles) y leer sus features y
+    sus mejores niveles mientras tanto.
+    """
+    from fake_binance import synthetic_depth
+    from order_book import OrderBook
+    results = []
+    for depth in levels:
+        for count in changes:
+            snapshots, diffs = synthetic_depth(['BTCUSDT'], events, levels=depth, changes=count)
+            book = OrderBook('BTCUSDT', capacity=2 * depth)
+            book.load_snapshot(snapshots['BTCUSDT'])
+            t0 = time.perf_counter()
+            for event in diffs:
+                book.on_event(event)
+            elapsed = time.perf_counter() - t0
+            results.append({'name': 'book_apply', 'levels': depth, 'changes': count,
+                            'mean_us': elapsed / len(diffs) * 1e6, 'events_per_s': len(diffs) / elapsed,
+                            'gaps': book.gaps})
+            results.append(dict(name='book_features', levels=depth, **_time_calls(lambda: book.features)))
+            results.append(dict(name='book_snapshot', levels=depth, **_time_calls(lambda: book.snapshot(20))))
+    return results
+
+
+def bench_plot(sizes=(1_000, 10_000, 100_000), predictions=200):
+    """plot_price_and_prediction con `size` ticks en la ventana de historial y sus predicciones"""
+    from prediction_buffer import PredictionBuffer
+    from visualizations import plot_price_and_prediction
+    from config import PLOT_HISTORY_SECONDS, PREDICTION_HORIZONS
+    results = []
+    for n in sizes:
+        window = _window(n)
+        # Comprimir los ticks en la ventana de historial del gráfico
+        span = int(window.timestamp[-1] - window.timestamp[0]) or 1
+        window.timestamp = window.timestamp[0] + (window.timestamp - window.timestamp[0]) * (
+            PLOT_HISTORY_SECONDS * 1000 // span)
+        buffer = PredictionBuffer(maxlen=predictions * len(PREDICTION_HORIZONS))
+        step = max(n // predictions, 1)
+        for i in range(0, n, step):
+            made_at = int(window.timestamp[i])
+            prices = np.full(len(PREDICTION_HORIZONS), window.price[i])
+            buffer.add_curve('ETHUSDT', made_at, PREDICTION_HORIZONS, prices, prices * 1e-4)
+        entries = buffer.get_predictions('ETHUSDT')
+        curve = buffer.get_curve('ETHUSDT')
+        results.append(dict(name='plot_price_and_prediction', size=n, predictions=len(entries),
+                            **_time_calls(lambda: plot_price_and_prediction(window, entries, curve=curve),
+                                          min_time=2 * MIN_TIME)))
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def bench_ticks_endpoint(sizes=(200, 2_000, 20_000), requests=200, modes=('miss', 'hit', 'not_modified')):
+    """
+    GET /ticks contra un servidor uvicorn real (un cliente con keep-alive),
+    por nº de ticks devueltos, formato y uso de la caché de respuestas:
+    'miss' (se codifica en cada petición), 'hit' (cuerpo ya codificado) y
+    'not_modified' (If-None-Match con el ETag vigente, 304 sin cuerpo).
+    """
+    import httpx
+    import uvicorn
+    from rest_api import app, data_buffer
+    from response_cache import response_cache
+    from tick_codecs import available_types
+
+    timestamps, prices = _synthetic_ticks(max(sizes))
+    data_buffer.add_ticks('BENCHUSDT', timestamps.tolist(), prices.tolist())
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    results = []
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            for media_type, n, mode in itertools.product(available_types(), sizes, modes):
+                headers = {'Accept': media_type}
+                expected = 304 if mode == 'not_modified' else 200
+                if mode == 'not_modified':
+                    etag = client.get('/ticks/BENCHUSDT', params={'max_ticks': n}, headers=headers).headers['ETag']
+                    headers['If-None-Match'] = etag
+
+                def fetch():
+                    if mode == 'miss':
+                        response_cache.clear()
+                    response = client.get('/ticks/BENCHUSDT', params={'max_ticks': n}, headers=headers)
+                    if response.status_code != expected:
+                        raise RuntimeError(f"GET /ticks: {response.status_code}, se esperaba {expected}")
+                stats = _time_calls(fetch, max_calls=requests)
+                results.append(dict(name='ticks_endpoint', format=media_type, size=n, cache=mode,
+                                    requests_per_s=1e6 / stats['mean_us'], **stats))
+    finally:
+        server.should_exit = True
+        thread.join(5)
+    return results
+
+
+def bench_load(rates=(1_000, 5_000, 20_000), duration=5.0, symbols=('ethusdt', 'btcusdt', 'bnbusdt')):
+    """
+    Prueba de carga de extremo a extremo: un servidor local con el formato
+    del stream combinado de Binance empuja `rate` trades/s a BinanceWSClient,
+    que los añade a un DataBuffer. Se muestrea cada 50 ms el retraso entre
+    lo enviado y lo ingerido. Servidor y cliente comparten proceso (y GIL),
+    así que el ritmo máximo medido es una cota inferior.
+    """
+    from fake_binance import FakeBinanceServer, synthetic_trades
+    from ws_client import BinanceWSClient
+    results = []
+    for rate in rates:
+        n = int(rate * duration / len(symbols))
+        server = FakeBinanceServer(synthetic_trades(symbols, n), rate=rate)
+        server.start()
+        buffer = DataBuffer()
+        client = BinanceWSClient(symbols=list(symbols), url_base=server.url, on_batch=buffer.add_ticks)
+        total = n * len(symbols)
+        lags = []
+        t0 = time.perf_counter()
+        client.start()
+        deadline = t0 + duration * 3 + 5
+        ingested = 0
+        while time.perf_counter() < deadline:
+            time.sleep(0.05)
+            ingested = sum(buffer.get_sequence(s) for s in symbols)
+            lags.append(server.sent - ingested)
+            if ingested >= total:
+                break
+        elapsed = time.perf_counter() - t0
+        client.stop()
+        server.stop()
+        lags = np.array(lags or [0])
+        results.append({
+            'name': 'load',
+            'rate': rate,
+            'symbols': len(symbols),
+            'trades': total,
+            'ingested': ingested,
+            'duration_s': elapsed,
+            'ticks_per_s': ingested / elapsed,
+            'lag_p50_ms': float(np.percentile(lags, 50)) / rate * 1000,
+            'lag_max_ms': float(lags.max()) / rate * 1000
+        })
+    return results
+
+
+# Módulos de arranque y dependencias pesadas que no deben cargar al importarlos
+IMPORT_GUARDS = {
+    'data_buffer': ('scipy', 'plotly', 'streamlit', 'fastapi', 'uvicorn'),
+    'ws_client': ('scipy', 'plotly', 'streamlit', 'fastapi', 'uvicorn'),
+    'sharded_ingest': ('scipy', 'plotly', 'streamlit', 'fastapi', 'uvicorn'),
+    'service': ('scipy', 'plotly', 'streamlit', 'fastapi', 'uvicorn'),
+    'scheduler': ('scipy', 'plotly', 'streamlit', 'fastapi', 'uvicorn'),
+    'rest_api': ('scipy', 'plotly', 'streamlit', 'uvicorn'),
+}
+# Presupuesto de arranque en frío por módulo: (ms de importación, MB de RSS máxima)
+IMPORT_BUDGETS = {
+    'data_buffer': (200, 48),
+    'ws_client': (250, 56),
+    'sharded_ingest': (200, 48),
+    'service': (200, 48),
+    'scheduler': (200, 48),
+    'rest_api': (900, 80),
+}
+_IMPORT_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'import_s': elapsed, 'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def bench_imports(modules=tuple(IMPORT_GUARDS), runs=5, budgets=IMPORT_BUDGETS):
+    """
+    Arranque en frío de cada punto de entrada: tiempo de importación y
+    memoria máxima en un intérprete nuevo (mejor de `runs`). Falla si
+    el módulo carga alguna de sus dependencias pesadas prohibidas o si
+    supera su presupuesto de tiempo o de memoria (`budgets`).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in modules:
+        heavy = IMPORT_GUARDS.get(module, ())
+        probe = _IMPORT_PROBE.format(module=module, heavy=heavy)
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', probe], cwd=here, capture_output=True, text=True,
+                                    check=True).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        loaded = samples[0]['loaded']
+        if loaded:
+            raise RuntimeError(f"import {module} carga dependencias pesadas: {', '.join(loaded)}")
+        result = {
+            'name': 'imports',
+            'module': module,
+            'import_ms': 1000 * min(s['import_s'] for s in samples),
+            'rss_mb': min(s['rss_kb'] for s in samples) / 1024
+        }
+        budget = budgets.get(module)
+        if budget is not None:
+            max_ms, max_mb = budget
+            if result['import_ms'] > max_ms:
+                raise RuntimeError(f"import {module} tarda {result['import_ms']:.0f} ms (presupuesto {max_ms} ms)")
+            if result['rss_mb'] > max_mb:
+                raise RuntimeError(f"import {module} usa {result['rss_mb']:.1f} MB (presupuesto {max_mb} MB)")
+        results.append(result)
+    return results
+
+
+BENCHMARKS = {
+    'imports': bench_imports,
+    'contention': bench_ingest_contention,
+    'predictor': bench_predictor,
+    'indicators': bench_indicators,
+    'match': bench_match,
+    'book': bench_book,
+    'plot': bench_plot,
+    'ticks': bench_ticks_endpoint,
+    'load': bench_load,
+}
+
+# Métricas comparables entre ejecuciones (el resto de campos identifican el caso)
+METRIC_SUFFIXES = ('_us', '_per_s', '_ms', '_s', '_mb')
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'time': time.time(),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+def _case_key(result):
+    return json.dumps({k: v for k, v in result.items() if k != 'calls' and not k.endswith(METRIC_SUFFIXES)},
+                      sort_keys=True)
+
+
+def compare(baseline, results):
+    """Cociente nuevo/base de cada métrica de los casos presentes en ambas ejecuciones"""
+    base = {_case_key(r): r for r in baseline}
+    rows = []
+    for result in results:
+        old = base.get(_case_key(result))
+        if old is None:
+            continue
+        ratios = {
+            k: v / old[k] for k, v in result.items()
+            if k.endswith(METRIC_SUFFIXES) and isinstance(v, (int, float)) and old.get(k)
+        }
+        rows.append(dict(json.loads(_case_key(result)), ratio=ratios))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de las rutas críticas")
+    parser.add_argument('names', nargs='*', default=list(BENCHMARKS), help="Benchmarks a ejecutar")
+    parser.add_argument('--output', help="Fichero JSON de resultados")
+    parser.add_argument('--compare', help="JSON de una ejecución anterior: imprime los cocientes nuevo/base")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.names:
+        result = BENCHMARKS[name]()
+        for row in result if isinstance(result, list) else [result]:
+            print(json.dumps(row))
+            results.append(row)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': _environment(), 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for row in compare(baseline['results'], results):
+            print(json.dumps(row))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,23 @@
 
 # Parámetros Binance y datos
 TOP_SYMBOLS = ["ETHUSDT", "BTCUSDT", "BNBUSDT", "XRPUSDT", "ADAUSDT"]
-BUFFER_MAXLEN = 1000
+BUFFER_MAXLEN = 100_000       # Ticks en memoria por símbolo (cubre PLOT_HISTORY_SECONDS)
 WS_RECONNECT_INTERVAL = 5
+WS_MAX_BACKOFF = 60         # Espera máxima entre reconexiones (s)
+WS_MAX_BATCH = 500          # Mensajes WS máximos por lote de ingesta
 API_PORT = 8000
+BINANCE_WS_URL = "wss://fstream.binance.com"
+WS_SHARDS = 1               # Conexiones WS entre las que se reparten los símbolos
+WS_SHARD_PROCESSES = False  # Ejecutar cada shard en su propio proceso
+
+# Libro de órdenes (stream de profundidad, opcional)
+DEPTH_ENABLED = False       # Suscribirse a <symbol>@depth@100ms y mantener el libro L2
+BINANCE_DEPTH_URL = "https://fapi.binance.com/fapi/v1/"  # REST del snapshot de resincronización (/depth)
+DEPTH_SNAPSHOT_LIMIT = 1000  # Niveles por lado del snapshot
+DEPTH_MAX_LEVELS = 5000     # Niveles por lado en memoria (se descartan los más alejados)
+DEPTH_BUFFER_EVENTS = 1000  # Diffs retenidos por símbolo mientras llega el snapshot
+BOOK_FEATURE_LEVELS = 5     # Niveles del desequilibrio top-N
+BOOK_ANCHOR_PREDICTIONS = False  # Desplazar la curva al microprecio del libro en vez del último trade
 
 # Predicción
 PREDICTION_WINDOW_SECONDS = 60
@@ -14,22 +28,65 @@ PREDICTION_THRESHOLD = 0.001
 # Predicción continua
 PREDICTION_INTERVAL = 10    # Segundos entre predicciones
 PREDICTION_HORIZON = 60     # 60 segundos = 1 minuto para predecir
+PREDICTION_HORIZONS = [5, 15, 30, 60, 120]  # Horizontes de la curva (s), de un solo ajuste
+PREDICTION_CONFIDENCE_Z = 1.96  # Semiancho de la banda en desviaciones típicas (~95%)
 PREDICTION_HISTORY = 300    # Mantener predicciones por 5 minutos
+SCHEDULER_POLL_INTERVAL = 0.05  # Segundos entre comprobaciones de ticks nuevos
+
+# Predictores online (estado actualizado tick a tick en la ingesta)
+PREDICTOR = "batch"         # Predictor del scheduler: "batch" (ajuste por ventana), "rls" o "kalman"
+ONLINE_PREDICTORS = ("rls", "kalman")  # Modelos online que se actualizan con cada tick aceptado
+RLS_FORGETTING = 0.995      # Factor de olvido por tick (memoria ~1/(1-λ) = 200 ticks)
+KALMAN_OBS_NOISE = 5e-5     # Desv. típica del ruido de observación, relativa al precio
+KALMAN_LEVEL_NOISE = 1e-4   # Desv. típica del paseo aleatorio del nivel por √s, relativa al precio
+KALMAN_TREND_NOISE = 1e-6   # Desv. típica de la aceleración por s^1.5, relativa al precio
+ONLINE_CHECKPOINT_INTERVAL = 60  # Segundos entre checkpoints de los modelos en MODELS_DIR
 
 # Visualización
 PLOT_HISTORY_SECONDS = 600  # 10 minutos de historial
 PLOT_FUTURE_SECONDS = 120   # 2 minutos de predicción
 UPDATE_INTERVAL = 1.0       # Segundos entre actualizaciones UI
+PLOT_BUCKETS = 1000         # Columnas de píxel a las que se reduce la serie de precio
+
+# Indicadores
+RSI_PERIOD = 14
+BOLLINGER_WINDOW = 20
+BOLLINGER_STD = 2
+EMA_PERIOD = 20
+ATR_PERIOD = 14
+
+# Barras OHLCV mantenidas en la ingesta
+BAR_INTERVALS = {"1s": 1000, "5s": 5000, "1m": 60000}  # Barras de tiempo (ms)
+BAR_TICKS = 100             # Trades por barra de ticks (nombre "100t")
+VOLUME_BAR_SIZES = {        # Volumen (en la moneda base) por barra de volumen
+    "ETHUSDT": 50, "BTCUSDT": 2, "BNBUSDT": 100, "XRPUSDT": 100_000, "ADAUSDT": 200_000
+}
+BAR_CAPACITY = 1000         # Barras cerradas por serie
+PREDICTION_BARS = None      # Predecir sobre barras (p.ej. "1s") en vez de trades crudos
+
+# Streaming de la API
+STREAM_PUSH_INTERVAL = 0.25     # Segundos entre envíos agrupados a cada cliente
+STREAM_HANDSHAKE_TIMEOUT = 1.0  # Espera del mensaje de reanudación al conectar
+STREAM_MAX_TICKS = 5000         # Ticks máximos por delta
+
+# Caché de respuestas de la API (por secuencia de datos, LRU)
+API_CACHE_ENTRIES = 512              # Respuestas codificadas guardadas como máximo
+API_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Tamaño máximo de los cuerpos guardados
 
 # Alertas
 ALERT_PRICE_CHANGE_THRESHOLD = 0.005  # 0.5%
 ALERT_RSI_OVERBOUGHT = 70
 ALERT_RSI_OVERSOLD = 30
+ALERT_COOLDOWN = 60        # Segundos mínimos entre dos avisos de la misma regla y símbolo
+ALERT_QUEUE_SIZE = 1000    # Eventos de alerta guardados (cola acotada)
+ALERT_MAX_TICKS = 1000     # Ticks nuevos por símbolo evaluados en cada pasada del scheduler (el exceso no se evalúa)
 
 # Validación de datos
-MIN_PRICE_RATIO = 0.01  # 1% del precio promedio
-MAX_PRICE_RATIO = 10.0  # 1000% del precio promedio
-PRICE_VALIDATION_WINDOW = 20  # Ticks para calcular precio promedio
+PRICE_VALIDATION_WINDOW = 200  # Span (ticks) de la media y la MAD exponenciales
+PRICE_VALIDATION_MAD_K = 10     # Outlier si |precio - media| > K * MAD
+PRICE_VALIDATION_MIN_DEVIATION = 0.0005  # MAD mínima relativa a la media (series planas)
+PRICE_VALIDATION_MIN_SAMPLES = 20  # Ticks antes de empezar a rechazar outliers
+PRICE_VALIDATION_MAX_STREAK = 50   # Outliers seguidos que se toman como salto real de precio
 
 # Rendimiento
 MAX_TICKS_PER_SECOND = 100  # Ahora no se usa para saltar, pero se mantiene
@@ -37,6 +94,20 @@ MAX_TICKS_PER_SECOND = 100  # Ahora no se usa para saltar, pero se mantiene
 # Depuración
 DEBUG = True
 
+# Persistencia de ticks
+HISTORICAL_MINUTES = 5          # Histórico máximo a pedir por REST al arrancar
+PERSIST_TICKS = True            # Guardar los ticks aceptados en DATA_DIR
+TICK_STORE_FLUSH_INTERVAL = 1.0  # Segundos entre volcados a disco
+STORE_FOLLOW_INTERVAL = 0.5      # Segundos entre lecturas del TickStore en `service.py --api-only`
+
+# Backfill histórico por REST
+BINANCE_REST_URL = "https://api.binance.com/api/v3/"
+BACKFILL_CONCURRENCY = 8        # Peticiones simultáneas (tamaño del pool)
+BACKFILL_RETRIES = 5            # Reintentos por página ante 429/418/5xx o errores de red
+BACKFILL_MAX_WEIGHT = 5000      # Peso usado por minuto a partir del cual se espera al siguiente
+BACKFILL_FIRST_TICK_WAIT = 10.0  # Segundos a esperar el primer tick WS de cada símbolo antes del backfill
+BACKFILL_MAX_HELD_TICKS = 500_000  # Ticks WS retenidos durante el backfill (los más antiguos se descartan y se piden por REST)
+
 # Paths
 DATA_DIR = "./data"
 MODELS_DIR = "./models"
\ No newline at end of file
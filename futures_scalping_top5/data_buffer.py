@@ -1,90 +1,368 @@
 # data_buffer.py
 
-from collections import deque
 import threading
 import time
-from config import BUFFER_MAXLEN, DEBUG, MIN_PRICE_RATIO, MAX_PRICE_RATIO, PRICE_VALIDATION_WINDOW
+import numpy as np
+from config import BUFFER_MAXLEN, DEBUG
+from ring_buffer import TickRing, new_epoch
+from streaming_indicators import IndicatorEngine
+from bars import BarEngine, bars_window
+from online_predictor import OnlineModels
+from validation import TickValidator
+from metrics import registry, ERRORS
+
+TICKS_ACCEPTED = registry.counter('predict_ticks_accepted_total', "Ticks aceptados en el DataBuffer", ('symbol',))
+LOCK_WAIT = registry.histogram('predict_buffer_lock_wait_seconds', "Espera por el lock de escritura del DataBuffer")
+INGEST_SECONDS = registry.histogram(
+    'predict_buffer_ingest_seconds',
+    "Tiempo de añadir un lote de ticks (validación, ring, indicadores, barras, modelos)")
 
 class DataBuffer:
-    """Buffer circular con validación de precios y carga histórica"""
+    """
+    Buffer circular con validación de precios y carga histórica.
+
+    Sólo los escritores (ingesta WS, carga histórica) toman `write_lock`;
+    los lectores nunca bloquean la ingesta: leen vistas o snapshots
+    validados por número de secuencia directamente de cada TickRing.
+    """
     
     def __init__(self, maxlen=BUFFER_MAXLEN):
         self.buffers = {}
         self.maxlen = maxlen
-        self.lock = threading.Lock()
-        self.price_stats = {}
+        self.write_lock = threading.Lock()
+        self.validator = TickValidator()
         self.historical_loaded = {}
+        self.indicators = IndicatorEngine()
+        self.bars = BarEngine()
+        self.models = OnlineModels()  # Predictores online, actualizados con cada tick aceptado
+        self.followed = {}  # Símbolo -> última secuencia leída de un ring externo
+        self.sources = {}   # Símbolo -> ring externo que se copia en el ring local (ver copy_shared)
+        self.store = None   # TickStore opcional donde se persisten los ticks aceptados
+        self.epoch = new_epoch()  # Distingue este buffer (y su validador) de los de otros procesos
         
-    def is_valid_price(self, symbol, price):
-        symbol_key = symbol.upper()
-        
-        if symbol_key not in self.price_stats or len(self.price_stats[symbol_key]) < 5:
-            return price > 0
-        
-        prices = self.price_stats[symbol_key]
-        avg_price = sum(prices) / len(prices)
-        min_valid = avg_price * MIN_PRICE_RATIO
-        max_valid = avg_price * MAX_PRICE_RATIO
-        
-        return min_valid <= price <= max_valid
-    
-    def update_price_stats(self, symbol, price):
-        symbol_key = symbol.upper()
-        if symbol_key not in self.price_stats:
-            self.price_stats[symbol_key] = deque(maxlen=PRICE_VALIDATION_WINDOW)
-        self.price_stats[symbol_key].append(price)
-    
     def add_tick(self, symbol, tick):
-        with self.lock:
+        with self.write_lock:
             symbol_key = symbol.upper()
             price = tick['price']
             
-            if not self.is_valid_price(symbol_key, price):
+            reason = self.validator.check(symbol_key, tick['timestamp'], price, tick.get('trade_id'))
+            if reason is not None:
                 if DEBUG:
-                    print(f"Invalid price for {symbol_key}: {price}. Skipping.")
+                    print(f"Rejected tick for {symbol_key} ({reason}): {price}. Skipping.")
                 return False
-                
-            self.update_price_stats(symbol_key, price)
             
-            if symbol_key not in self.buffers:
-                self.buffers[symbol_key] = deque(maxlen=self.maxlen)
-            self.buffers[symbol_key].append(tick)
+            self._ring(symbol_key).append(
+                tick['timestamp'], price, tick.get('qty'), tick.get('side')
+            )
+            self.indicators.update(symbol_key, tick['timestamp'], price, tick.get('qty'))
+            self.bars.update(symbol_key, tick['timestamp'], price, tick.get('qty'))
+            self.models.update(symbol_key, tick['timestamp'], price)
+            if self.store is not None:
+                self.store.append(symbol_key, tick['timestamp'], price, tick.get('qty') or 0.0)
+            TICKS_ACCEPTED.labels(symbol_key).inc()
             return True
 
+    def add_ticks(self, symbol, timestamps, prices, qtys=None, sides=None, trade_ids=None):
+        """
+        Añade un lote de ticks de un símbolo con una sola toma del lock.
+        `qtys` (cantidad), `sides` (1 compra agresora, -1 venta) y
+        `trade_ids` (para descartar duplicados y desordenados) son opcionales.
+        """
+        symbol_key = symbol.upper()
+        started = time.perf_counter()
+        with self.write_lock:
+            locked = time.perf_counter()
+            mask = self.validator.filter(symbol_key, timestamps, prices, trade_ids)
+            accepted = np.flatnonzero(mask).tolist()
+            if len(accepted) < len(prices) and DEBUG:
+                print(f"Rejected {len(prices) - len(accepted)} ticks for {symbol_key}")
+
+            if accepted:
+                if len(accepted) < len(prices):
+                    timestamps = [timestamps[i] for i in accepted]
+                    prices = [prices[i] for i in accepted]
+                    qtys = None if qtys is None else [qtys[i] for i in accepted]
+                    sides = None if sides is None else [sides[i] for i in accepted]
+                self._ring(symbol_key).extend(timestamps, prices, qtys, sides)
+                self.indicators.update_many(symbol_key, timestamps, prices, qtys)
+                self.bars.update_many(symbol_key, timestamps, prices, qtys)
+                self.models.update_many(symbol_key, timestamps, prices)
+                if self.store is not None:
+                    self.store.append_many(symbol_key, timestamps, prices, qtys)
+                TICKS_ACCEPTED.labels(symbol_key).inc(len(accepted))
+        finished = time.perf_counter()
+        LOCK_WAIT.labels().record(locked - started)
+        INGEST_SECONDS.labels().record(finished - started)
+        return len(accepted)
+
+    def _ring(self, symbol_key):
+        ring = self.buffers.get(symbol_key)
+        if ring is None:
+            ring = self.buffers[symbol_key] = TickRing(self.maxlen)
+        return ring
+
     def load_historical_data(self, symbol, historical_ticks):
-        """Carga datos históricos en el buffer"""
-        with self.lock:
-            symbol_key = symbol.upper()
-            if symbol_key not in self.buffers:
-                self.buffers[symbol_key] = deque(maxlen=self.maxlen)
-            
-            # Añadir datos históricos manteniendo el orden cronológico
-            for tick in historical_ticks:
-                if self.is_valid_price(symbol_key, tick['price']):
-                    self.buffers[symbol_key].append(tick)
-                    self.update_price_stats(symbol_key, tick['price'])
-            
+        """Carga datos históricos en el buffer (validados como un solo lote)"""
+        symbol_key = symbol.upper()
+        timestamps = [tick['timestamp'] for tick in historical_ticks]
+        prices = [tick['price'] for tick in historical_ticks]
+        qtys = sides = None
+        if historical_ticks and 'qty' in historical_ticks[0]:
+            qtys = [tick.get('qty') or 0.0 for tick in historical_ticks]
+        if historical_ticks and 'side' in historical_ticks[0]:
+            sides = [tick.get('side') or 0 for tick in historical_ticks]
+        accepted = self.add_ticks(symbol_key, timestamps, prices, qtys, sides)
+        with self.write_lock:
+            self._ring(symbol_key)
             self.historical_loaded[symbol_key] = True
-            if DEBUG:
-                print(f"Loaded {len(historical_ticks)} historical ticks for {symbol_key}")
+        if DEBUG:
+            print(f"Loaded {accepted}/{len(historical_ticks)} historical ticks for {symbol_key}")
+
+    def enable_persistence(self, store):
+        """Persiste en `store` (TickStore) todos los ticks aceptados a partir de ahora"""
+        self.store = store
+
+    def warm_start(self, symbol, store=None):
+        """
+        Carga desde disco los últimos ticks del símbolo (hasta maxlen) sin
+        volver a persistirlos. Devuelve el timestamp del último tick cargado
+        o None si no había datos, para pedir por REST sólo el hueco restante.
+        """
+        store = store or self.store
+        if store is None:
+            return None
+        symbol_key = symbol.upper()
+        records = store.tail(symbol_key, self.maxlen)
+        if len(records) == 0:
+            return None
+
+        timestamps = records['timestamp']
+        prices = records['price']
+        with self.write_lock:
+            self._ring(symbol_key).extend(timestamps, prices)
+            self.validator.seed(symbol_key, timestamps, prices)
+            qtys = records['qty']
+            # qty = 0 en disco significa "cantidad desconocida"
+            qtys = qtys.tolist() if qtys.any() else None
+            self.indicators.update_many(symbol_key, timestamps.tolist(), prices.tolist(), qtys)
+            self.bars.update_many(symbol_key, timestamps, prices, records['qty'])
+            # Tras cargar un checkpoint sólo se aplican los ticks posteriores a él
+            self.models.update_many(symbol_key, timestamps, prices)
+            self.historical_loaded[symbol_key] = True
+        if DEBUG:
+            print(f"Warm-started {len(records)} ticks for {symbol_key} from disk")
+        return int(timestamps[-1])
+
+    def attach_ring(self, symbol, ring, follow=True):
+        """
+        Usa un ring escrito por otro proceso (p.ej. SharedTickRing) como
+        buffer del símbolo. Con follow=True, sync_shared() alimenta los
+        indicadores y las estadísticas con los ticks nuevos.
+        """
+        symbol_key = symbol.upper()
+        with self.write_lock:
+            self.buffers[symbol_key] = ring
+            if follow:
+                self.followed[symbol_key] = 0
+
+    def copy_shared(self, symbol):
+        """
+        Deja de leer directamente el ring externo seguido del símbolo: sus
+        ticks (desde el último sincronizado) se copian en sync_shared a un
+        ring local nuevo, detrás de lo que se cargue antes en él (arranque
+        en caliente, backfill). El ring externo tiene un único escritor y no
+        admite ticks anteriores a los suyos.
+        """
+        symbol_key = symbol.upper()
+        with self.write_lock:
+            if symbol_key not in self.followed or symbol_key in self.sources:
+                return
+            self.sources[symbol_key] = self.buffers[symbol_key]
+            self.buffers[symbol_key] = TickRing(self.maxlen)
+
+    def shared_ring(self, symbol):
+        """Ring externo seguido del símbolo (aunque se copie a uno local) o None"""
+        symbol_key = symbol.upper()
+        if symbol_key not in self.followed:
+            return None
+        return self.sources.get(symbol_key, self.buffers.get(symbol_key))
+
+    def detach_ring(self, symbol):
+        """Sustituye un ring externo por una copia local (p.ej. antes de cerrarlo)"""
+        symbol_key = symbol.upper()
+        with self.write_lock:
+            if self.sources.pop(symbol_key, None) is not None:
+                # El ring local ya tiene todo lo sincronizado
+                self.followed.pop(symbol_key, None)
+                return
+            ring = self.buffers.get(symbol_key)
+            if ring is None:
+                return
+            _, window = ring.snapshot()
+            local = TickRing(self.maxlen)
+            local.extend(window.timestamp, window.price, window.qty, window.side)
+            self.buffers[symbol_key] = local
+            self.followed.pop(symbol_key, None)
+
+    def sync_shared(self):
+        """Procesa los ticks que otros procesos han escrito en los rings seguidos"""
+        synced = 0
+        for symbol_key, last_seq in list(self.followed.items()):
+            source = self.sources.get(symbol_key)
+            ring = source if source is not None else self.buffers[symbol_key]
+            count = ring.written - last_seq
+            if count <= 0:
+                continue
+            while True:
+                seq, window = ring.snapshot(count)
+                new = seq - last_seq
+                # Si el escritor avanzó entre lecturas, pedir también esos ticks
+                if new <= len(window) or len(window) >= ring.capacity:
+                    break
+                count = new
+            new = min(new, len(window))
+            window = window[len(window) - new:]
+            with self.write_lock:
+                if source is not None:
+                    self.buffers[symbol_key].extend(window.timestamp, window.price, window.qty, window.side)
+                # Ya validados por el proceso escritor
+                self.validator.seed(symbol_key, window.timestamp, window.price)
+                qtys = None if window.qty is None else window.qty.tolist()
+                self.indicators.update_many(symbol_key, window.timestamp.tolist(), window.price.tolist(), qtys)
+                self.bars.update_many(symbol_key, window.timestamp, window.price, window.qty)
+                self.models.update_many(symbol_key, window.timestamp, window.price)
+                if self.store is not None:
+                    self.store.append_many(symbol_key, window.timestamp, window.price, window.qty)
+            self.followed[symbol_key] = seq
+            synced += new
+        return synced
 
     def get_buffer(self, symbol, max_ticks=None):
-        with self.lock:
-            symbol_key = symbol.upper()
-            if symbol_key not in self.buffers or not self.buffers[symbol_key]:
-                return []
-                
-            buffer = self.buffers[symbol_key]
-            if max_ticks and len(buffer) > max_ticks:
-                return list(buffer)[-max_ticks:]
-            return list(buffer)
+        """Devuelve los ticks como lista de dicts (formato de la API)"""
+        return self.get_snapshot(symbol, max_ticks)[1].to_dicts()
+
+    def get_snapshot(self, symbol, max_ticks=None):
+        """
+        Copia consistente de los últimos ticks sin bloquear la ingesta.
+        Devuelve (secuencia, TickWindow); la secuencia es el número de ticks
+        escritos para el símbolo cuando se tomó la copia.
+        """
+        ring = self.buffers.get(symbol.upper())
+        if ring is None:
+            return 0, _EMPTY_WINDOW
+        return ring.snapshot(max_ticks or None)
+
+    def get_snapshot_between(self, symbol, since=None, until=None, max_ticks=None):
+        """Copia consistente de los ticks en [since, until]; devuelve (secuencia, TickWindow)"""
+        ring = self.buffers.get(symbol.upper())
+        if ring is None:
+            return 0, _EMPTY_WINDOW
+        return ring.snapshot_between(since, until, max_ticks)
+
+    def get_window(self, symbol, max_ticks=None):
+        """
+        Devuelve los últimos ticks como TickWindow de arrays sin copia.
+        Las vistas siguen siendo válidas hasta que se escriban
+        (slots - len(window)) ticks nuevos; usar get_snapshot() para conservarlas.
+        """
+        ring = self.buffers.get(symbol.upper())
+        if ring is None:
+            return _EMPTY_WINDOW
+        return ring.window(max_ticks or None)
+
+    def get_window_between(self, symbol, since=None, until=None):
+        """Devuelve los ticks en el rango [since, until] en milisegundos"""
+        ring = self.buffers.get(symbol.upper())
+        if ring is None:
+            return _EMPTY_WINDOW
+        return ring.window_between(since, until)
+
+    def get_bars(self, symbol, name, count=None):
+        """Últimas barras `name` (p.ej. '1s', '100t', 'volume') como array BAR_DTYPE, o None"""
+        return self.bars.get(symbol, name, count)
+
+    def get_bar_window(self, symbol, name, count=None):
+        """Cierres de las últimas barras como TickWindow (entrada del predictor)"""
+        bars = self.bars.get(symbol, name, count)
+        return _EMPTY_WINDOW if bars is None else bars_window(bars)
+
+    def get_sequence(self, symbol):
+        """Número de ticks escritos para el símbolo (crece con cada tick)"""
+        ring = self.buffers.get(symbol.upper())
+        return ring.written if ring is not None else 0
     
+    def get_epoch(self, symbol):
+        """
+        Época de get_sequence: cambia cuando se sustituye el ring del símbolo
+        o el proceso se reinicia, que es cuando la secuencia vuelve a empezar
+        """
+        ring = self.buffers.get(symbol.upper())
+        return ring.epoch if ring is not None else self.epoch
+
+    def get_last_tick(self, symbol):
+        """Último tick de un símbolo como dict o None"""
+        ring = self.buffers.get(symbol.upper())
+        last = ring.last() if ring is not None else None
+        if last is None:
+            return None
+        return {'timestamp': last[0], 'price': last[1]}
+
+    def get_validation_stats(self, symbol):
+        """Media/MAD, banda aceptada y rechazos por motivo del símbolo (O(1)), o None"""
+        return self.validator.stats(symbol)
+
+    def get_validation_sequence(self, symbol):
+        """Versión de get_validation_stats: cambia con cada tick aceptado o rechazado"""
+        return self.validator.version(symbol)
+
+    def get_forecast(self, symbol, kind, horizons, now_ms=None):
+        """Predicción instantánea del modelo online `kind`: (precios, desviaciones típicas) o None"""
+        return self.models.forecast(symbol, kind, horizons, now_ms)
+
+    def get_indicators(self, symbol):
+        """Valores actuales de RSI, Bollinger, EMA, VWAP y ATR (O(1))"""
+        return self.indicators.get(symbol)
+
     def has_minimum_data(self, symbol):
         """Verifica si hay datos mínimos para mostrar"""
-        with self.lock:
-            symbol_key = symbol.upper()
-            return symbol_key in self.historical_loaded
+        return symbol.upper() in self.historical_loaded
+
+_EMPTY_WINDOW = TickRing(1).window()
 
 # Crea la instancia global
 data_buffer = DataBuffer()
-buffer_lock = threading.Lock()
\ No newline at end of file
+
+
+# Callbacks de la ingesta (ws_client) sobre el buffer global, sin depender de la API
+def add_tick_to_buffer(symbol: str, tick: dict):
+    try:
+        return data_buffer.add_tick(symbol.upper(), tick)
+    except Exception as e:
+        ERRORS.labels('buffer').inc()
+        if DEBUG:
+            print(f"Error adding tick to buffer: {str(e)}")
+        return False
+
+def add_ticks_to_buffer(symbol: str, timestamps: list, prices: list, qtys: list = None, sides: list = None,
+                        trade_ids: list = None):
+    try:
+        return data_buffer.add_ticks(symbol, timestamps, prices, qtys, sides, trade_ids)
+    except Exception as e:
+        ERRORS.labels('buffer').inc()
+        if DEBUG:
+            print(f"Error adding ticks to buffer: {str(e)}")
+        return 0
+
+
+registry.counter(
+    'predict_ticks_rejected_total', "Ticks rechazados por la validación", ('symbol', 'reason'),
+    callback=lambda: {
+        (symbol, reason): count
+        for symbol, state in list(data_buffer.validator.symbols.items())
+        for reason, count in state.rejected.items()
+    }
+)
+registry.gauge(
+    'predict_buffer_ticks', "Ticks escritos por símbolo (secuencia del ring)", ('symbol',),
+    callback=lambda: {(symbol,): ring.written for symbol, ring in list(data_buffer.buffers.items())}
+)
\ No newline at end of file
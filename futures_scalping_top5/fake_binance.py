@@ -0,0 +1,346 @@
+# fake_binance.py
+
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import websockets
+
+import fastjson
+
+
+def synthetic_trades(symbols, n, start_ms=1_700_000_000_000, seed=0):
+    """Genera n trades sintéticos por símbolo con el formato del stream @trade"""
+    rng = np.random.default_rng(seed)
+    trades = []
+    for k, symbol in enumerate(symbols):
+        timestamps = start_ms + np.cumsum(rng.integers(0, 50, n))
+        prices = (100.0 * (k + 1)) * np.exp(np.cumsum(rng.normal(0, 1e-4, n)))
+        quantities = rng.exponential(1.0, n)
+        for i in range(n):
+            trades.append({
+                'e': 'trade',
+                's': symbol.upper(),
+                't': i + 1,
+                'p': f"{prices[i]:.4f}",
+                'q': f"{quantities[i]:.3f}",
+                'T': int(timestamps[i]),
+                'm': bool(i % 2)
+            })
+    trades.sort(key=lambda t: t['T'])
+    return trades
+
+
+def _depth_levels(side, tick, descending):
+    """Niveles {precio en ticks: cantidad} como [[precio, cantidad]] de Binance (bids descendentes)"""
+    return [[f"{p * tick:.4f}", f"{side[p]:.3f}"] for p in sorted(side, reverse=descending)]
+
+
+def synthetic_depth(symbols, n, start_ms=1_700_000_000_000, seed=0, levels=100, changes=10, step_ms=100):
+    """
+    Genera un snapshot inicial por símbolo y n diffs depthUpdate por
+    símbolo (formato de futuros, con U/u/pu encadenados) sobre un libro
+    de `levels` niveles por lado cuyo precio medio hace un paseo aleatorio
+    en ticks. Devuelve ({symbol: snapshot}, diffs ordenados por tiempo).
+    """
+    rng = np.random.default_rng(seed)
+    snapshots = {}
+    events = []
+    for k, symbol in enumerate(symbols):
+        symbol = symbol.upper()
+        tick = 0.01 * (k + 1)
+        mid = 10_000 * (k + 1)   # En ticks
+        bids = {mid - i: float(q) for i, q in enumerate(rng.exponential(5.0, levels), 1)}
+        asks = {mid + i: float(q) for i, q in enumerate(rng.exponential(5.0, levels), 1)}
+        update_id = 1000 * (k + 1)
+        snapshots[symbol] = {'lastUpdateId': update_id, 'E': start_ms, 'T': start_ms,
+                             'bids': _depth_levels(bids, tick, True),
+                             'asks': _depth_levels(asks, tick, False)}
+
+        timestamps = start_ms + np.cumsum(rng.integers(1, 2 * step_ms, n))
+        moves = rng.integers(-1, 2, n)
+        for i in range(n):
+            mid += int(moves[i])
+            changed = ({}, {})
+            # Niveles que cruzarían el nuevo precio medio
+            for side, crossed, out in ((bids, [p for p in bids if p >= mid], changed[0]),
+                                       (asks, [p for p in asks if p <= mid], changed[1])):
+                for p in crossed:
+                    del side[p]
+                    out[p] = 0.0
+            offsets = rng.integers(1, levels + 1, (2, changes))
+            qtys = np.where(rng.random((2, changes)) < 0.2, 0.0, rng.exponential(5.0, (2, changes)).round(3))
+            for j in range(changes):
+                for side, price, out, q in ((bids, mid - int(offsets[0, j]), changed[0], float(qtys[0, j])),
+                                            (asks, mid + int(offsets[1, j]), changed[1], float(qtys[1, j]))):
+                    if q:
+                        side[price] = q
+                    else:
+                        side.pop(price, None)
+                    out[price] = q
+            count = len(changed[0]) + len(changed[1])
+            t = int(timestamps[i])
+            events.append({
+                'e': 'depthUpdate', 'E': t, 'T': t, 's': symbol,
+                'U': update_id + 1, 'u': update_id + count, 'pu': update_id,
+                'b': [[f"{p * tick:.4f}", f"{q:.3f}"] for p, q in changed[0].items()],
+                'a': [[f"{p * tick:.4f}", f"{q:.3f}"] for p, q in changed[1].items()]
+            })
+            update_id += count
+    events.sort(key=lambda e: e['E'])
+    return snapshots, events
+
+
+def load_recorded(path):
+    """
+    Lee trades grabados de un fichero JSONL: una línea por mensaje, ya sea el
+    mensaje combinado {'stream', 'data'} o el payload del trade directamente.
+    """
+    trades = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            message = fastjson.loads(line)
+            trades.append(message.get('data', message))
+    return trades
+
+
+class FakeBinanceServer:
+    """
+    Servidor WebSocket local que reproduce trades (y diffs depthUpdate)
+    con el formato combined-stream de Binance
+    (/stream?streams=ethusdt@trade/ethusdt@depth@100ms/...).
+
+    `rate` limita los mensajes por segundo de cada conexión (None = lo más
+    rápido posible) y `drop_after` corta la conexión tras N mensajes para
+    probar las reconexiones.
+    """
+
+    def __init__(self, trades, host='127.0.0.1', port=0, rate=None, drop_after=None, repeat=False):
+        self.trades = trades
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.drop_after = drop_after
+        self.repeat = repeat
+        self.connections = 0
+        self.sent = 0
+        self._ready = threading.Event()
+        self._loop = None
+        self._stop = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def _messages_for(self, path):
+        query = parse_qs(urlparse(path).query)
+        streams = set(query.get('streams', [''])[0].split('/'))
+        messages = []
+        for trade in self.trades:
+            kind = 'depth@100ms' if trade.get('e') == 'depthUpdate' else 'trade'
+            stream = f"{trade['s'].lower()}@{kind}"
+            if stream in streams:
+                messages.append(fastjson.dumps({'stream': stream, 'data': trade}).decode())
+        return messages
+
+    async def _handler(self, websocket, path=None):
+        if path is None:
+            path = getattr(websocket, 'path', None) or websocket.request.path
+        self.connections += 1
+        messages = self._messages_for(path)
+        chunk = max(1, int(self.rate // 100)) if self.rate else 256
+        started = time.perf_counter()
+        sent = 0
+        try:
+            while messages:
+                for i in range(0, len(messages), chunk):
+                    for message in messages[i:i + chunk]:
+                        await websocket.send(message)
+                    sent += min(chunk, len(messages) - i)
+                    self.sent += min(chunk, len(messages) - i)
+                    if self.drop_after is not None and sent >= self.drop_after:
+                        return
+                    if self.rate:
+                        delay = started + sent / self.rate - time.perf_counter()
+                        await asyncio.sleep(max(delay, 0))
+                    else:
+                        await asyncio.sleep(0)
+                if not self.repeat:
+                    break
+            await websocket.wait_closed()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        async with websockets.serve(self._handler, self.host, self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._stop.wait()
+
+    def start(self):
+        """Arranca el servidor en un hilo propio y espera a que escuche"""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self._ready.wait(5)
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._serve())
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self.thread.join(5)
+
+
+def synthetic_agg_trades(symbols, n, start_ms=1_700_000_000_000, seed=0, step_ms=50):
+    """
+    Genera n aggTrades sintéticos por símbolo como arrays columnares
+    {symbol: {'a', 'T', 'p', 'q', 'm'}}, en orden de id y de tiempo.
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    for k, symbol in enumerate(symbols):
+        data[symbol.upper()] = {
+            'a': np.arange(1, n + 1, dtype=np.int64),
+            'T': start_ms + np.cumsum(rng.integers(0, 2 * step_ms, n)),
+            'p': (100.0 * (k + 1)) * np.exp(np.cumsum(rng.normal(0, 1e-4, n))),
+            'q': rng.exponential(1.0, n),
+            'm': rng.integers(0, 2, n).astype(bool)
+        }
+    return data
+
+
+class FakeBinanceREST:
+    """
+    Servidor HTTP local que responde a /aggTrades como la API REST de
+    Binance (fromId, startTime/endTime, limit) sobre datos columnares, y
+    a /depth con los snapshots de `depth` ({symbol: snapshot}).
+
+    Informa del peso usado en X-MBX-USED-WEIGHT-1M (`weight` por petición)
+    y, si `throttle_every` está definido, responde 429 con Retry-After a
+    una de cada N peticiones para probar los reintentos.
+    """
+
+    MAX_LIMIT = 1000
+    MAX_WINDOW_MS = 60 * 60 * 1000
+
+    def __init__(self, data, host='127.0.0.1', port=0, weight=2, throttle_every=None, retry_after=0, depth=None):
+        self.data = data
+        self.depth = depth or {}
+        self.host = host
+        self.port = port
+        self.weight = weight
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self.minute = None
+        self.used_weight = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/api/v3/"
+
+    def _agg_trades(self, query):
+        """Devuelve (status, cuerpo) para una consulta aggTrades"""
+        symbol = query.get('symbol', [''])[0].upper()
+        columns = self.data.get(symbol)
+        if columns is None:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        limit = min(int(query.get('limit', [500])[0]), self.MAX_LIMIT)
+
+        if 'fromId' in query:
+            lo = int(np.searchsorted(columns['a'], int(query['fromId'][0]), side='left'))
+            hi = lo + limit
+        else:
+            start = int(query['startTime'][0]) if 'startTime' in query else None
+            end = int(query['endTime'][0]) if 'endTime' in query else None
+            if start is not None and end is not None and end - start > self.MAX_WINDOW_MS:
+                return 400, {'code': -1127, 'msg': 'More than 1 hours between startTime and endTime.'}
+            lo = 0 if start is None else int(np.searchsorted(columns['T'], start, side='left'))
+            hi = len(columns['T']) if end is None else int(np.searchsorted(columns['T'], end, side='right'))
+            if start is None:
+                lo = max(hi - limit, 0)
+            hi = min(hi, lo + limit)
+
+        a, t = columns['a'][lo:hi].tolist(), columns['T'][lo:hi].tolist()
+        p, q, m = columns['p'][lo:hi].tolist(), columns['q'][lo:hi].tolist(), columns['m'][lo:hi].tolist()
+        return 200, [
+            {'a': a[i], 'p': f"{p[i]:.4f}", 'q': f"{q[i]:.3f}", 'f': a[i], 'l': a[i], 'T': t[i], 'm': m[i]}
+            for i in range(len(a))
+        ]
+
+    def _depth(self, query):
+        """Devuelve (status, cuerpo) para una consulta depth"""
+        snapshot = self.depth.get(query.get('symbol', [''])[0].upper())
+        if snapshot is None:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        limit = int(query.get('limit', [500])[0])
+        return 200, dict(snapshot, bids=snapshot['bids'][:limit], asks=snapshot['asks'][:limit])
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive para el pool de conexiones
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                with server.lock:
+                    server.requests += 1
+                    count = server.requests
+                    # El peso usado se reinicia cada minuto, como en Binance
+                    minute = int(time.time() // 60)
+                    if minute != server.minute:
+                        server.minute, server.used_weight = minute, 0
+                    server.used_weight += server.weight
+                    headers = {'X-MBX-USED-WEIGHT-1M': str(server.used_weight)}
+                if server.throttle_every and count % server.throttle_every == 0:
+                    with server.lock:
+                        server.throttled += 1
+                    status, body = 429, {'code': -1003, 'msg': 'Too many requests.'}
+                    headers['Retry-After'] = str(server.retry_after)
+                elif parsed.path.endswith('/aggTrades'):
+                    status, body = server._agg_trades(parse_qs(parsed.query))
+                elif parsed.path.endswith('/depth'):
+                    status, body = server._depth(parse_qs(parsed.query))
+                else:
+                    status, body = 404, {'code': -1, 'msg': 'Not found.'}
+
+                payload = fastjson.dumps(body)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Arranca el servidor en un hilo propio"""
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,35 @@
+# fastjson.py
+
+# Decodificador/codificador JSON más rápido disponible: orjson, msgspec o json.
+# dumps() devuelve bytes y acepta arrays y escalares NumPy en los tres casos.
+
+
+def _default(obj):
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+try:
+    import orjson
+
+    BACKEND = 'orjson'
+    loads = orjson.loads
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    try:
+        import msgspec
+
+        BACKEND = 'msgspec'
+        loads = msgspec.json.Decoder().decode
+        dumps = msgspec.json.Encoder(enc_hook=_default).encode
+    except ImportError:
+        import json
+
+        BACKEND = 'json'
+        loads = json.loads
+
+        def dumps(obj):
+            return json.dumps(obj, separators=(',', ':'), default=_default).encode()
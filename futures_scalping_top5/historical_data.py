@@ -1,9 +1,13 @@
 # historical_data.py
 
-import requests
+import asyncio
+import random
 import time
-from datetime import datetime, timedelta
-import json
+
+import httpx
+import numpy as np
+
+import fastjson
 
 try:
     from config import HISTORICAL_MINUTES, BINANCE_REST_URL, DEBUG
@@ -13,36 +17,172 @@ except ImportError:
     BINANCE_REST_URL = "https://api.binance.com/api/v3/"
     DEBUG = True
 
-def fetch_historical_trades(symbol, minutes=HISTORICAL_MINUTES):
-    """Obtiene datos históricos de Binance para un símbolo"""
+try:
+    from config import BACKFILL_CONCURRENCY, BACKFILL_RETRIES, BACKFILL_MAX_WEIGHT
+except ImportError:
+    BACKFILL_CONCURRENCY = 8
+    BACKFILL_RETRIES = 5
+    BACKFILL_MAX_WEIGHT = 5000
+
+PAGE_LIMIT = 1000
+# aggTrades sólo admite ventanas startTime/endTime de como máximo una hora
+MAX_TIME_WINDOW_MS = 60 * 60 * 1000
+
+
+class RateLimiter:
+    """
+    Limita las peticiones concurrentes y respeta el peso usado que Binance
+    informa en X-MBX-USED-WEIGHT-1M: al acercarse al límite espera al
+    siguiente minuto; ante 429/418 espera lo que indique Retry-After.
+    """
+
+    def __init__(self, concurrency=BACKFILL_CONCURRENCY, max_weight=BACKFILL_MAX_WEIGHT):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_weight = max_weight
+        self.resume_at = 0.0
+
+    async def wait(self):
+        delay = self.resume_at - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def observe(self, response):
+        used = response.headers.get('x-mbx-used-weight-1m')
+        if used is not None and int(used) >= self.max_weight:
+            # El peso se reinicia al empezar cada minuto
+            self.resume_at = max(self.resume_at, (int(time.time()) // 60 + 1) * 60)
+        if response.status_code in (418, 429):
+            retry_after = float(response.headers.get('retry-after', 1))
+            self.resume_at = max(self.resume_at, time.time() + retry_after)
+
+
+async def _fetch_page(client, limiter, symbol, params, retries=BACKFILL_RETRIES):
+    """Pide una página de aggTrades con reintentos y backoff"""
+    params = dict(params, symbol=symbol, limit=PAGE_LIMIT)
+    for attempt in range(retries + 1):
+        await limiter.wait()
+        try:
+            async with limiter.semaphore:
+                response = await client.get("aggTrades", params=params)
+            limiter.observe(response)
+            if response.status_code in (418, 429) or response.status_code >= 500:
+                raise httpx.HTTPStatusError("retryable status", request=response.request, response=response)
+            response.raise_for_status()
+            return fastjson.loads(response.content)
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if attempt == retries or (status is not None and status < 500 and status not in (418, 429)):
+                raise
+            await asyncio.sleep(min(30, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+def _page_arrays(page):
+    """Convierte una página de aggTrades en arrays (timestamp, price, qty, id)"""
+    n = len(page)
+    return (
+        np.fromiter((t['T'] for t in page), dtype=np.int64, count=n),
+        np.fromiter((float(t['p']) for t in page), dtype=np.float64, count=n),
+        np.fromiter((float(t['q']) for t in page), dtype=np.float64, count=n),
+        np.fromiter((t['a'] for t in page), dtype=np.int64, count=n)
+    )
+
+
+async def backfill_symbol(client, limiter, symbol, start_ms, end_ms, sink):
+    """
+    Recorre aggTrades de `symbol` en [start_ms, end_ms] página a página:
+    la primera por ventana temporal y las siguientes por fromId, hasta
+    cubrir el rango completo. Cada página se entrega a
+    sink(symbol, timestamps, prices, qty, trade_ids) sin construir dicts.
+    Devuelve el número de trades recibidos.
+    """
+    symbol = symbol.upper()
+    total = 0
+    window_start = start_ms
+    page = []
+    # Buscar el primer trade del rango, avanzando por ventanas de una hora
+    while window_start <= end_ms and not page:
+        window_end = min(window_start + MAX_TIME_WINDOW_MS - 1, end_ms)
+        page = await _fetch_page(client, limiter, symbol, {'startTime': window_start, 'endTime': window_end})
+        window_start = window_end + 1
+
+    while page:
+        timestamps, prices, qty, trade_ids = _page_arrays(page)
+        keep = timestamps <= end_ms
+        if not keep.all():
+            timestamps, prices, qty, trade_ids = timestamps[keep], prices[keep], qty[keep], trade_ids[keep]
+        if len(timestamps):
+            sink(symbol, timestamps, prices, qty, trade_ids)
+            total += len(timestamps)
+        if len(page) < PAGE_LIMIT or not keep.all():
+            break
+        page = await _fetch_page(client, limiter, symbol, {'fromId': int(page[-1]['a']) + 1})
+
+    if DEBUG:
+        print(f"Backfilled {total} historical trades for {symbol}")
+    return total
+
+
+async def _backfill(ranges, sink, base_url, concurrency):
+    limiter = RateLimiter(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=10.0) as client:
+        tasks = [
+            backfill_symbol(client, limiter, symbol, start_ms, end_ms, sink)
+            for symbol, (start_ms, end_ms) in ranges.items()
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    totals = {}
+    for symbol, result in zip(ranges, results):
+        if isinstance(result, Exception):
+            if DEBUG:
+                print(f"Error fetching historical data for {symbol}: {result}")
+            totals[symbol.upper()] = 0
+        else:
+            totals[symbol.upper()] = result
+    return totals
+
+
+def backfill(ranges, sink, base_url=BINANCE_REST_URL, concurrency=BACKFILL_CONCURRENCY):
+    """
+    Rellena varios símbolos a la vez sobre un cliente HTTP asíncrono con
+    pool de conexiones. `ranges` es {symbol: (start_ms, end_ms)}.
+    Devuelve {symbol: trades recibidos}.
+    """
+    return asyncio.run(_backfill(ranges, sink, base_url, concurrency))
+
+
+def store_sink(store):
+    """Sink que escribe cada página directamente en un TickStore"""
+    def sink(symbol, timestamps, prices, qty, trade_ids):
+        store.append_many(symbol, timestamps, prices, qty, trade_ids)
+    return sink
+
+
+def buffer_sink(buffer):
+    """Sink que añade cada página a un DataBuffer (validada, en un solo lote)"""
+    def sink(symbol, timestamps, prices, qty, trade_ids):
+        buffer.add_ticks(symbol, timestamps.tolist(), prices.tolist(), qty.tolist())
+    return sink
+
+
+def fetch_historical_trades(symbol, minutes=HISTORICAL_MINUTES, start_time=None, base_url=BINANCE_REST_URL):
+    """
+    Obtiene datos históricos de Binance para un símbolo. Con `start_time`
+    (ms) sólo pide los trades posteriores, p.ej. tras un arranque en caliente.
+    Pagina hasta cubrir todo el rango en lugar de quedarse en 1000 trades.
+    """
     end_time = int(time.time() * 1000)
-    start_time = end_time - minutes * 60 * 1000
-    
-    params = {
-        'symbol': symbol.upper(),
-        'limit': 1000,
-        'startTime': start_time,
-        'endTime': end_time
-    }
-    
-    try:
-        response = requests.get(f"{BINANCE_REST_URL}aggTrades", params=params)
-        response.raise_for_status()
-        trades = response.json()
-        
-        historical_ticks = []
-        for trade in trades:
-            historical_ticks.append({
-                'price': float(trade['p']),
-                'timestamp': trade['T']
-            })
-        
-        if DEBUG:
-            print(f"Fetched {len(historical_ticks)} historical trades for {symbol}")
-        
-        return historical_ticks
-    
-    except Exception as e:
-        if DEBUG:
-            print(f"Error fetching historical data for {symbol}: {e}")
-        return []
\ No newline at end of file
+    window_start = end_time - minutes * 60 * 1000
+    start_time = window_start if start_time is None else max(start_time + 1, window_start)
+
+    pages = []
+    backfill({symbol: (start_time, end_time)}, lambda *page: pages.append(page), base_url)
+
+    historical_ticks = []
+    for _, timestamps, prices, qty, _ in pages:
+        historical_ticks.extend(
+            {'price': p, 'timestamp': t, 'qty': q}
+            for t, p, q in zip(timestamps.tolist(), prices.tolist(), qty.tolist())
+        )
+    return historical_ticks
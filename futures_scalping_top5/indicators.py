@@ -2,6 +2,22 @@
 
 import numpy as np
 
+from streaming_indicators import MS_PER_DAY
+
+def _wilder_smooth(values, period):
+    """
+    Último valor del suavizado de Wilder, sembrado con la media de los
+    primeros `period` valores. Forma cerrada vectorizada de la recurrencia
+    avg = (avg * (period - 1) + x) / period.
+    """
+    seed = np.mean(values[:period])
+    rest = values[period:]
+    if len(rest) == 0:
+        return seed
+    decay = (period - 1) / period
+    powers = decay ** np.arange(len(rest) - 1, -1, -1, dtype=np.float64)
+    return decay ** len(rest) * seed + np.dot(powers, rest) / period
+
 def calculate_rsi(prices, period=14):
     """
     Calcula el RSI (Relative Strength Index) para una lista o array de precios.
@@ -14,14 +30,9 @@ def calculate_rsi(prices, period=14):
     gains = np.where(deltas > 0, deltas, 0.0)
     losses = np.where(deltas < 0, -deltas, 0.0)
     
-    # Calcular EMA para ganancias y pérdidas
-    avg_gain = np.mean(gains[:period])
-    avg_loss = np.mean(losses[:period])
-    
-    # Suavizado exponencial
-    for i in range(period, len(gains)):
-        avg_gain = (avg_gain * (period - 1) + gains[i]) / period
-        avg_loss = (avg_loss * (period - 1) + losses[i]) / period
+    # Suavizado exponencial de Wilder para ganancias y pérdidas
+    avg_gain = _wilder_smooth(gains, period)
+    avg_loss = _wilder_smooth(losses, period)
 
     if avg_loss < 1e-10:  # Evitar división por cero
         return 100.0 if avg_gain > 0 else 50.0
@@ -45,4 +56,48 @@ def calculate_bollinger_bands(prices, window=20, num_std=2):
         moving_avg - num_std * std_dev,
         moving_avg,
         moving_avg + num_std * std_dev
-    )
\ No newline at end of file
+    )
+
+def calculate_ema(prices, period=20):
+    """
+    Calcula la EMA final de una serie sembrada con el primer precio.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if len(prices) == 0:
+        return np.nan
+    alpha = 2.0 / (period + 1)
+    n = len(prices) - 1
+    powers = (1 - alpha) ** np.arange(n - 1, -1, -1, dtype=np.float64)
+    return (1 - alpha) ** n * prices[0] + alpha * np.dot(powers, prices[1:])
+
+def calculate_vwap(prices, quantities=None, timestamps=None):
+    """
+    Calcula el VWAP de una serie (volumen unitario si no hay cantidades).
+    Con `timestamps` (ms) sólo cuentan los ticks del día UTC del último,
+    igual que streaming_indicators.VWAP, que se reinicia a medianoche UTC.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if len(prices) == 0:
+        return np.nan
+    start = 0
+    if timestamps is not None:
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        day_start = timestamps[-1] // MS_PER_DAY * MS_PER_DAY
+        start = int(np.searchsorted(timestamps, day_start, side='left'))
+        prices = prices[start:]
+    if quantities is None:
+        return float(np.mean(prices))
+    quantities = np.asarray(quantities, dtype=np.float64)[start:]
+    volume = quantities.sum()
+    if volume <= 0:
+        return np.nan
+    return float(np.dot(prices, quantities) / volume)
+
+def calculate_atr(prices, period=14):
+    """
+    Calcula el ATR de Wilder usando el rango entre ticks consecutivos.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if len(prices) < period + 1:
+        return np.nan
+    return _wilder_smooth(np.abs(np.diff(prices)), period)
@@ -0,0 +1,214 @@
+# metrics.py
+
+import math
+import threading
+
+import numpy as np
+
+# Precisión de los histogramas: sub-intervalos por potencia de 2 (~6% de error relativo)
+HISTOGRAM_SUB_BUCKETS = 16
+HISTOGRAM_LOWEST = 1e-6      # Segundos: 1 µs
+HISTOGRAM_HIGHEST = 120.0    # Segundos
+# Por debajo de este tamaño record_many registra valor a valor (más barato que NumPy)
+VECTOR_MIN_BATCH = 16
+
+
+class Counter:
+    """Contador monótono de una serie"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge(Counter):
+    """Valor instantáneo de una serie"""
+
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """
+    Histograma log-lineal de latencias (estilo HDR): cada potencia de 2
+    desde `lowest` se parte en HISTOGRAM_SUB_BUCKETS intervalos iguales,
+    así el error relativo es constante en todo el rango. Registrar un valor
+    es O(1) y sin locks (bajo el GIL se puede perder alguna cuenta en
+    carreras, aceptable para métricas). Valores en segundos; los negativos
+    (p.ej. latencias con el reloj local atrasado) cuentan como 0, tanto en
+    el intervalo 0 como en la suma.
+    """
+
+    __slots__ = ('lowest', 'exponents', 'counts', 'sum', 'count')
+
+    def __init__(self, lowest=HISTOGRAM_LOWEST, highest=HISTOGRAM_HIGHEST):
+        self.lowest = lowest
+        self.exponents = math.ceil(math.log2(highest / lowest))
+        # Intervalo 0: por debajo de `lowest`; el último acumula lo que pasa de `highest`
+        self.counts = [0] * ((self.exponents + 1) * HISTOGRAM_SUB_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def _index(self, value):
+        mantissa, exponent = math.frexp(value / self.lowest)
+        if exponent <= 0:
+            return 0
+        if exponent > self.exponents:
+            return len(self.counts) - 1
+        return exponent * HISTOGRAM_SUB_BUCKETS + int((2 * mantissa - 1) * HISTOGRAM_SUB_BUCKETS)
+
+    def record(self, value):
+        if value < 0:
+            value = 0.0
+        self.counts[self._index(value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def record_many(self, values):
+        """Registra un array de valores con una sola pasada de NumPy"""
+        if len(values) < VECTOR_MIN_BATCH:
+            for value in values:
+                self.record(float(value))
+            return
+        values = np.maximum(np.asarray(values, dtype=np.float64), 0.0)
+        mantissa, exponent = np.frexp(values / self.lowest)
+        index = exponent * HISTOGRAM_SUB_BUCKETS + ((2 * mantissa - 1) * HISTOGRAM_SUB_BUCKETS).astype(np.int64)
+        index = np.where(exponent <= 0, 0, np.minimum(index, len(self.counts) - 1))
+        counts = self.counts
+        for i, n in zip(*np.unique(index, return_counts=True)):
+            counts[i] += int(n)
+        self.sum += float(values.sum())
+        self.count += len(values)
+
+    def upper_bound(self, index):
+        """Límite superior (exclusivo) del intervalo `index`"""
+        exponent, sub = divmod(index, HISTOGRAM_SUB_BUCKETS)
+        if exponent == 0:
+            return self.lowest
+        return self.lowest * 2.0 ** (exponent - 1) * (1 + (sub + 1) / HISTOGRAM_SUB_BUCKETS)
+
+    def quantile(self, q):
+        """Cuantil aproximado (límite superior de su intervalo), o None sin datos"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= target:
+                return self.upper_bound(i)
+        return self.upper_bound(len(self.counts) - 1)
+
+    def cumulative(self):
+        """Cuentas acumuladas en cada potencia de 2: [(le, cuenta)], para Prometheus"""
+        buckets = []
+        seen = sum(self.counts[:HISTOGRAM_SUB_BUCKETS])
+        buckets.append((self.lowest, seen))
+        for exponent in range(1, self.exponents + 1):
+            lo = exponent * HISTOGRAM_SUB_BUCKETS
+            seen += sum(self.counts[lo:lo + HISTOGRAM_SUB_BUCKETS])
+            buckets.append((self.lowest * 2.0 ** exponent, seen))
+        return buckets
+
+    def summary(self):
+        """Resumen en dict (benchmarks y depuración)"""
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'p999': self.quantile(0.999)
+        }
+
+
+class MetricFamily:
+    """Métrica con nombre y etiquetas; cada combinación de valores es una serie"""
+
+    def __init__(self, name, help, kind, labelnames=(), factory=None, callback=None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.callback = callback   # Alternativa: fn() -> {valores de etiquetas: valor} leída al exportar
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.children[values] = self.factory()
+        return child
+
+    def _label_text(self, values, extra=None):
+        pairs = [f'{k}="{v}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.callback is not None:
+            for values, value in self.callback().items():
+                lines.append(f"{self.name}{self._label_text(values)} {value}")
+            return lines
+        for values, child in list(self.children.items()):
+            if self.kind == 'histogram':
+                buckets = [(f"{le:.9g}", count) for le, count in child.cumulative()]
+                buckets.append(("+Inf", child.count))
+                for le, count in buckets:
+                    labels = self._label_text(values, 'le="%s"' % le)
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{self._label_text(values)} {child.sum}")
+                lines.append(f"{self.name}_count{self._label_text(values)} {child.count}")
+            else:
+                lines.append(f"{self.name}{self._label_text(values)} {child.value}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso, exportado en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def _register(self, family):
+        with self.lock:
+            existing = self.families.get(family.name)
+            if existing is not None:
+                return existing
+            self.families[family.name] = family
+            return family
+
+    def counter(self, name, help, labels=(), callback=None):
+        return self._register(MetricFamily(name, help, 'counter', labels, Counter, callback))
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self._register(MetricFamily(name, help, 'gauge', labels, Gauge, callback))
+
+    def histogram(self, name, help, labels=()):
+        return self._register(MetricFamily(name, help, 'histogram', labels, Histogram))
+
+    def render(self):
+        lines = []
+        for family in list(self.families.values()):
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Registro global del proceso
+registry = MetricsRegistry()
+
+# Errores de la ingesta y la API (antes sólo se imprimían con DEBUG)
+ERRORS = registry.counter('predict_errors_total', "Errores capturados por componente", ('component',))
@@ -0,0 +1,334 @@
+# online_predictor.py
+
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from config import (ONLINE_PREDICTORS, RLS_FORGETTING, KALMAN_OBS_NOISE, KALMAN_LEVEL_NOISE, KALMAN_TREND_NOISE,
+                    PREDICTION_MIN_TICKS, PREDICTION_HORIZONS, PREDICTION_CONFIDENCE_Z, MODELS_DIR, DEBUG)
+from metrics import registry
+
+# Estado de los modelos online guardado por OnlineModels.save() y leído al arrancar
+CHECKPOINT_PATH = os.path.join(MODELS_DIR, 'online_models.json')
+CHECKPOINT_VERSION = 1
+# Hueco entre ticks a partir del cual el estado ya no sirve y el modelo se reinicia
+RESET_GAP_MS = 5 * 60 * 1000
+# Covarianza inicial (y máxima) del RLS: recta aún sin ajustar
+RLS_INITIAL_COVARIANCE = 1e4
+
+ONLINE_PREDICT_SECONDS = registry.histogram(
+    'predict_online_seconds', "Tiempo de una pasada de un predictor online", ('kind',))
+
+
+class RLSModel:
+    """
+    Recta precio = nivel + pendiente * t por mínimos cuadrados recursivos
+    con factor de olvido `forgetting` por tick (memoria ~1/(1-λ) ticks).
+
+    Tras cada tick el origen de t se desplaza a ese tick, así el nivel es
+    el precio ajustado en el último trade y predecir a h segundos es
+    nivel + pendiente * h. La covarianza se acota a su valor inicial para
+    que no se dispare en ráfagas de trades del mismo milisegundo.
+    """
+
+    KIND = 'rls'
+    STATE = ('level', 'slope', 'p00', 'p01', 'p11', 'variance', 'last_ts', 'count')
+    __slots__ = STATE + ('forgetting',)
+
+    def __init__(self, forgetting=RLS_FORGETTING):
+        self.forgetting = forgetting
+        self.reset()
+
+    def reset(self, timestamp=None, price=0.0):
+        self.level = price
+        self.slope = 0.0
+        self.p00 = self.p11 = RLS_INITIAL_COVARIANCE
+        self.p01 = 0.0
+        self.variance = 0.0   # Varianza exponencial del error a un tick
+        self.last_ts = timestamp
+        self.count = 0 if timestamp is None else 1
+
+    def update_many(self, timestamps, prices):
+        """Absorbe ticks en orden en O(1) cada uno; ignora los anteriores al último ya visto"""
+        lam = self.forgetting
+        cap = RLS_INITIAL_COVARIANCE
+        level, slope, p00, p01, p11 = self.level, self.slope, self.p00, self.p01, self.p11
+        variance, last_ts, count = self.variance, self.last_ts, self.count
+        for timestamp, price in zip(timestamps, prices):
+            if last_ts is None or timestamp - last_ts > RESET_GAP_MS:
+                level, slope, p00, p01, p11, variance = price, 0.0, cap, 0.0, cap, 0.0
+                last_ts, count = timestamp, 1
+                continue
+            if timestamp < last_ts:
+                continue
+            dt = (timestamp - last_ts) * 0.001
+            error = price - level - slope * dt
+            g0 = p00 + p01 * dt
+            g1 = p01 + p11 * dt
+            denom = lam + g0 + g1 * dt
+            k0 = g0 / denom
+            k1 = g1 / denom
+            level += k0 * error
+            slope += k1 * error
+            p00 = (p00 - k0 * g0) / lam
+            p01 = (p01 - k0 * g1) / lam
+            p11 = (p11 - k1 * g1) / lam
+            count += 1
+            # Durante el calentamiento, media simple de los errores vistos
+            variance += max(1.0 - lam, 1.0 / count) * (error * error - variance)
+            # Origen de t en el tick actual
+            level += slope * dt
+            p00 += dt * (2.0 * p01 + dt * p11)
+            p01 += dt * p11
+            peak = p00 if p00 > p11 else p11
+            if peak > cap:
+                scale = cap / peak
+                p00 *= scale
+                p01 *= scale
+                p11 *= scale
+            last_ts = timestamp
+        self.level, self.slope, self.p00, self.p01, self.p11 = level, slope, p00, p01, p11
+        self.variance, self.last_ts, self.count = variance, last_ts, count
+
+    def forecast(self, horizons):
+        """(precios, desviaciones típicas) a `horizons` segundos del último tick"""
+        prices = [self.level + self.slope * h for h in horizons]
+        stds = [math.sqrt(self.variance * (1.0 + self.p00 + h * (2.0 * self.p01 + h * self.p11)))
+                for h in horizons]
+        return prices, stds
+
+
+class KalmanTrendModel:
+    """
+    Filtro de Kalman de tendencia local lineal: estado (nivel, pendiente)
+    con ruido de nivel (paseo aleatorio) y de pendiente (aceleración
+    blanca), ambos escalados por el tiempo entre ticks, y ruido de
+    observación para el rebote bid/ask. Los ruidos son relativos al precio
+    (se fijan con el primer tick). O(1) por tick.
+    """
+
+    KIND = 'kalman'
+    STATE = ('level', 'slope', 'p00', 'p01', 'p11', 'obs_var', 'level_var', 'trend_var', 'last_ts', 'count')
+    __slots__ = STATE + ('obs_noise', 'level_noise', 'trend_noise')
+
+    def __init__(self, obs_noise=KALMAN_OBS_NOISE, level_noise=KALMAN_LEVEL_NOISE, trend_noise=KALMAN_TREND_NOISE):
+        self.obs_noise = obs_noise
+        self.level_noise = level_noise
+        self.trend_noise = trend_noise
+        self.reset()
+
+    def reset(self, timestamp=None, price=0.0):
+        self.obs_var = (price * self.obs_noise) ** 2
+        self.level_var = (price * self.level_noise) ** 2     # Por segundo
+        self.trend_var = (price * self.trend_noise) ** 2     # Por segundo³
+        self.level = price
+        self.slope = 0.0
+        self.p00 = self.obs_var
+        self.p01 = 0.0
+        self.p11 = self.level_var   # Pendiente inicial: del orden de un paso de nivel por segundo
+        self.last_ts = timestamp
+        self.count = 0 if timestamp is None else 1
+
+    def update_many(self, timestamps, prices):
+        """Absorbe ticks en orden en O(1) cada uno; ignora los anteriores al último ya visto"""
+        level, slope, p00, p01, p11 = self.level, self.slope, self.p00, self.p01, self.p11
+        obs_var, level_var, trend_var = self.obs_var, self.level_var, self.trend_var
+        last_ts, count = self.last_ts, self.count
+        for timestamp, price in zip(timestamps, prices):
+            if last_ts is None or timestamp - last_ts > RESET_GAP_MS:
+                self.reset(timestamp, price)
+                level, slope, p00, p01, p11 = self.level, self.slope, self.p00, self.p01, self.p11
+                obs_var, level_var, trend_var = self.obs_var, self.level_var, self.trend_var
+                last_ts, count = timestamp, 1
+                continue
+            if timestamp < last_ts:
+                continue
+            dt = (timestamp - last_ts) * 0.001
+            if dt:
+                # Predicción: F = [[1, dt], [0, 1]], Q según dt
+                level += slope * dt
+                p00 += dt * (2.0 * p01 + dt * p11) + dt * (level_var + trend_var * dt * dt / 3.0)
+                p01 += dt * (p11 + trend_var * dt / 2.0)
+                p11 += trend_var * dt
+            error = price - level
+            s = p00 + obs_var
+            k0 = p00 / s
+            k1 = p01 / s
+            level += k0 * error
+            slope += k1 * error
+            p11 -= k1 * p01
+            p01 -= k0 * p01
+            p00 -= k0 * p00
+            last_ts = timestamp
+            count += 1
+        self.level, self.slope, self.p00, self.p01, self.p11 = level, slope, p00, p01, p11
+        self.last_ts, self.count = last_ts, count
+
+    def forecast(self, horizons):
+        """(precios, desviaciones típicas) a `horizons` segundos del último tick"""
+        prices = [self.level + self.slope * h for h in horizons]
+        stds = [math.sqrt(self.p00 + h * (2.0 * self.p01 + h * self.p11)
+                          + h * (self.level_var + self.trend_var * h * h / 3.0) + self.obs_var)
+                for h in horizons]
+        return prices, stds
+
+
+MODEL_TYPES = {model.KIND: model for model in (RLSModel, KalmanTrendModel)}
+
+
+class OnlineModels:
+    """
+    Modelos online de todos los símbolos, alimentados por DataBuffer con
+    cada tick aceptado (`kinds`, ver MODEL_TYPES). El estado se guarda
+    con save() y se recupera con load(); como los modelos ignoran ticks
+    anteriores al último absorbido, el warm start desde disco tras
+    cargar un checkpoint sólo aplica lo que llegó después.
+    """
+
+    def __init__(self, kinds=ONLINE_PREDICTORS):
+        unknown = set(kinds) - set(MODEL_TYPES)
+        if unknown:
+            raise ValueError(f"Modelos online desconocidos: {', '.join(sorted(unknown))}")
+        self.kinds = tuple(kinds)
+        self.symbols = {}
+        self.lock = threading.Lock()   # Escritores y lecturas del estado
+
+    def _models(self, symbol_key):
+        models = self.symbols.get(symbol_key)
+        if models is None:
+            models = self.symbols[symbol_key] = {kind: MODEL_TYPES[kind]() for kind in self.kinds}
+        return models
+
+    def update(self, symbol, timestamp, price):
+        if not self.kinds:
+            return
+        with self.lock:
+            for model in self._models(symbol.upper()).values():
+                model.update_many((timestamp,), (price,))
+
+    def update_many(self, symbol, timestamps, prices):
+        if not self.kinds or not len(timestamps):
+            return
+        if isinstance(timestamps, np.ndarray):
+            timestamps = timestamps.tolist()
+        if isinstance(prices, np.ndarray):
+            prices = prices.tolist()
+        with self.lock:
+            for model in self._models(symbol.upper()).values():
+                model.update_many(timestamps, prices)
+
+    def forecast(self, symbol, kind, horizons, now_ms=None, min_ticks=PREDICTION_MIN_TICKS):
+        """
+        Predicción del modelo `kind` a `horizons` segundos de `now_ms` (por
+        defecto, del último tick absorbido): (precios, desviaciones típicas),
+        o None si el modelo no ha visto `min_ticks` ticks.
+        """
+        model = self.symbols.get(symbol.upper(), {}).get(kind)
+        if model is None:
+            return None
+        with self.lock:
+            if model.count < min_ticks:
+                return None
+            offset = 0.0 if now_ms is None else max(now_ms - model.last_ts, 0) * 0.001
+            return model.forecast([h + offset for h in horizons])
+
+    def state(self):
+        """Estado serializable {kind: {symbol: {campo: valor}}}"""
+        with self.lock:
+            state = {kind: {} for kind in self.kinds}
+            for symbol_key, models in self.symbols.items():
+                for kind, model in models.items():
+                    if model.last_ts is not None:
+                        state[kind][symbol_key] = {name: getattr(model, name) for name in model.STATE}
+            return state
+
+    def save(self, path=CHECKPOINT_PATH):
+        """Guarda el estado (escritura atómica); devuelve el nº de modelos guardados"""
+        state = self.state()
+        saved = sum(len(models) for models in state.values())
+        if not saved:
+            return 0   # No pisar un checkpoint anterior con un estado vacío
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': CHECKPOINT_VERSION, 'saved_at': int(time.time() * 1000), 'models': state}, f)
+        os.replace(tmp, path)
+        return saved
+
+    def load(self, path=CHECKPOINT_PATH):
+        """Recupera el estado guardado por save(); devuelve el nº de modelos cargados"""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            if DEBUG:
+                print(f"Error loading online models: {e}")
+            return 0
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            return 0
+        loaded = 0
+        with self.lock:
+            for kind, symbols in checkpoint.get('models', {}).items():
+                if kind not in self.kinds:
+                    continue
+                for symbol_key, fields in symbols.items():
+                    model = self._models(symbol_key)[kind]
+                    for name in model.STATE:
+                        if name in fields:
+                            setattr(model, name, fields[name])
+                    loaded += 1
+        if DEBUG:
+            print(f"Loaded {loaded} online models from {path}")
+        return loaded
+
+
+class OnlinePredictor:
+    """
+    Un modelo online con la interfaz de BatchPredictor (window_for,
+    predict, predict_curve), para usarlo en el scheduler, el backtest o
+    los benchmarks en lugar del ajuste por ventana. Las ventanas sólo
+    aportan el instante de la predicción: el estado ya está en `models`.
+    """
+
+    def __init__(self, models, kind, min_ticks=PREDICTION_MIN_TICKS, z=PREDICTION_CONFIDENCE_Z):
+        if kind not in models.kinds:
+            raise ValueError(f"El modelo online '{kind}' no se actualiza en la ingesta")
+        self.models = models
+        self.kind = kind
+        self.min_ticks = min_ticks
+        self.z = z
+
+    def window_for(self, symbol=None):
+        """Sólo hace falta el último tick"""
+        return 1
+
+    def predict(self, windows, future_seconds=60, symbols=None):
+        curves, _ = self.predict_curve(windows, [future_seconds], symbols)
+        return curves[:, 0]
+
+    def predict_curve(self, windows, horizons=PREDICTION_HORIZONS, symbols=None):
+        """Como BatchPredictor.predict_curve: (curva, banda) con NaN en los símbolos sin modelo listo"""
+        if symbols is None:
+            raise ValueError("OnlinePredictor necesita los símbolos de las ventanas")
+        started = time.perf_counter()
+        curves = np.full((len(windows), len(horizons)), np.nan)
+        bands = np.full((len(windows), len(horizons)), np.nan)
+        for i, (symbol, window) in enumerate(zip(symbols, windows)):
+            now_ms = int(window.timestamp[-1]) if window is not None and len(window) else None
+            result = self.models.forecast(symbol, self.kind, horizons, now_ms, self.min_ticks)
+            if result is not None:
+                curves[i] = result[0]
+                bands[i] = result[1]
+        bands *= self.z
+        ONLINE_PREDICT_SECONDS.labels(self.kind).record(time.perf_counter() - started)
+        return curves, bands
+
+    def predict_symbols(self, buffer, symbols, future_seconds=60):
+        windows = [buffer.get_window(symbol, 1) for symbol in symbols]
+        return self.predict(windows, future_seconds, symbols)
@@ -0,0 +1,329 @@
+# order_book.py
+
+from array import array
+from bisect import bisect_left
+from collections import deque
+import threading
+import time
+
+import numpy as np
+
+from config import (BINANCE_DEPTH_URL, DEPTH_SNAPSHOT_LIMIT, DEPTH_MAX_LEVELS, DEPTH_BUFFER_EVENTS,
+                    BOOK_FEATURE_LEVELS, DEBUG)
+from metrics import registry, ERRORS
+
+# Reintentos del snapshot de resincronización (espera exponencial desde 1 s)
+SNAPSHOT_RETRIES = 5
+
+DEPTH_EVENTS = registry.counter('predict_depth_events_total', "Diffs de profundidad recibidos", ('symbol',))
+DEPTH_GAPS = registry.counter(
+    'predict_depth_gaps_total', "Huecos de secuencia en el stream de profundidad", ('symbol',))
+DEPTH_RESYNCS = registry.counter('predict_depth_resyncs_total', "Snapshots REST aplicados", ('symbol',))
+DEPTH_APPLY_SECONDS = registry.histogram('predict_depth_apply_seconds', "Tiempo de aplicar un diff de profundidad")
+
+
+def fetch_depth_snapshot(symbol, limit=DEPTH_SNAPSHOT_LIMIT, base_url=BINANCE_DEPTH_URL):
+    """Snapshot REST del libro ({'lastUpdateId', 'bids', 'asks'}); `base_url` puede apuntar a FakeBinanceREST"""
+    import httpx
+
+    response = httpx.get(f"{base_url.rstrip('/')}/depth", params={'symbol': symbol.upper(), 'limit': limit},
+                         timeout=10.0)
+    response.raise_for_status()
+    return response.json()
+
+
+class BookSide:
+    """
+    Un lado del libro en dos arrays compactos de doubles (claves y
+    cantidades) ordenados. La clave es el precio (bids) o su negativo
+    (asks), en orden ascendente, así el mejor nivel queda al final y los
+    cambios cerca del mejor precio (los habituales) apenas desplazan
+    memoria. Localizar un nivel es O(log n) con bisect; un diff trae pocas
+    decenas de niveles, así que se aplica nivel a nivel sin pasar por NumPy.
+    """
+
+    __slots__ = ('sign', 'keys', 'qtys', 'capacity')
+
+    def __init__(self, bid, capacity=DEPTH_MAX_LEVELS):
+        self.sign = 1.0 if bid else -1.0
+        self.capacity = int(capacity)
+        self.keys = array('d')
+        self.qtys = array('d')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def load(self, levels):
+        """Sustituye el lado por los niveles [[precio, cantidad], ...] de un snapshot"""
+        sign = self.sign
+        parsed = sorted((sign * float(price), float(qty)) for price, qty in levels if float(qty) > 0)
+        parsed = parsed[-self.capacity:]
+        self.keys = array('d', [key for key, _ in parsed])
+        self.qtys = array('d', [qty for _, qty in parsed])
+
+    def clear(self):
+        self.keys = array('d')
+        self.qtys = array('d')
+
+    def apply(self, levels):
+        """Aplica los niveles de un diff (cantidad absoluta; 0 borra el nivel)"""
+        keys, qtys, sign = self.keys, self.qtys, self.sign
+        for price, qty in levels:
+            key = sign * float(price)
+            qty = float(qty)
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                if qty:
+                    qtys[i] = qty
+                else:
+                    del keys[i]
+                    del qtys[i]
+            elif qty:
+                keys.insert(i, key)
+                qtys.insert(i, qty)
+        excess = len(keys) - self.capacity
+        if excess > 0:
+            # Se descartan los niveles más alejados del mejor precio
+            del keys[:excess]
+            del qtys[:excess]
+
+    def best(self):
+        """(precio, cantidad) del mejor nivel o None"""
+        if not self.keys:
+            return None
+        return self.sign * self.keys[-1], self.qtys[-1]
+
+    def depth(self, levels):
+        """Cantidad total de los `levels` mejores niveles"""
+        return sum(self.qtys[-levels:])
+
+    def top(self, levels):
+        """Copia de los `levels` mejores niveles como array (n x 2), del mejor al peor"""
+        n = min(levels, len(self.keys))
+        top = np.empty((n, 2))
+        if n:
+            top[:, 0] = np.frombuffer(self.keys[-n:], dtype=np.float64)[::-1] * self.sign
+            top[:, 1] = np.frombuffer(self.qtys[-n:], dtype=np.float64)[::-1]
+        return top
+
+
+class OrderBook:
+    """
+    Libro L2 de un símbolo mantenido con el stream de diffs de profundidad.
+
+    Sigue el procedimiento de Binance: los diffs se retienen hasta que
+    llega un snapshot REST, se descartan los anteriores a su
+    lastUpdateId y a partir de ahí cada diff debe encadenar con el
+    anterior (pu == u previo en futuros, U == u previo + 1 en spot). Un
+    hueco vacía el libro y pide otro snapshot.
+
+    Tras cada diff se publica `features`, un dict nuevo (no se modifica
+    después), así los lectores lo usan sin locks ni copias del libro.
+    """
+
+    def __init__(self, symbol, capacity=DEPTH_MAX_LEVELS, levels=BOOK_FEATURE_LEVELS,
+                 buffer_events=DEPTH_BUFFER_EVENTS):
+        self.symbol = symbol.upper()
+        self.bids = BookSide(True, capacity)
+        self.asks = BookSide(False, capacity)
+        self.levels = levels
+        self.last_update_id = None   # None = sin sincronizar (esperando snapshot)
+        self.first = False           # El siguiente diff es el primero tras el snapshot
+        self.pending = deque(maxlen=buffer_events)
+        self.event_time = None
+        self.gaps = 0
+        self.resyncs = 0
+        self.features = None
+        self.lock = threading.Lock()
+
+    @property
+    def synced(self):
+        return self.last_update_id is not None
+
+    def _reset(self):
+        self.bids.clear()
+        self.asks.clear()
+        self.last_update_id = None
+        self.features = None
+
+    def on_event(self, event):
+        """
+        Procesa un diff (payload depthUpdate). Devuelve 'ok', 'stale'
+        (anterior al libro), 'buffered' (sin snapshot aún) o 'resync'
+        (hueco de secuencia: hace falta otro snapshot).
+        """
+        if self.last_update_id is None:
+            self.pending.append(event)
+            return 'buffered'
+        return self._apply(event)
+
+    def _apply(self, event):
+        first_id, last_id = event['U'], event['u']
+        if last_id < self.last_update_id:
+            return 'stale'
+        if self.first:
+            chained = first_id <= self.last_update_id + 1
+        elif 'pu' in event:
+            chained = event['pu'] == self.last_update_id
+        else:
+            chained = first_id == self.last_update_id + 1
+        if not chained:
+            self.gaps += 1
+            if DEBUG:
+                print(f"Depth gap for {self.symbol}: {self.last_update_id} -> {first_id}. Resyncing.")
+            self._reset()
+            self.pending.append(event)
+            return 'resync'
+
+        self.bids.apply(event['b'])
+        self.asks.apply(event['a'])
+        self.last_update_id = last_id
+        self.first = False
+        self.event_time = event.get('T') or event.get('E')
+        self._publish()
+        return 'ok'
+
+    def load_snapshot(self, snapshot):
+        """
+        Aplica un snapshot REST y los diffs retenidos posteriores. Devuelve
+        'ok', o 'resync' si el snapshot es anterior al primer diff retenido
+        o los retenidos tienen un hueco.
+        """
+        snapshot_id = snapshot['lastUpdateId']
+        pending = [event for event in self.pending if event['u'] >= snapshot_id]
+        if pending and pending[0]['U'] > snapshot_id + 1:
+            return 'resync'   # Snapshot demasiado antiguo: faltan diffs entre él y los retenidos
+        self.pending.clear()
+        self.bids.load(snapshot['bids'])
+        self.asks.load(snapshot['asks'])
+        self.last_update_id = snapshot_id
+        self.first = True
+        self.event_time = snapshot.get('T') or snapshot.get('E') or self.event_time
+        self.resyncs += 1
+        self._publish()
+        for i, event in enumerate(pending):
+            if self._apply(event) == 'resync':
+                self.pending.extend(pending[i + 1:])
+                return 'resync'
+        return 'ok'
+
+    def _publish(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            self.features = None
+            return
+        (bid_price, bid_qty), (ask_price, ask_qty) = bid, ask
+        bid_depth, ask_depth = self.bids.depth(self.levels), self.asks.depth(self.levels)
+        total = bid_depth + ask_depth
+        mid = (bid_price + ask_price) / 2
+        self.features = {
+            'symbol': self.symbol,
+            'update_id': self.last_update_id,
+            'event_time': self.event_time,
+            'best_bid': bid_price,
+            'best_ask': ask_price,
+            'bid_qty': bid_qty,
+            'ask_qty': ask_qty,
+            'mid': mid,
+            'spread': ask_price - bid_price,
+            'spread_bps': (ask_price - bid_price) / mid * 1e4,
+            # Precio medio ponderado por la cantidad del lado contrario
+            'microprice': (bid_price * ask_qty + ask_price * bid_qty) / (bid_qty + ask_qty),
+            'imbalance': (bid_depth - ask_depth) / total if total else 0.0,
+            'levels': self.levels
+        }
+
+    def snapshot(self, levels=20):
+        """Copia de los `levels` mejores niveles por lado y las features, o None sin sincronizar"""
+        with self.lock:
+            if self.features is None:
+                return None
+            return {'features': self.features, 'bids': self.bids.top(levels), 'asks': self.asks.top(levels)}
+
+
+class OrderBooks:
+    """
+    Libros de todos los símbolos con profundidad. on_depth() se llama
+    desde el hilo de la ingesta WS; los snapshots de resincronización se
+    piden en un hilo aparte (uno por símbolo a la vez) para no bloquearla.
+    `snapshot_fn(symbol)` es intercambiable (tests, FakeBinanceREST).
+    """
+
+    def __init__(self, snapshot_fn=None, capacity=DEPTH_MAX_LEVELS, levels=BOOK_FEATURE_LEVELS,
+                 buffer_events=DEPTH_BUFFER_EVENTS, retries=SNAPSHOT_RETRIES):
+        self.snapshot_fn = snapshot_fn or fetch_depth_snapshot
+        self.capacity = capacity
+        self.levels = levels
+        self.buffer_events = buffer_events
+        self.retries = retries
+        self.books = {}
+        self.resyncing = set()
+        self.lock = threading.Lock()
+
+    def _book(self, symbol_key):
+        book = self.books.get(symbol_key)
+        if book is None:
+            with self.lock:
+                book = self.books.get(symbol_key)
+                if book is None:
+                    book = self.books[symbol_key] = OrderBook(symbol_key, self.capacity, self.levels,
+                                                              self.buffer_events)
+        return book
+
+    def on_depth(self, symbol, event):
+        symbol_key = symbol.upper()
+        book = self._book(symbol_key)
+        started = time.perf_counter()
+        with book.lock:
+            status = book.on_event(event)
+        DEPTH_APPLY_SECONDS.labels().record(time.perf_counter() - started)
+        DEPTH_EVENTS.labels(symbol_key).inc()
+        if status == 'resync':
+            DEPTH_GAPS.labels(symbol_key).inc()
+        if status in ('buffered', 'resync'):
+            self._request_snapshot(symbol_key)
+        return status
+
+    def _request_snapshot(self, symbol_key):
+        with self.lock:
+            if symbol_key in self.resyncing:
+                return
+            self.resyncing.add(symbol_key)
+        threading.Thread(target=self.resync, args=(symbol_key,), daemon=True).start()
+
+    def resync(self, symbol_key):
+        """Pide snapshots hasta sincronizar el libro (o agotar los reintentos)"""
+        book = self._book(symbol_key)
+        try:
+            for attempt in range(self.retries):
+                try:
+                    snapshot = self.snapshot_fn(symbol_key)
+                except Exception as e:
+                    ERRORS.labels('depth_snapshot').inc()
+                    if DEBUG:
+                        print(f"Error fetching depth snapshot for {symbol_key}: {str(e)[:100]}")
+                    time.sleep(2 ** attempt)
+                    continue
+                with book.lock:
+                    status = book.load_snapshot(snapshot)
+                if status == 'ok':
+                    DEPTH_RESYNCS.labels(symbol_key).inc()
+                    return True
+                DEPTH_GAPS.labels(symbol_key).inc()
+            return False
+        finally:
+            with self.lock:
+                self.resyncing.discard(symbol_key)
+
+    def features(self, symbol):
+        """Últimas features del libro (dict de sólo lectura) o None si no está sincronizado"""
+        book = self.books.get(symbol.upper())
+        return book.features if book is not None else None
+
+    def snapshot(self, symbol, levels=20):
+        book = self.books.get(symbol.upper())
+        return book.snapshot(levels) if book is not None else None
+
+
+# Instancia global, alimentada por BinanceWSClient con DEPTH_ENABLED
+order_books = OrderBooks()
@@ -1,46 +1,251 @@
 # prediction_buffer.py
 
+from bisect import bisect_right
 from collections import deque
+from itertools import islice
 import threading
+import time
+import numpy as np
+from config import PREDICTION_HISTORY, PREDICTION_HORIZONS
+from metrics import registry
+
+MATCH_WINDOW_MS = 30000
+# Compactar las listas cuando la parte expirada supera este tamaño
+COMPACT_THRESHOLD = 1024
+# Cambios (altas y emparejamientos) que se conservan para clientes en streaming
+CHANGELOG_MAXLEN = 4096
+
+MATCH_SECONDS = registry.histogram(
+    'predict_match_seconds', "Tiempo de emparejar un tick con las predicciones pendientes")
+PREDICTIONS_ADDED = registry.counter('predict_predictions_added_total', "Predicciones añadidas", ('symbol',))
+PREDICTIONS_MATCHED = registry.counter(
+    'predict_predictions_matched_total', "Predicciones resueltas con un precio real", ('symbol',))
+
+
+class _SymbolPredictions:
+    """Predicciones de un símbolo ordenadas por timestamp objetivo"""
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.timestamps = []
+        self.entries = []
+        self.head = 0      # Primer elemento vivo (los anteriores han expirado)
+        self.matched = 0   # Todo lo anterior a este índice ya está emparejado
+        self.seq = 0       # Número de cambios (altas + emparejamientos)
+        self.changes = deque(maxlen=CHANGELOG_MAXLEN)
+
+    def __len__(self):
+        return len(self.entries) - self.head
+
+    def add(self, entry):
+        pos = bisect_right(self.timestamps, entry['timestamp'], lo=self.head)
+        self.timestamps.insert(pos, entry['timestamp'])
+        self.entries.insert(pos, entry)
+        if pos < self.matched:
+            self.matched = pos
+        self._record(entry)
+        if len(self) > self.maxlen:
+            self._advance(self.head + 1)
+
+    def match(self, timestamp, price):
+        # Un tick resuelve las predicciones con objetivo en (timestamp - ventana, timestamp]:
+        # el primer precio en o tras el objetivo, nunca antes (horizontes cortos)
+        lo = bisect_right(self.timestamps, timestamp - MATCH_WINDOW_MS, lo=self.head)
+        hi = bisect_right(self.timestamps, timestamp, lo=lo)
+        matched = []
+        for i in range(max(lo, self.matched), hi):
+            entry = self.entries[i]
+            if entry['actual_price'] is None:
+                entry['actual_price'] = price
+                matched.append(entry)
+                self._record(entry)
+        # Las predicciones por debajo de `hi` ya tienen precio o quedan fuera
+        # de la ventana para siempre (los ticks llegan en orden)
+        self.matched = max(self.matched, hi)
+        return matched
+
+    def match_many(self, timestamps, prices):
+        """
+        Igual que llamar a match() con cada tick del lote en orden: cada
+        predicción pendiente con objetivo hasta el último tick se resuelve
+        con el primer tick en o tras su objetivo (búsqueda binaria).
+        """
+        if not len(timestamps):
+            return []
+        hi = bisect_right(self.timestamps, int(timestamps[-1]), lo=self.head)
+        lo = max(self.matched, self.head)
+        matched = []
+        if lo < hi:
+            targets = np.asarray(self.timestamps[lo:hi], dtype=np.int64)
+            idx = np.searchsorted(timestamps, targets, side='left')
+            # Fuera de la ventana: el primer tick tras el objetivo llegó demasiado tarde
+            valid = timestamps[idx] < targets + MATCH_WINDOW_MS
+            for entry, j, ok in zip(self.entries[lo:hi], idx.tolist(), valid.tolist()):
+                if ok and entry['actual_price'] is None:
+                    entry['actual_price'] = float(prices[j])
+                    matched.append(entry)
+                    self._record(entry)
+        self.matched = max(self.matched, hi)
+        return matched
+
+    def _record(self, entry):
+        self.seq += 1
+        self.changes.append(entry)
+
+    def changes_since(self, seq):
+        """Entradas añadidas o emparejadas después de `seq` (con hueco si se perdieron)"""
+        new = self.seq - seq
+        if new <= 0:
+            return [], False
+        gap = new > len(self.changes)
+        start = max(len(self.changes) - new, 0)
+        return list(islice(self.changes, start, None)), gap
+
+    def expire(self, cutoff_ms):
+        """Descarta las predicciones con timestamp <= cutoff_ms"""
+        self._advance(bisect_right(self.timestamps, cutoff_ms, lo=self.head))
+
+    def _advance(self, head):
+        self.head = head
+        self.matched = max(self.matched, head)
+        if self.head >= COMPACT_THRESHOLD and self.head * 2 >= len(self.entries):
+            del self.timestamps[:self.head]
+            del self.entries[:self.head]
+            self.matched -= self.head
+            self.head = 0
+
+    def live(self):
+        return self.entries[self.head:]
+
 
 class PredictionBuffer:
-    """Almacena predicciones para comparación con precios reales"""
-    
-    def __init__(self, maxlen=100):
-        self.buffer = deque(maxlen=maxlen)
+    """
+    Almacena predicciones para comparación con precios reales.
+
+    Cada símbolo tiene su propio almacén ordenado por timestamp objetivo:
+    emparejar un tick cuesta O(log n + k) y expirar sólo avanza un puntero.
+    """
+
+    def __init__(self, maxlen=100, max_age_ms=None):
+        self.maxlen = maxlen
+        self.max_age_ms = max_age_ms
+        self.stores = {}
+        self.curves = {}   # Última curva completa de cada símbolo
         self.lock = threading.Lock()
-        
+
+    def _store(self, symbol):
+        store = self.stores.get(symbol)
+        if store is None:
+            store = self.stores[symbol] = _SymbolPredictions(self.maxlen)
+        return store
+
     def add_prediction(self, timestamp, predicted_price, symbol):
         """Añade una nueva predicción"""
         with self.lock:
-            self.buffer.append({
+            self._store(symbol).add({
                 'timestamp': timestamp,
                 'predicted_price': predicted_price,
                 'symbol': symbol,
                 'actual_price': None
             })
-            
+        PREDICTIONS_ADDED.labels(symbol).inc()
+
+    def add_curve(self, symbol, made_at, horizons, prices, bands=None):
+        """
+        Añade de una vez todas las predicciones de una curva hecha en
+        `made_at` (ms): una entrada por horizonte (segundos) con su banda
+        de confianza [lower, upper]. Se emparejan como cualquier otra.
+        """
+        entries = []
+        for i, horizon in enumerate(horizons):
+            price = float(prices[i])
+            band = float(bands[i]) if bands is not None else 0.0
+            entries.append({
+                'timestamp': made_at + int(horizon * 1000),
+                'predicted_price': price,
+                'symbol': symbol,
+                'actual_price': None,
+                'horizon': horizon,
+                'made_at': made_at,
+                'lower': price - band,
+                'upper': price + band
+            })
+        with self.lock:
+            store = self._store(symbol)
+            for entry in entries:
+                store.add(entry)
+            self.curves[symbol] = entries
+        PREDICTIONS_ADDED.labels(symbol).inc(len(entries))
+        return entries
+
+    def get_curve(self, symbol):
+        """Entradas de la última curva del símbolo, por horizonte creciente"""
+        return self.curves.get(symbol, [])
+
     def match_actual_price(self, tick):
-        """Empareja con predicciones en una ventana de ±30 segundos"""
+        """
+        Empareja con las predicciones cuyo objetivo ya llegó hace menos de
+        30 segundos. Devuelve la lista de predicciones resueltas por este tick.
+        """
+        started = time.perf_counter()
         with self.lock:
-            for prediction in self.buffer:
-                if (prediction['symbol'] == tick['symbol'] and 
-                    abs(prediction['timestamp'] - tick['timestamp']) < 30000 and
-                    prediction['actual_price'] is None):
-                    
-                    prediction['actual_price'] = tick['price']
-                    return prediction
-        return None
-        
+            store = self.stores.get(tick['symbol'])
+            if store is None:
+                return []
+            if self.max_age_ms is not None:
+                store.expire(tick['timestamp'] - self.max_age_ms)
+            matched = store.match(tick['timestamp'], tick['price'])
+        if matched:
+            PREDICTIONS_MATCHED.labels(tick['symbol']).inc(len(matched))
+        MATCH_SECONDS.labels().record(time.perf_counter() - started)
+        return matched
+
+    def match_actual_prices(self, symbol, timestamps, prices):
+        """
+        Empareja un lote de ticks del símbolo (en orden cronológico) como
+        match_actual_price tick a tick. Devuelve las predicciones resueltas.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if not len(timestamps):
+            return []
+        started = time.perf_counter()
+        with self.lock:
+            store = self.stores.get(symbol)
+            if store is None:
+                return []
+            if self.max_age_ms is not None:
+                store.expire(int(timestamps[0]) - self.max_age_ms)
+            matched = store.match_many(timestamps, prices)
+        if matched:
+            PREDICTIONS_MATCHED.labels(symbol).inc(len(matched))
+        MATCH_SECONDS.labels().record(time.perf_counter() - started)
+        return matched
+
     def get_predictions(self, symbol):
         """Obtiene todas las predicciones para un símbolo"""
         with self.lock:
-            return [p for p in self.buffer if p['symbol'] == symbol]
-            
+            store = self.stores.get(symbol)
+            return store.live() if store is not None else []
+
+    def get_sequence(self, symbol):
+        """Número de cambios del símbolo (crece con cada alta o emparejamiento)"""
+        store = self.stores.get(symbol)
+        return store.seq if store is not None else 0
+
+    def changes_since(self, symbol, seq):
+        """Devuelve (secuencia, cambios posteriores a `seq`, hubo_hueco)"""
+        with self.lock:
+            store = self.stores.get(symbol)
+            if store is None:
+                return 0, [], False
+            changes, gap = store.changes_since(seq)
+            return store.seq, [dict(entry) for entry in changes], gap
+
     def clean_old_predictions(self, current_time_ms, max_age_ms=300000):
         """Elimina predicciones más viejas que max_age_ms"""
         with self.lock:
-            self.buffer = deque(
-                [p for p in self.buffer if current_time_ms - p['timestamp'] < max_age_ms],
-                maxlen=self.buffer.maxlen
-            )
\ No newline at end of file
+            for store in self.stores.values():
+                store.expire(current_time_ms - max_age_ms)
+
+# Instancia compartida por el cómputo en segundo plano y la API
+prediction_buffer = PredictionBuffer(maxlen=200 * len(PREDICTION_HORIZONS), max_age_ms=PREDICTION_HISTORY * 1000)
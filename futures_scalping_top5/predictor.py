@@ -1,37 +1,228 @@
 # predictor.py
 
+from functools import lru_cache
+import json
+import os
+import time
 import numpy as np
-from scipy.signal import savgol_filter
-from config import PREDICTION_MIN_TICKS
+from config import PREDICTION_MIN_TICKS, PREDICTION_HORIZONS, PREDICTION_CONFIDENCE_Z, MODELS_DIR, DEBUG
+from metrics import registry
+from ring_buffer import as_window
 
-def predict_future_price(ticks, future_seconds=60):
-    """Predice el precio en X segundos en el futuro usando datos suavizados"""
-    if not ticks or len(ticks) < PREDICTION_MIN_TICKS:
+PREDICTION_WINDOW_TICKS = 200
+SAVGOL_WINDOW = 51
+SAVGOL_POLYORDER = 2
+WEIGHT_DECAY = 1.0  # Pesos exp(linspace(-decay, 0)): más alto = más peso a lo reciente
+
+# Perfiles de parámetros por símbolo generados por sweep.py
+PROFILES_PATH = os.path.join(MODELS_DIR, 'predictor_profiles.json')
+DEFAULT_PROFILE = {
+    'window_size': PREDICTION_WINDOW_TICKS,
+    'min_ticks': PREDICTION_MIN_TICKS,
+    'savgol_window': SAVGOL_WINDOW,
+    'polyorder': SAVGOL_POLYORDER,
+    'decay': WEIGHT_DECAY
+}
+
+
+@lru_cache(maxsize=64)
+def _savgol_matrix(n, window_length=SAVGOL_WINDOW, polyorder=SAVGOL_POLYORDER):
+    """
+    Matriz (n x n) equivalente a savgol_filter sobre n muestras.
+    El filtro es lineal, así que aplicarlo a la identidad da sus coeficientes
+    (incluido el ajuste polinómico de los bordes) y suavizar un bloque de
+    series se reduce a un producto de matrices.
+    """
+    if n <= 10:
         return None
-        
-    window_size = min(200, len(ticks))
-    recent_ticks = ticks[-window_size:]
-    
-    timestamps = np.array([t['timestamp'] for t in recent_ticks])
-    prices = np.array([t['price'] for t in recent_ticks])
-    
-    # Suavizar los precios para reducir el ruido
-    if len(prices) > 10:
-        window_length = min(51, len(prices))  # Longitud impar
-        polyorder = 2
-        prices_smoothed = savgol_filter(prices, window_length, polyorder)
-    else:
-        prices_smoothed = prices
-    
+    window_length = min(window_length, n)
+    if window_length % 2 == 0:  # Longitud impar
+        window_length -= 1
+    from scipy.signal import savgol_filter  # SciPy se carga con el primer ajuste, no al importar
+
+    matrix = savgol_filter(np.eye(n), window_length, polyorder, axis=0)
+    matrix.setflags(write=False)
+    return matrix
+
+
+@lru_cache(maxsize=64)
+def _weights(n, decay=WEIGHT_DECAY):
+    """Pesos de mínimos cuadrados (cuadrado de la ponderación exponencial)"""
+    weights = np.exp(np.linspace(-decay, 0, n)) ** 2
+    weights.setflags(write=False)
+    return weights
+
+
+def _fit_block(timestamps, prices, savgol_window=SAVGOL_WINDOW, polyorder=SAVGOL_POLYORDER,
+               decay=WEIGHT_DECAY, residuals=False):
+    """
+    Ajusta una recta por serie sobre bloques 2-D (series x ventana):
+    regresión lineal ponderada resuelta en forma cerrada para todas las
+    filas. Devuelve (p_mean, slope, t_mean, t_last, sxx, total) y, con
+    `residuals`, además la varianza ponderada de los residuos y el nº
+    efectivo de muestras para las bandas de confianza.
+    """
+    n = timestamps.shape[1]
+    smoothing = _savgol_matrix(n, savgol_window, polyorder)
+    prices_smoothed = prices if smoothing is None else prices @ smoothing.T
+
     # Tiempo relativo en segundos
-    time_sec = (timestamps - timestamps[0]) / 1000.0
-    
-    # Regresión lineal con ponderación exponencial
-    weights = np.exp(np.linspace(-1, 0, len(time_sec)))
-    A = np.vstack([time_sec * weights, weights]).T
-    slope, intercept = np.linalg.lstsq(A, prices_smoothed * weights, rcond=None)[0]
-    
+    time_sec = (timestamps - timestamps[:, :1]) / 1000.0
+    weights = _weights(n, decay)
+    total = weights.sum()
+    t_mean = time_sec @ weights / total
+    p_mean = prices_smoothed @ weights / total
+    dt = time_sec - t_mean[:, None]
+    dp = prices_smoothed - p_mean[:, None]
+    sxx = (dt * dt) @ weights
+    sxy = (dt * dp) @ weights
+    slope = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+    fit = (p_mean, slope, t_mean, time_sec[:, -1], sxx, total)
+    if not residuals:
+        return fit
+
+    # Residuos frente al precio sin suavizar: incluyen el ruido del mercado
+    fitted = p_mean[:, None] + slope[:, None] * dt
+    variance = ((prices - fitted) ** 2) @ weights / total
+    n_eff = total ** 2 / (weights ** 2).sum()
+    variance *= n_eff / max(n_eff - 2, 1)
+    return fit + (variance, n_eff)
+
+
+def _predict_block(timestamps, prices, future_seconds, savgol_window=SAVGOL_WINDOW,
+                   polyorder=SAVGOL_POLYORDER, decay=WEIGHT_DECAY):
+    """Predice el precio a `future_seconds` de una fila por serie"""
+    p_mean, slope, t_mean, t_last, _, _ = _fit_block(timestamps, prices, savgol_window, polyorder, decay)
+
     # Predecir precio en X segundos
-    last_timestamp = timestamps[-1]
-    prediction_time = (last_timestamp - timestamps[0]) / 1000.0 + future_seconds
-    return slope * prediction_time + intercept
\ No newline at end of file
+    prediction_time = t_last + future_seconds
+    return p_mean + slope * (prediction_time - t_mean)
+
+
+def _predict_curve_block(timestamps, prices, horizons, savgol_window=SAVGOL_WINDOW,
+                         polyorder=SAVGOL_POLYORDER, decay=WEIGHT_DECAY, z=PREDICTION_CONFIDENCE_Z):
+    """
+    Curva de predicción (series x horizontes) y semiancho de su banda de
+    confianza a partir de un solo ajuste. La banda es el intervalo de
+    predicción aproximado de la regresión ponderada: crece con la
+    dispersión de los residuos y con la distancia al centro de la ventana.
+    """
+    p_mean, slope, t_mean, t_last, sxx, total, variance, n_eff = _fit_block(
+        timestamps, prices, savgol_window, polyorder, decay, residuals=True
+    )
+    horizons = np.asarray(horizons, dtype=np.float64)
+    offset = (t_last[:, None] + horizons[None, :]) - t_mean[:, None]
+    curve = p_mean[:, None] + slope[:, None] * offset
+    leverage = np.divide(offset ** 2 * total, sxx[:, None], out=np.zeros_like(offset), where=sxx[:, None] > 0)
+    band = z * np.sqrt(variance[:, None] * (1 + 1 / n_eff + leverage))
+    return curve, band
+
+
+def predict_future_price(ticks, future_seconds=60):
+    """Predice el precio en X segundos en el futuro usando datos suavizados"""
+    if ticks is None or len(ticks) < PREDICTION_MIN_TICKS:
+        return None
+
+    window_size = min(PREDICTION_WINDOW_TICKS, len(ticks))
+    recent_ticks = as_window(ticks[-window_size:])
+
+    prediction = _predict_block(
+        recent_ticks.timestamp[None, :],
+        recent_ticks.price[None, :],
+        future_seconds
+    )
+    return float(prediction[0])
+
+
+def load_profiles(path=PROFILES_PATH):
+    """Perfiles por símbolo {symbol: parámetros}; vacío si no hay fichero"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            profiles = json.load(f)
+    except (OSError, ValueError) as e:
+        if DEBUG:
+            print(f"Error loading predictor profiles: {e}")
+        return {}
+    return {
+        symbol.upper(): {k: profile.get(k, v) for k, v in DEFAULT_PROFILE.items()}
+        for symbol, profile in profiles.items()
+    }
+
+
+PREDICT_SECONDS = registry.histogram(
+    'predict_model_seconds', "Tiempo de una pasada del predictor por lotes", ('method',))
+
+
+class BatchPredictor:
+    """
+    Predice todos los símbolos en una sola pasada vectorizada.
+    Con `profiles` ({symbol: parámetros}, ver load_profiles) cada símbolo
+    usa sus propios parámetros; el resto, los de por defecto.
+    """
+
+    def __init__(self, window_size=PREDICTION_WINDOW_TICKS, min_ticks=PREDICTION_MIN_TICKS, profiles=None):
+        self.window_size = window_size
+        self.min_ticks = min_ticks
+        self.profiles = profiles or {}
+
+    def profile(self, symbol=None):
+        profile = self.profiles.get(symbol.upper()) if symbol else None
+        if profile is None:
+            return dict(DEFAULT_PROFILE, window_size=self.window_size, min_ticks=self.min_ticks)
+        return profile
+
+    def window_for(self, symbol=None):
+        """Ticks que necesita la ventana de `symbol`"""
+        return self.profile(symbol)['window_size']
+
+    def _groups(self, windows, symbols=None):
+        """Índices de las ventanas agrupados por (longitud, parámetros)"""
+        groups = {}
+        for i, window in enumerate(windows):
+            profile = self.profile(symbols[i] if symbols else None)
+            if window is None or len(window) < profile['min_ticks']:
+                continue
+            n = min(profile['window_size'], len(window))
+            key = (n, profile['savgol_window'], profile['polyorder'], profile['decay'])
+            groups.setdefault(key, []).append(i)
+        return groups
+
+    def predict(self, windows, future_seconds=60, symbols=None):
+        """
+        Recibe una lista de TickWindow (una por símbolo) y devuelve un array
+        con la predicción de cada una (NaN si no hay ticks suficientes).
+        Las ventanas de igual longitud y parámetros se apilan y resuelven juntas.
+        """
+        started = time.perf_counter()
+        predictions = np.full(len(windows), np.nan)
+        for (n, savgol_window, polyorder, decay), rows in self._groups(windows, symbols).items():
+            timestamps = np.stack([windows[i].timestamp[-n:] for i in rows])
+            prices = np.stack([windows[i].price[-n:] for i in rows])
+            predictions[rows] = _predict_block(timestamps, prices, future_seconds, savgol_window, polyorder, decay)
+        PREDICT_SECONDS.labels('predict').record(time.perf_counter() - started)
+        return predictions
+
+    def predict_curve(self, windows, horizons=PREDICTION_HORIZONS, symbols=None):
+        """
+        Como predict() pero para todos los `horizons` (segundos) a la vez:
+        devuelve (curva, banda), arrays (ventanas x horizontes) con NaN
+        en las filas sin ticks suficientes.
+        """
+        started = time.perf_counter()
+        curves = np.full((len(windows), len(horizons)), np.nan)
+        bands = np.full((len(windows), len(horizons)), np.nan)
+        for (n, savgol_window, polyorder, decay), rows in self._groups(windows, symbols).items():
+            timestamps = np.stack([windows[i].timestamp[-n:] for i in rows])
+            prices = np.stack([windows[i].price[-n:] for i in rows])
+            curves[rows], bands[rows] = _predict_curve_block(
+                timestamps, prices, horizons, savgol_window, polyorder, decay
+            )
+        PREDICT_SECONDS.labels('curve').record(time.perf_counter() - started)
+        return curves, bands
+
+    def predict_symbols(self, buffer, symbols, future_seconds=60):
+        """Lee las ventanas de `buffer` y predice todos los `symbols` a la vez"""
+        windows = [buffer.get_window(symbol, self.window_for(symbol)) for symbol in symbols]
+        return self.predict(windows, future_seconds, symbols)
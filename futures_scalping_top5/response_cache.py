@@ -0,0 +1,142 @@
+# response_cache.py
+
+from collections import OrderedDict
+import threading
+import zlib
+
+from config import API_CACHE_ENTRIES, API_CACHE_MAX_BYTES
+from metrics import registry
+
+CACHE_REQUESTS = registry.counter(
+    'predict_api_cache_total', "Peticiones a la caché de respuestas por resultado", ('endpoint', 'result'))
+CACHE_EVICTIONS = registry.counter('predict_api_cache_evictions_total', "Respuestas expulsadas de la caché (LRU)")
+
+
+def make_etag(endpoint, symbol, params, seq, epoch=0):
+    """
+    ETag de una respuesta: época y secuencia de los datos más un resumen
+    estable de la petición. La secuencia se reinicia con cada proceso o
+    ring nuevo; la época evita que un ETag anterior coincida con otros datos.
+    """
+    digest = zlib.crc32(repr((endpoint, symbol, params)).encode())
+    return f'"{epoch:08x}-{seq:x}-{digest:08x}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Comprueba una cabecera If-None-Match (lista de ETags, débiles o no, o '*')"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+
+class CachedResponse:
+    """Respuesta ya codificada: cuerpo en bytes, tipo, cabeceras y ETag"""
+
+    __slots__ = ('body', 'media_type', 'headers', 'etag')
+
+    def __init__(self, body, media_type, headers, etag):
+        self.body = body
+        self.media_type = media_type
+        self.headers = headers
+        self.etag = etag
+
+
+class ResponseCache:
+    """
+    Caché LRU de respuestas codificadas, acotada en entradas y en bytes.
+
+    La clave es (endpoint, símbolo, parámetros, época y secuencia de los datos):
+    una respuesta nunca caduca, simplemente deja de pedirse cuando la
+    secuencia avanza y acaba expulsada. Si varias peticiones iguales fallan
+    a la vez, sólo la primera construye la respuesta y el resto la espera,
+    así cada respuesta distinta se serializa una sola vez.
+    """
+
+    def __init__(self, max_entries=API_CACHE_ENTRIES, max_bytes=API_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0             # Bytes de los cuerpos guardados
+        self.building = {}        # Clave -> Event de la construcción en curso
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self.entries[key] = entry
+            self.size += len(entry.body)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+                CACHE_EVICTIONS.labels().inc()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def lookup(self, endpoint, symbol, params, seq, build, epoch=0):
+        """
+        Respuesta de (endpoint, symbol, params) para la secuencia `seq` de `epoch`.
+        `build()` devuelve (secuencia real, cuerpo, tipo, cabeceras); si los
+        datos avanzaron mientras se leían, la respuesta se guarda con la
+        secuencia real, nunca con una anterior a su contenido.
+        """
+        key = (endpoint, symbol, params, epoch, seq)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    CACHE_REQUESTS.labels(endpoint, 'hit').inc()
+                    return entry
+                pending = self.building.get(key)
+                if pending is None:
+                    pending = self.building[key] = threading.Event()
+                    break
+            # Otra petición la está construyendo: esperarla y volver a mirar
+            pending.wait()
+
+        CACHE_REQUESTS.labels(endpoint, 'miss').inc()
+        try:
+            built_seq, body, media_type, headers = build()
+            etag = make_etag(endpoint, symbol, params, built_seq, epoch)
+            entry = CachedResponse(body, media_type, {**headers, 'ETag': etag, 'Cache-Control': 'no-cache'}, etag)
+            self.put((endpoint, symbol, params, epoch, built_seq), entry)
+            if built_seq != seq:
+                self.put(key, entry)
+            return entry
+        finally:
+            with self.lock:
+                self.building.pop(key, None)
+            pending.set()
+
+
+# Caché compartida por los endpoints de lectura de la API
+response_cache = ResponseCache()
+
+registry.gauge(
+    'predict_api_cache_bytes', "Bytes de respuestas guardadas en la caché",
+    callback=lambda: {(): response_cache.size}
+)
+registry.gauge(
+    'predict_api_cache_entries', "Respuestas guardadas en la caché",
+    callback=lambda: {(): len(response_cache.entries)}
+)
@@ -1,11 +1,68 @@
 # rest_api.py
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import time
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from config import DEBUG, API_PORT, MIN_PRICE_RATIO, MAX_PRICE_RATIO
-from data_buffer import data_buffer, buffer_lock
+from fastapi.responses import StreamingResponse
+import fastjson
+from alert_engine import alert_engine
+from config import (DEBUG, API_PORT, STREAM_PUSH_INTERVAL, STREAM_HANDSHAKE_TIMEOUT, PREDICTION_HORIZONS,
+                    PREDICTION_CONFIDENCE_Z)
+from data_buffer import data_buffer
+from metrics import registry
+from order_book import order_books
+from prediction_buffer import prediction_buffer
+from response_cache import response_cache, make_etag, etag_matches, CACHE_REQUESTS
+from stream_hub import StreamHub, parse_event_id
+from tick_codecs import negotiate, encode_ticks, available_types
+from visualizations import ChartStream
+
+REQUEST_SECONDS = registry.histogram(
+    'predict_api_request_seconds', "Duración de las peticiones HTTP por ruta", ('route',))
+REQUESTS = registry.counter('predict_api_requests_total', "Peticiones HTTP por ruta y estado", ('route', 'status'))
+ENCODE_SECONDS = registry.histogram(
+    'predict_api_encode_seconds', "Tiempo de serializar una respuesta o frame", ('format',))
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mide cada petición HTTP hasta el último byte de la
+    respuesta, etiquetada con la plantilla de la ruta (no la URL, para no
+    crear una serie por símbolo o parámetro).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = None   # endpoint -> plantilla de ruta
+
+    def _route(self, scope):
+        if self.routes is None:
+            self.routes = {route.endpoint: route.path for route in app.routes if hasattr(route, 'endpoint')}
+        return self.routes.get(scope.get('endpoint'), 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self._route(scope)
+            REQUEST_SECONDS.labels(route).record(time.perf_counter() - started)
+            REQUESTS.labels(route, str(status[0])).inc()
+
 
 app = FastAPI()
+stream_hub = StreamHub(data_buffer, prediction_buffer)
 
 # Configuración CORS segura
 app.add_middleware(
@@ -15,41 +72,258 @@ app.add_middleware(
     allow_methods=["GET"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+def cached_response(request, endpoint, symbol, params, seq, build, epoch):
+    """
+    Respuesta de la caché para la secuencia actual de los datos (de la
+    época `epoch`), o 304 si el cliente ya tiene esa versión (If-None-Match
+    con el ETag). `build` sólo se llama si la respuesta no está guardada
+    (ver ResponseCache).
+    """
+    if_none_match = request.headers.get('if-none-match')
+    etag = make_etag(endpoint, symbol, params, seq, epoch)
+    if not etag_matches(if_none_match, etag):
+        entry = response_cache.lookup(endpoint, symbol, params, seq, build, epoch)
+        if not etag_matches(if_none_match, entry.etag):
+            return Response(content=entry.body, media_type=entry.media_type, headers=entry.headers)
+        etag = entry.etag
+    CACHE_REQUESTS.labels(endpoint, 'not_modified').inc()
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
 
 @app.get("/ticks/{symbol}")
-def get_ticks(symbol: str, max_ticks: int = 200):
+def get_ticks(symbol: str, request: Request, max_ticks: Optional[int] = None,
+              since: Optional[int] = None, until: Optional[int] = None):
+    """
+    Ticks de un símbolo: los últimos `max_ticks` (200 por defecto) o los del
+    rango [since, until] en ms. El formato se negocia con la cabecera Accept:
+    JSON por filas (por defecto), JSON columnar, Arrow IPC o binario crudo.
+    Las respuestas se guardan codificadas por secuencia de ticks y llevan
+    ETag: con If-None-Match y sin ticks nuevos se responde 304.
+    """
     symbol = symbol.upper()
-    with buffer_lock:
-        ticks = data_buffer.get_buffer(symbol, max_ticks)
-    if not ticks:
+    media_type = negotiate(request.headers.get('accept'))
+    if media_type is None:
+        raise HTTPException(406, detail=f"Formatos disponibles: {', '.join(available_types())}")
+    epoch = data_buffer.get_epoch(symbol)
+    seq = data_buffer.get_sequence(symbol)
+    if not seq:
+        raise HTTPException(404, detail="No hay datos disponibles")
+
+    def build():
+        if since is None and until is None:
+            built_seq, window = data_buffer.get_snapshot(symbol, max_ticks or 200)
+        else:
+            built_seq, window = data_buffer.get_snapshot_between(symbol, since, until, max_ticks)
+        if not len(window):
+            raise HTTPException(404, detail="No hay datos disponibles")
+        started = time.perf_counter()
+        body, headers = encode_ticks(symbol, window, media_type)
+        ENCODE_SECONDS.labels(media_type).record(time.perf_counter() - started)
+        return built_seq, body, media_type, headers
+
+    return cached_response(request, 'ticks', symbol, (media_type, max_ticks, since, until), seq, build, epoch)
+
+@app.get("/bars/{symbol}")
+def get_bars(symbol: str, kind: str = "1s", count: int = 100, include_open: bool = True):
+    """
+    Últimas `count` barras OHLCV del símbolo en columnas. `kind` es una de
+    las series mantenidas en la ingesta: barras de tiempo ('1s', '5s', '1m'),
+    de N trades ('100t') o de volumen ('volume').
+    """
+    symbol = symbol.upper()
+    bars = data_buffer.bars.get(symbol, kind, count, include_open)
+    if bars is None:
+        kinds = data_buffer.bars.kinds(symbol)
+        if not kinds:
+            raise HTTPException(404, detail="No hay datos disponibles")
+        raise HTTPException(400, detail=f"Tipos de barra disponibles: {', '.join(kinds)}")
+    body = fastjson.dumps({
+        'symbol': symbol,
+        'kind': kind,
+        'count': len(bars),
+        **{name: bars[name] for name in bars.dtype.names}
+    })
+    return Response(content=body, media_type='application/json')
+
+@app.get("/book/{symbol}")
+def get_book(symbol: str, levels: int = 20):
+    """
+    Features del libro de órdenes (spread, microprecio, desequilibrio
+    top-N) y sus `levels` mejores niveles por lado como [[precio, cantidad]].
+    Sólo con DEPTH_ENABLED; 404 mientras el libro no esté sincronizado.
+    """
+    symbol = symbol.upper()
+    book = order_books.snapshot(symbol, levels)
+    if book is None:
+        raise HTTPException(404, detail="Libro no disponible")
+    body = fastjson.dumps({'symbol': symbol, **book['features'], 'bids': book['bids'], 'asks': book['asks']})
+    return Response(content=body, media_type='application/json')
+
+@app.get("/forecast/{symbol}")
+def get_forecast(symbol: str, horizons: Optional[str] = None):
+    """
+    Predicción instantánea de cada modelo online (RLS, Kalman) a los
+    `horizons` segundos indicados (separados por comas), desde su estado
+    actual y sin reajustar nada: {kind: [{horizon, predicted_price, lower, upper}]}.
+    """
+    symbol = symbol.upper()
+    try:
+        horizons = [float(h) for h in horizons.split(',')] if horizons else PREDICTION_HORIZONS
+    except ValueError:
+        raise HTTPException(400, detail="horizons debe ser una lista de segundos separados por comas")
+    last = data_buffer.get_last_tick(symbol)
+    if last is None:
         raise HTTPException(404, detail="No hay datos disponibles")
-    return {"symbol": symbol, "ticks": ticks, "count": len(ticks)}
+    models = {}
+    for kind in data_buffer.models.kinds:
+        forecast = data_buffer.get_forecast(symbol, kind, horizons, last['timestamp'])
+        if forecast is None:
+            continue
+        models[kind] = [
+            {'horizon': h, 'predicted_price': price,
+             'lower': price - PREDICTION_CONFIDENCE_Z * std, 'upper': price + PREDICTION_CONFIDENCE_Z * std}
+            for h, price, std in zip(horizons, *forecast)
+        ]
+    return {'symbol': symbol, 'timestamp': last['timestamp'], 'price': last['price'], 'models': models}
+
+@app.get("/alerts")
+def get_alerts(since: int = 0, symbol: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Eventos de alerta (activación y desactivación) con secuencia posterior
+    a `since`, de todos los símbolos o de `symbol`, y las alertas activas.
+    Un cliente sondea pasando como `since` el `seq` de la respuesta anterior.
+    """
+    body = fastjson.dumps({
+        'seq': alert_engine.seq,
+        'events': alert_engine.get_events(since, symbol, limit),
+        'active': alert_engine.active(symbol)
+    })
+    return Response(content=body, media_type='application/json')
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/price_stats/{symbol}")
-def get_price_stats(symbol: str):
+def get_price_stats(symbol: str, request: Request):
+    """Estadísticas de validación del símbolo (O(1)), guardadas por versión y con ETag"""
     symbol = symbol.upper()
-    with buffer_lock:
-        if hasattr(data_buffer, 'price_stats') and symbol in data_buffer.price_stats:
-            prices = list(data_buffer.price_stats[symbol])
-            avg = sum(prices) / len(prices) if prices else 0
-            return {
-                "symbol": symbol,
-                "current_avg": avg,
-                "min_valid": avg * MIN_PRICE_RATIO,
-                "max_valid": avg * MAX_PRICE_RATIO,
-                "samples": len(prices)
-            }
+    seq = data_buffer.get_validation_sequence(symbol)
+    if not seq:
         return {"symbol": symbol, "error": "No hay estadísticas disponibles"}
 
-def add_tick_to_buffer(symbol: str, tick: dict):
+    def build():
+        stats = data_buffer.get_validation_stats(symbol)
+        stats['current_avg'] = stats['mean']
+        return seq, fastjson.dumps(stats), 'application/json', {}
+
+    return cached_response(request, 'price_stats', symbol, (), seq, build, data_buffer.epoch)
+
+async def _until_disconnect(websocket: WebSocket):
+    """Lee (e ignora) los mensajes del cliente hasta que se desconecta"""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+    except WebSocketDisconnect:
+        pass
+
+async def _push_loop(websocket: WebSocket, next_frame):
+    """
+    Envía next_frame() (texto, o None si no hay nada nuevo) cada
+    STREAM_PUSH_INTERVAL segundos hasta que el cliente se desconecta. La
+    recepción se vigila en paralelo, así que una desconexión se detecta
+    aunque no haya nada que enviar (símbolos sin actividad).
+    """
+    closed = asyncio.ensure_future(_until_disconnect(websocket))
+    try:
+        while not closed.done():
+            frame = next_frame()
+            if frame is not None:
+                await websocket.send_text(frame)
+            await asyncio.wait([closed], timeout=STREAM_PUSH_INTERVAL)
+    finally:
+        closed.cancel()
+
+@app.websocket("/stream/{symbol}")
+async def stream_ws(websocket: WebSocket, symbol: str, since: int = 0, pred_since: int = 0):
+    """
+    Envía deltas (ticks, predicciones e indicadores) desde el último cursor
+    del cliente, agrupados cada STREAM_PUSH_INTERVAL segundos. Para reanudar,
+    el cliente manda {"since": seq, "pred_since": pred_seq} al conectar (o
+    los pasa como parámetros de la URL).
+    """
+    await websocket.accept()
     try:
-        with buffer_lock:
-            return data_buffer.add_tick(symbol.upper(), tick)
-    except Exception as e:
-        if DEBUG:
-            print(f"Error adding tick to buffer: {str(e)}")
-        return False
-
-def run_api():
+        try:
+            hello = fastjson.loads(await asyncio.wait_for(websocket.receive_text(), STREAM_HANDSHAKE_TIMEOUT))
+            since = int(hello.get('since', since))
+            pred_since = int(hello.get('pred_since', pred_since))
+        except (asyncio.TimeoutError, ValueError, AttributeError):
+            pass
+
+        cursor = (since, pred_since)
+
+        def next_frame():
+            nonlocal cursor
+            started = time.perf_counter()
+            cursor, frame = stream_hub.delta(symbol, *cursor)
+            if frame is None:
+                return None
+            ENCODE_SECONDS.labels('stream_delta').record(time.perf_counter() - started)
+            return frame.decode()
+
+        await _push_loop(websocket, next_frame)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/stream/{symbol}/sse")
+async def stream_sse(symbol: str, request: Request, since: int = 0, pred_since: int = 0):
+    """Mismos deltas como Server-Sent Events; se reanuda con Last-Event-ID"""
+    last_event_id = request.headers.get('last-event-id')
+    if last_event_id:
+        since, pred_since = parse_event_id(last_event_id)
+
+    async def events():
+        seq, pred_seq = since, pred_since
+        while not await request.is_disconnected():
+            started = time.perf_counter()
+            (seq, pred_seq), frame = stream_hub.delta(symbol, seq, pred_seq)
+            if frame is not None:
+                ENCODE_SECONDS.labels('stream_delta').record(time.perf_counter() - started)
+                yield b"id: %d:%d\nevent: delta\ndata: %s\n\n" % (seq, pred_seq, frame)
+            await asyncio.sleep(STREAM_PUSH_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/stream/{symbol}/chart")
+async def stream_chart(websocket: WebSocket, symbol: str):
+    """
+    Actualizaciones incrementales del gráfico: el primer frame trae la serie
+    reducida completa ('reset') y los siguientes sólo los puntos añadidos,
+    el intervalo abierto ('tail') y las predicciones si cambiaron.
+    """
+    await websocket.accept()
+    chart = ChartStream(data_buffer, symbol, prediction_buffer)
+
+    def next_frame():
+        frame = chart.frame()
+        if frame is None:
+            return None
+        started = time.perf_counter()
+        text = fastjson.dumps(frame).decode()
+        ENCODE_SECONDS.labels('chart_frame').record(time.perf_counter() - started)
+        return text
+
+    try:
+        await _push_loop(websocket, next_frame)
+    except WebSocketDisconnect:
+        pass
+
+def run_api(host="0.0.0.0", port=API_PORT):
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=API_PORT, log_level="warning" if not DEBUG else "info")
\ No newline at end of file
+    uvicorn.run(app, host=host, port=port, log_level="warning" if not DEBUG else "info")
\ No newline at end of file
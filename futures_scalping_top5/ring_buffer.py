@@ -0,0 +1,326 @@
+# ring_buffer.py
+
+from multiprocessing import shared_memory
+import os
+import numpy as np
+
+
+def new_epoch():
+    """Identificador aleatorio de 32 bits de un ring (o buffer) recién creado"""
+    return int.from_bytes(os.urandom(4), 'little')
+
+
+class TickWindow:
+    """Vista columnar de una ventana de ticks (arrays NumPy sin copia)"""
+
+    __slots__ = ('timestamp', 'price', 'qty', 'side')
+
+    def __init__(self, timestamp, price, qty=None, side=None):
+        self.timestamp = timestamp
+        self.price = price
+        self.qty = qty
+        self.side = side
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, index):
+        # Compatibilidad con el formato antiguo: ticks[-1]['price']
+        if isinstance(index, slice):
+            return TickWindow(
+                self.timestamp[index],
+                self.price[index],
+                None if self.qty is None else self.qty[index],
+                None if self.side is None else self.side[index]
+            )
+        return self._tick_at(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._tick_at(i)
+
+    def _tick_at(self, i):
+        tick = {'price': float(self.price[i]), 'timestamp': int(self.timestamp[i])}
+        if self.qty is not None:
+            tick['qty'] = float(self.qty[i])
+        if self.side is not None:
+            tick['side'] = int(self.side[i])
+        return tick
+
+    def copy(self):
+        """Copia independiente de la ventana (ya no depende del buffer circular)"""
+        return TickWindow(
+            self.timestamp.copy(),
+            self.price.copy(),
+            None if self.qty is None else self.qty.copy(),
+            None if self.side is None else self.side.copy()
+        )
+
+    def to_dicts(self):
+        """Convierte la ventana a la lista de dicts usada por la API"""
+        columns = [('timestamp', self.timestamp.tolist()), ('price', self.price.tolist())]
+        if self.qty is not None:
+            columns.append(('qty', self.qty.tolist()))
+        if self.side is not None:
+            columns.append(('side', self.side.tolist()))
+        names = [name for name, _ in columns]
+        return [dict(zip(names, row)) for row in zip(*(values for _, values in columns))]
+
+
+def as_window(ticks):
+    """Acepta una TickWindow o una lista de dicts y devuelve una TickWindow"""
+    if isinstance(ticks, TickWindow):
+        return ticks
+    if not ticks:
+        return TickWindow(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+    return TickWindow(
+        np.fromiter((t['timestamp'] for t in ticks), dtype=np.int64, count=len(ticks)),
+        np.fromiter((t['price'] for t in ticks), dtype=np.float64, count=len(ticks))
+    )
+
+
+class TickRing:
+    """
+    Buffer circular columnar sobre arrays NumPy preasignados.
+
+    Cada tick se escribe dos veces (posición i e i + slots), de modo que
+    los últimos n ticks (n <= capacity) siempre forman un slice contiguo y
+    las ventanas se devuelven como vistas sin copia. Las columnas opcionales
+    (qty, side) sólo se reservan cuando llega el primer tick que las trae.
+
+    Hay un único escritor y los lectores no bloquean, al estilo seqlock:
+    antes de tocar los arrays el escritor publica en `reserved` la
+    secuencia a la que llegará al terminar y, después de escribir los
+    datos, la publica en `written`. Mientras escribe, reserved > written.
+    `guard` posiciones extra detrás de la ventana visible dan margen antes
+    de que el escritor pise una ventana leída. snapshot() lee `written`,
+    copia y después comprueba `reserved`: si la escritura en curso o las
+    terminadas durante la copia alcanzan lo copiado, reintenta.
+    """
+
+    def __init__(self, capacity, guard=None):
+        if capacity <= 0:
+            raise ValueError("capacity debe ser positivo")
+        self.capacity = int(capacity)
+        if guard is None:
+            guard = max(64, self.capacity // 16)
+        self.slots = self.capacity + int(guard)
+        self.timestamp = np.zeros(2 * self.slots, dtype=np.int64)
+        self.price = np.zeros(2 * self.slots, dtype=np.float64)
+        self.qty = None
+        self.side = None
+        self.written = 0   # Ticks escritos desde la creación (número de secuencia)
+        self.reserved = 0  # Secuencia al terminar la escritura en curso (= written si no hay)
+        # La secuencia empieza en 0 en cada ring nuevo: (epoch, written) identifica los datos
+        self.epoch = new_epoch()
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def nbytes(self):
+        total = self.timestamp.nbytes + self.price.nbytes
+        if self.qty is not None:
+            total += self.qty.nbytes
+        if self.side is not None:
+            total += self.side.nbytes
+        return total
+
+    def _ensure_optional(self, qty, side):
+        if qty is not None and self.qty is None:
+            self.qty = np.zeros(2 * self.slots, dtype=np.float64)
+        if side is not None and self.side is None:
+            self.side = np.zeros(2 * self.slots, dtype=np.int8)
+
+    def append(self, timestamp, price, qty=None, side=None):
+        """Añade un tick en O(1)"""
+        self._ensure_optional(qty, side)
+        self.reserved = self.written + 1
+        i = self.written % self.slots
+        j = i + self.slots
+        self.timestamp[i] = self.timestamp[j] = timestamp
+        self.price[i] = self.price[j] = price
+        if self.qty is not None:
+            self.qty[i] = self.qty[j] = 0.0 if qty is None else qty
+        if self.side is not None:
+            self.side[i] = self.side[j] = 0 if side is None else side
+        self.written = self.reserved
+
+    def extend(self, timestamps, prices, qty=None, side=None):
+        """Añade un bloque de ticks en orden cronológico"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        n = len(timestamps)
+        if n == 0:
+            return
+        self._ensure_optional(qty, side)
+        # Se reserva la secuencia final antes de escribir y se publica después
+        written = self.written
+        # Sólo los últimos `capacity` ticks del bloque sobreviven
+        if n > self.capacity:
+            skip = n - self.capacity
+            written += skip
+            timestamps, prices = timestamps[skip:], prices[skip:]
+            qty = None if qty is None else np.asarray(qty)[skip:]
+            side = None if side is None else np.asarray(side)[skip:]
+            n = self.capacity
+
+        columns = [(self.timestamp, timestamps), (self.price, prices)]
+        if self.qty is not None:
+            columns.append((self.qty, np.zeros(n) if qty is None else qty))
+        if self.side is not None:
+            columns.append((self.side, np.zeros(n, dtype=np.int8) if side is None else side))
+
+        self.reserved = written + n
+        start = written % self.slots
+        first = min(n, self.slots - start)
+        for dest, src in columns:
+            src = np.asarray(src)
+            dest[start:start + first] = src[:first]
+            dest[start + self.slots:start + self.slots + first] = src[:first]
+            if first < n:
+                dest[:n - first] = src[first:]
+                dest[self.slots:self.slots + n - first] = src[first:]
+        self.written = written + n
+
+    def _bounds(self, count=None, written=None):
+        if written is None:
+            written = self.written
+        size = min(written, self.capacity)
+        if count is not None:
+            size = min(size, max(int(count), 0))
+        end = (written - 1) % self.slots + self.slots + 1 if written else 0
+        return end - size, end
+
+    def window(self, count=None, written=None):
+        """
+        Últimos `count` ticks (todos si es None) como vistas sin copia.
+        Siguen siendo válidas durante los próximos (slots - len) ticks.
+        """
+        start, end = self._bounds(count, written)
+        return TickWindow(
+            self.timestamp[start:end],
+            self.price[start:end],
+            None if self.qty is None else self.qty[start:end],
+            None if self.side is None else self.side[start:end]
+        )
+
+    def window_between(self, since=None, until=None, written=None):
+        """Ticks con since <= timestamp <= until mediante búsqueda binaria"""
+        window = self.window(written=written)
+        ts = window.timestamp
+        lo = 0 if since is None else int(np.searchsorted(ts, since, side='left'))
+        hi = len(ts) if until is None else int(np.searchsorted(ts, until, side='right'))
+        return window[lo:hi]
+
+    def snapshot(self, count=None, retries=8):
+        """
+        Copia consistente de los últimos `count` ticks sin bloquear al
+        escritor. Devuelve (secuencia, TickWindow).
+        """
+        for _ in range(retries):
+            before = self.written
+            window = self.window(count, before).copy()
+            # Los datos copiados siguen intactos si ninguna escritura, terminada
+            # o en curso, ha dado la vuelta hasta ellos mientras se copiaban
+            if self.reserved - before <= self.slots - len(window):
+                return before, window
+        raise RuntimeError("TickRing.snapshot: el escritor adelantó a la copia")
+
+    def snapshot_between(self, since=None, until=None, max_ticks=None, retries=8):
+        """
+        Copia consistente de los ticks en [since, until] (los últimos
+        `max_ticks` si se indica). Devuelve (secuencia, TickWindow).
+        """
+        for _ in range(retries):
+            before = self.written
+            window = self.window_between(since, until, before)
+            if max_ticks:
+                window = window[-max_ticks:]
+            window = window.copy()
+            # La búsqueda binaria recorre toda la ventana visible, así que se
+            # valida contra ella y no sólo contra el tramo copiado
+            if self.reserved - before <= self.slots - min(before, self.capacity):
+                return before, window
+        raise RuntimeError("TickRing.snapshot_between: el escritor adelantó a la copia")
+
+    def last(self):
+        """Último tick como (timestamp, price) o None"""
+        written = self.written
+        if not written:
+            return None
+        i = (written - 1) % self.slots
+        return int(self.timestamp[i]), float(self.price[i])
+
+
+class SharedTickRing(TickRing):
+    """
+    TickRing en memoria compartida (multiprocessing.shared_memory).
+
+    Un proceso escritor la crea con create() y los lectores se conectan con
+    attach(); la cabecera guarda la secuencia y la geometría, de modo que
+    los lectores obtienen las mismas vistas y snapshots sin copia que con
+    un TickRing local. Guarda timestamp, precio, cantidad y lado.
+    """
+
+    HEADER = 4  # int64: written, capacity, slots, reserved
+    SLOT_BYTES = 8 + 8 + 8 + 1  # timestamp, price, qty, side
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.epoch = new_epoch()
+        header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=shm.buf)
+        self._header = header
+        self.capacity = int(header[1])
+        self.slots = int(header[2])
+        offset = self.HEADER * 8
+        size = 2 * self.slots
+        self.timestamp = np.ndarray((size,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        self.price = np.ndarray((size,), dtype=np.float64, buffer=shm.buf, offset=offset + size * 8)
+        self.qty = np.ndarray((size,), dtype=np.float64, buffer=shm.buf, offset=offset + size * 16)
+        self.side = np.ndarray((size,), dtype=np.int8, buffer=shm.buf, offset=offset + size * 24)
+
+    @classmethod
+    def create(cls, name, capacity, guard=None):
+        capacity = int(capacity)
+        if guard is None:
+            guard = max(64, capacity // 16)
+        slots = capacity + int(guard)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.HEADER * 8 + 2 * slots * cls.SLOT_BYTES)
+        header = np.ndarray((cls.HEADER,), dtype=np.int64, buffer=shm.buf)
+        header[:] = (0, capacity, slots, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def written(self):
+        return int(self._header[0])
+
+    @written.setter
+    def written(self, value):
+        self._header[0] = value
+
+    @property
+    def reserved(self):
+        return int(self._header[3])
+
+    @reserved.setter
+    def reserved(self, value):
+        self._header[3] = value
+
+    def _ensure_optional(self, qty, side):
+        # Las columnas opcionales ya están reservadas en la memoria compartida
+        pass
+
+    def close(self):
+        """Libera las vistas y desconecta; el propietario además la elimina"""
+        self._header = self.timestamp = self.price = self.qty = self.side = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Quedan vistas vivas; el mapeo se libera cuando desaparezcan
+        if self.owner:
+            self.shm.unlink()
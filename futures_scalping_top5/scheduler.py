@@ -0,0 +1,186 @@
+# scheduler.py
+
+import math
+import threading
+import time
+
+from alert_engine import alert_engine as global_alert_engine
+from config import (TOP_SYMBOLS, PREDICTION_INTERVAL, PREDICTION_HORIZON, PREDICTION_HORIZONS,
+                    PREDICTION_BARS, PREDICTOR, ONLINE_CHECKPOINT_INTERVAL, BOOK_ANCHOR_PREDICTIONS,
+                    ALERT_MAX_TICKS, SCHEDULER_POLL_INTERVAL, DEBUG)
+from data_buffer import data_buffer as global_data_buffer
+from prediction_buffer import prediction_buffer as global_prediction_buffer
+from metrics import registry, ERRORS
+from online_predictor import OnlinePredictor
+from order_book import order_books as global_order_books
+from predictor import BatchPredictor, load_profiles
+
+# Antigüedad máxima del libro respecto al último trade para anclar la curva al microprecio
+BOOK_MAX_AGE_MS = 5000
+
+PASS_SECONDS = registry.histogram('predict_scheduler_pass_seconds', "Duración de una pasada del scheduler")
+
+
+def make_predictor(kind=PREDICTOR, buffer=None):
+    """Predictor por nombre: 'batch' (ajuste por ventana) o un modelo online de `buffer.models`"""
+    if kind == 'batch':
+        return BatchPredictor(profiles=load_profiles())
+    buffer = buffer if buffer is not None else global_data_buffer
+    return OnlinePredictor(buffer.models, kind)
+
+
+class Scheduler:
+    """
+    Cómputo en segundo plano compartido por todo el proceso.
+
+    Un único hilo vigila la secuencia de ticks de cada símbolo: cuando
+    llegan ticks nuevos empareja predicciones y pasa esos ticks al motor de
+    alertas (`alerts`), y cada `interval` segundos predice todos los
+    símbolos en una pasada. Los resultados quedan en `predictions`
+    (PredictionBuffer) y en el motor de alertas, que leen todas las
+    sesiones de la UI y la API. Cada `checkpoint_interval` segundos guarda
+    el estado de los modelos online.
+    Con `book_anchor` la curva se desplaza al microprecio del libro de
+    órdenes (si está sincronizado) en lugar de partir del último trade.
+    """
+
+    def __init__(self, buffer=None, predictions=None, symbols=None, predictor=None,
+                 interval=PREDICTION_INTERVAL, horizon=PREDICTION_HORIZON,
+                 horizons=PREDICTION_HORIZONS, poll_interval=SCHEDULER_POLL_INTERVAL, bars=PREDICTION_BARS,
+                 checkpoint_interval=ONLINE_CHECKPOINT_INTERVAL, books=None, book_anchor=BOOK_ANCHOR_PREDICTIONS,
+                 alerts=None):
+        self.buffer = buffer if buffer is not None else global_data_buffer
+        self.predictions = predictions if predictions is not None else global_prediction_buffer
+        self.symbols = [s.upper() for s in (symbols or TOP_SYMBOLS)]
+        self.predictor = predictor or make_predictor(PREDICTOR, self.buffer)
+        self.interval = interval
+        self.horizon = horizon     # Horizonte principal (dirección de las alertas)
+        self.horizons = horizons
+        self.poll_interval = poll_interval
+        self.bars = bars           # Serie de barras sobre la que predecir (None = trades crudos)
+        self.books = books if books is not None else global_order_books
+        self.book_anchor = book_anchor
+        self.seen = {s: 0 for s in self.symbols}
+        self.alerts = alerts if alerts is not None else global_alert_engine
+        self.last_prediction = 0.0
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = time.time()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(5)
+        if self.checkpoint_interval:
+            self.checkpoint()
+
+    def _loop(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                ERRORS.labels('scheduler').inc()
+                if DEBUG:
+                    print(f"Error in scheduler: {e}")
+            time.sleep(self.poll_interval)
+
+    def run_once(self, now=None):
+        """Una pasada: símbolos con ticks nuevos y, si toca, predicción de todos"""
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        changed = []
+        for symbol in self.symbols:
+            seq = self.buffer.get_sequence(symbol)
+            if seq != self.seen[symbol]:
+                changed.append((symbol, seq - self.seen[symbol]))
+                self.seen[symbol] = seq
+
+        if now - self.last_prediction >= self.interval:
+            if self.predict_all():
+                self.last_prediction = now
+
+        for symbol, new in changed:
+            self.on_ticks(symbol, new)
+
+        if self.checkpoint_interval and now - self.last_checkpoint >= self.checkpoint_interval:
+            self.last_checkpoint = now
+            self.checkpoint()
+        PASS_SECONDS.labels().record(time.perf_counter() - started)
+        return [symbol for symbol, _ in changed]
+
+    def predict_all(self):
+        """Predice la curva de todos los horizontes de todos los símbolos con un solo ajuste por lotes"""
+        if self.bars:
+            windows = [self.buffer.get_bar_window(s, self.bars, self.predictor.window_for(s)) for s in self.symbols]
+        else:
+            windows = [self.buffer.get_window(s, self.predictor.window_for(s)) for s in self.symbols]
+        curves, bands = self.predictor.predict_curve(windows, self.horizons, self.symbols)
+        added = 0
+        for symbol, window, curve, band in zip(self.symbols, windows, curves, bands):
+            if math.isnan(curve[0]):  # Sin ticks suficientes
+                continue
+            if self.book_anchor:
+                curve = curve + self._book_offset(symbol, window)
+            self.predictions.add_curve(symbol, int(window.timestamp[-1]), self.horizons, curve, band)
+            added += 1
+        return added
+
+    def _book_offset(self, symbol, window):
+        """Microprecio del libro menos el último precio de la ventana (0 sin libro reciente)"""
+        features = self.books.features(symbol)
+        if features is None or abs(features['event_time'] - int(window.timestamp[-1])) > BOOK_MAX_AGE_MS:
+            return 0.0
+        return features['microprice'] - float(window.price[-1])
+
+    def checkpoint(self):
+        """Guarda el estado de los modelos online para que un reinicio arranque en caliente"""
+        try:
+            return self.buffer.models.save()
+        except OSError as e:
+            ERRORS.labels('checkpoint').inc()
+            if DEBUG:
+                print(f"Error saving online models: {e}")
+            return 0
+
+    def on_ticks(self, symbol, new=1):
+        """
+        Empareja predicciones con los `new` ticks nuevos del símbolo, en
+        orden (cada una con el primer tick en o tras su objetivo, como en
+        backtest), y evalúa las alertas con ellos (los últimos
+        ALERT_MAX_TICKS si hay más; el resto se descarta) con los
+        indicadores y la predicción actuales.
+        """
+        _, window = self.buffer.get_snapshot(symbol, max(new, 1))
+        if not len(window):
+            return
+        self.predictions.match_actual_prices(symbol, window.timestamp, window.price)
+
+        window = window[-ALERT_MAX_TICKS:]
+        self.alerts.on_ticks(
+            symbol, window.timestamp.tolist(), window.price.tolist(),
+            self.buffer.get_indicators(symbol), self._predicted_price(symbol)
+        )
+
+    def _predicted_price(self, symbol):
+        curve = self.predictions.get_curve(symbol)
+        if not curve:
+            return None
+        # Entrada del horizonte principal (o la más lejana si no está en la curva)
+        entry = next((e for e in curve if e['horizon'] == self.horizon), curve[-1])
+        return entry['predicted_price']
+
+    @property
+    def alerts_seq(self):
+        """Cambia con cada evento de alerta (redibujado de la UI)"""
+        return self.alerts.seq
+
+    def get_alerts(self, symbol):
+        """Mensajes de las alertas activas del símbolo"""
+        return [event['message'] for event in self.alerts.active(symbol)]
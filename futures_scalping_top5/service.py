@@ -0,0 +1,344 @@
+# service.py
+
+import argparse
+from collections import deque
+import signal
+import threading
+import time
+
+import numpy as np
+
+from config import (TOP_SYMBOLS, API_PORT, BINANCE_WS_URL, BINANCE_REST_URL, DATA_DIR, HISTORICAL_MINUTES,
+                    PERSIST_TICKS, TICK_STORE_FLUSH_INTERVAL, STORE_FOLLOW_INTERVAL, BACKFILL_FIRST_TICK_WAIT,
+                    BACKFILL_MAX_HELD_TICKS, WS_SHARD_PROCESSES, DEBUG)
+from data_buffer import data_buffer as global_data_buffer
+from tick_store import TickStore
+
+# Qué arranca cada modo: ingesta WS (+ backfill), cómputo (scheduler) y API
+MODES = {
+    'all': ('ingest', 'compute', 'api'),
+    'ingest': ('ingest',),
+    'api': ('compute', 'api'),
+}
+
+
+class IngestGate:
+    """
+    Se interpone entre la ingesta WS y el DataBuffer mientras se rellena
+    el hueco por REST: retiene los lotes de cada símbolo (y, en modo
+    procesos, la sincronización de los rings compartidos) hasta release(),
+    y anota el timestamp del primer tick WS, que es donde acaba el backfill.
+    Si lo retenido pasa de `max_ticks` se descartan los lotes más antiguos
+    y su tramo se anota para pedirlo también por REST (ver take_gaps).
+    El resto de atributos se delegan en el buffer.
+    """
+
+    def __init__(self, buffer, max_ticks=BACKFILL_MAX_HELD_TICKS):
+        self.buffer = buffer
+        self.held = True
+        self.max_ticks = max_ticks
+        self.pending = deque()  # Lotes retenidos (args de add_ticks), en orden de llegada
+        self.held_ticks = 0
+        self.first = {}         # symbol -> timestamp del primer tick WS
+        self.gaps = {}          # symbol -> (primer, último) timestamp de los ticks descartados
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.buffer, name)
+
+    def add_ticks(self, symbol, timestamps, prices, qtys=None, sides=None, trade_ids=None):
+        with self.lock:
+            if self.held:
+                symbol_key = symbol.upper()
+                if len(timestamps) and symbol_key not in self.first:
+                    self.first[symbol_key] = int(timestamps[0])
+                self.pending.append((symbol_key, timestamps, prices, qtys, sides, trade_ids))
+                self.held_ticks += len(timestamps)
+                while self.held_ticks > self.max_ticks and len(self.pending) > 1:
+                    self._drop_oldest()
+                return len(timestamps)
+            return self.buffer.add_ticks(symbol, timestamps, prices, qtys, sides, trade_ids)
+
+    def _drop_oldest(self):
+        symbol_key, timestamps = self.pending.popleft()[:2]
+        self.held_ticks -= len(timestamps)
+        self.dropped += len(timestamps)
+        if len(timestamps):
+            gap = self.gaps.get(symbol_key)
+            self.gaps[symbol_key] = (int(timestamps[0]) if gap is None else gap[0], int(timestamps[-1]))
+        if DEBUG:
+            print(f"Ingest gate full: dropped {len(timestamps)} held ticks for {symbol_key}")
+
+    def take_gaps(self):
+        """
+        Tramos {symbol: (inicio, fin)} de los ticks WS descartados hasta
+        ahora, que acaban justo antes del primer lote que sigue retenido.
+        """
+        with self.lock:
+            gaps, self.gaps = self.gaps, {}
+            ranges = {}
+            for symbol_key, (start, end) in gaps.items():
+                held = next((int(b[1][0]) for b in self.pending if b[0] == symbol_key and len(b[1])), None)
+                ranges[symbol_key] = (start, end if held is None else held - 1)
+            return ranges
+
+    def sync_shared(self):
+        if self.held:
+            return 0
+        return self.buffer.sync_shared()
+
+    def first_timestamp(self, symbol_key):
+        """Timestamp del primer tick WS del símbolo, o None si aún no ha llegado ninguno"""
+        first = self.first.get(symbol_key)
+        shared = self.buffer.shared_ring(symbol_key)
+        if first is None and shared is not None:
+            # Modo procesos: los shards escriben directamente en el ring compartido
+            _, window = shared.snapshot()
+            if len(window):
+                first = self.first[symbol_key] = int(window.timestamp[0])
+        return first
+
+    def wait_first(self, symbols, timeout=BACKFILL_FIRST_TICK_WAIT):
+        """Espera al primer tick WS de cada símbolo; devuelve {symbol: timestamp o None}"""
+        deadline = time.time() + timeout
+        while True:
+            first = {s: self.first_timestamp(s) for s in symbols}
+            if all(t is not None for t in first.values()) or time.time() >= deadline:
+                return first
+            time.sleep(0.05)
+
+    def release(self):
+        """Aplica los lotes retenidos (validados como siempre) y deja pasar los siguientes"""
+        with self.lock:
+            for batch in self.pending:
+                self.buffer.add_ticks(*batch)
+            self.pending.clear()
+            self.held_ticks = 0
+            self.held = False
+
+
+def start_ingest(tick_store, symbols=None, buffer=None, persist=PERSIST_TICKS, url_base=BINANCE_WS_URL,
+                 rest_url=BINANCE_REST_URL, processes=WS_SHARD_PROCESSES):
+    """
+    Arranca la ingesta WebSocket y, mientras sus lotes esperan en un
+    IngestGate, rellena por REST el hueco de todos los símbolos a la vez
+    desde el último tick en disco hasta justo antes del primer tick WS, de
+    modo que no queda hueco entre ambas fuentes ni se solapan (la
+    validación descarta además cualquier trade repetido). Con `persist` las
+    páginas van directamente a disco y el buffer se carga desde allí.
+    Devuelve el ShardedIngest arrancado (shards en procesos si `processes`).
+
+    En modo procesos el ring compartido tiene un único escritor (el shard),
+    así que el buffer pasa a copiar sus ticks en un ring local
+    (DataBuffer.copy_shared) detrás del histórico, igual que en modo hilos.
+    """
+    from historical_data import backfill, buffer_sink, store_sink
+    from sharded_ingest import ShardedIngest
+
+    symbols = [s.upper() for s in (symbols or TOP_SYMBOLS)]
+    buffer = buffer if buffer is not None else global_data_buffer
+    gate = IngestGate(buffer)
+    ingest = ShardedIngest(symbols, processes=processes, url_base=url_base, buffer=gate).start()
+    try:
+        first = gate.wait_first(symbols)
+        now_ms = int(time.time() * 1000)
+        window_start = now_ms - HISTORICAL_MINUTES * 60 * 1000
+        ranges = {}
+        for s in symbols:
+            # Pedir sólo lo posterior al último tick en disco y anterior al primero del WS
+            last = tick_store.tail(s, 1)
+            start = int(last['timestamp'][0]) + 1 if len(last) else window_start
+            end = now_ms if first[s] is None else first[s] - 1
+            ranges[s] = (max(start, window_start), end)
+            buffer.copy_shared(s)
+
+        sink = store_sink(tick_store) if persist else buffer_sink(buffer)
+        if not persist:
+            for s in symbols:
+                buffer.warm_start(s, tick_store)
+        backfill(ranges, sink, base_url=rest_url)
+        # Ticks WS descartados por el límite del gate mientras tanto
+        gaps = gate.take_gaps()
+        if gaps:
+            backfill(gaps, sink, base_url=rest_url)
+        if persist:
+            for s in symbols:
+                buffer.warm_start(s, tick_store)
+            buffer.enable_persistence(tick_store)
+    except Exception as e:
+        if DEBUG:
+            print(f"Historical backfill failed: {e}")
+    finally:
+        gate.release()
+    return ingest
+
+
+class StoreFollower:
+    """
+    Alimenta el buffer con los ticks que otro proceso (el colector de
+    `--ingest-only`) va escribiendo en el TickStore: al arrancar carga los
+    últimos `maxlen` de disco y después, cada `interval` segundos, lee lo
+    posterior al último tick leído de cada símbolo. El cursor es (último
+    timestamp, registros ya leídos con ese timestamp), así no se pierden
+    ni se repiten ticks del mismo milisegundo volcados en dos veces.
+    """
+
+    def __init__(self, store, symbols=None, buffer=None, interval=STORE_FOLLOW_INTERVAL):
+        self.store = store
+        self.symbols = [s.upper() for s in (symbols or TOP_SYMBOLS)]
+        self.buffer = buffer if buffer is not None else global_data_buffer
+        self.interval = interval
+        self.cursors = {}
+        self.running = False
+        self.thread = None
+
+    def poll(self):
+        """Añade al buffer los ticks nuevos en disco; devuelve cuántos se aceptaron"""
+        added = 0
+        for symbol in self.symbols:
+            cursor = self.cursors.get(symbol)
+            if cursor is None:
+                records = self.store.tail(symbol, self.buffer.maxlen)
+                fresh = records
+            else:
+                last_ts, seen = cursor
+                records = self.store.read(symbol, since=last_ts)
+                fresh = records[seen:]
+            if not len(fresh):
+                continue
+            timestamps = records['timestamp']
+            last_ts = int(timestamps[-1])
+            self.cursors[symbol] = (last_ts, len(records) - int(np.searchsorted(timestamps, last_ts, side='left')))
+            qtys = fresh['qty']
+            # qty = 0 en disco significa "cantidad desconocida"
+            added += self.buffer.add_ticks(symbol, fresh['timestamp'].tolist(), fresh['price'].tolist(),
+                                           qtys.tolist() if qtys.any() else None)
+        return added
+
+    def start(self):
+        self.poll()
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def _loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                if DEBUG:
+                    print(f"Error following tick store: {e}")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(5)
+
+
+class Service:
+    """
+    Ingesta, cómputo y API sin Streamlit. Según `mode`:
+
+    - 'all': backfill + ingesta WS, scheduler y API en un solo proceso.
+    - 'ingest': sólo el colector (backfill + ingesta WS), que persiste
+      siempre en el TickStore; sin scheduler, FastAPI ni SciPy.
+    - 'api': scheduler y API sobre los ticks que un colector escribe en
+      disco (ver StoreFollower), sin conexiones a Binance.
+
+    Cada dependencia pesada se importa sólo en el modo que la usa.
+    """
+
+    def __init__(self, mode='all', symbols=None, host="0.0.0.0", port=API_PORT, buffer=None,
+                 url_base=BINANCE_WS_URL, data_dir=DATA_DIR):
+        if mode not in MODES:
+            raise ValueError(f"Modo desconocido: {mode}")
+        self.mode = mode
+        self.parts = MODES[mode]
+        self.symbols = [s.upper() for s in (symbols or TOP_SYMBOLS)]
+        self.host = host
+        self.port = port
+        self.buffer = buffer if buffer is not None else global_data_buffer
+        self.url_base = url_base
+        self.data_dir = data_dir
+        self.tick_store = None
+        self.ingest = None
+        self.follower = None
+        self.scheduler = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Arranca todo salvo la API (ver run); no bloquea"""
+        self.tick_store = TickStore(self.data_dir, flush_interval=TICK_STORE_FLUSH_INTERVAL)
+        if 'compute' in self.parts:
+            # Estado de los modelos online antes de que la ingesta los alimente
+            self.buffer.models.load()
+        if 'ingest' in self.parts:
+            self.tick_store.start()
+            persist = PERSIST_TICKS or self.mode == 'ingest'
+            threading.Thread(target=self._start_ingest, args=(persist,), daemon=True).start()
+        else:
+            self.follower = StoreFollower(self.tick_store, self.symbols, self.buffer).start()
+        if 'compute' in self.parts:
+            from scheduler import Scheduler
+            from prediction_buffer import prediction_buffer
+
+            self.scheduler = Scheduler(self.buffer, prediction_buffer, self.symbols).start()
+        return self
+
+    def _start_ingest(self, persist):
+        ingest = start_ingest(self.tick_store, self.symbols, self.buffer, persist, self.url_base)
+        if self.stopped.is_set():
+            ingest.stop()
+        self.ingest = ingest
+
+    def run(self):
+        """Arranca el servicio y bloquea hasta SIGINT/SIGTERM (la API, si la hay, en este hilo)"""
+        self.start()
+        try:
+            if 'api' in self.parts:
+                from rest_api import run_api
+
+                run_api(self.host, self.port)
+            else:
+                signal.signal(signal.SIGTERM, lambda *_: self.stopped.set())
+                while not self.stopped.wait(1.0):
+                    pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopped.set()
+        if self.ingest is not None:
+            self.ingest.stop()
+        if self.follower is not None:
+            self.follower.stop()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self.tick_store is not None:
+            self.tick_store.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta, predicción y API sin la UI de Streamlit")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--ingest-only', action='store_true',
+                       help="Sólo el colector: backfill e ingesta WS persistidos en disco")
+    group.add_argument('--api-only', action='store_true',
+                       help="Sólo scheduler y API, leyendo los ticks que persiste un colector")
+    parser.add_argument('--symbols', nargs='+', default=TOP_SYMBOLS, help="Símbolos a seguir")
+    parser.add_argument('--host', default="0.0.0.0", help="Interfaz de la API")
+    parser.add_argument('--port', type=int, default=API_PORT, help="Puerto de la API")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Directorio del TickStore compartido entre modos")
+    args = parser.parse_args()
+
+    mode = 'ingest' if args.ingest_only else 'api' if args.api_only else 'all'
+    Service(mode, args.symbols, args.host, args.port, data_dir=args.data_dir).run()
+
+
+if __name__ == '__main__':
+    main()
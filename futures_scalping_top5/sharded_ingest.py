@@ -0,0 +1,172 @@
+# sharded_ingest.py
+
+import multiprocessing as mp
+import os
+import threading
+import time
+
+import numpy as np
+
+from config import TOP_SYMBOLS, BINANCE_WS_URL, WS_SHARDS, WS_SHARD_PROCESSES, DEPTH_ENABLED, DEBUG
+from data_buffer import data_buffer as global_data_buffer
+from ring_buffer import SharedTickRing
+from validation import TickValidator
+
+SYNC_INTERVAL = 0.02  # Segundos entre lecturas de los rings compartidos
+
+
+def split_symbols(symbols, shards):
+    """Reparte los símbolos en `shards` grupos de tamaño similar"""
+    shards = max(1, min(shards, len(symbols)))
+    return [symbols[i::shards] for i in range(shards)]
+
+
+class RingWriter:
+    """
+    Escritor de un proceso shard: valida cada lote y lo escribe en el
+    SharedTickRing del símbolo, nada más. Indicadores, barras, modelos y
+    persistencia los calcula una sola vez el proceso principal al leer
+    los rings (DataBuffer.sync_shared).
+    """
+
+    def __init__(self, rings):
+        self.rings = rings
+        self.validator = TickValidator()
+
+    def add_ticks(self, symbol, timestamps, prices, qtys=None, sides=None, trade_ids=None):
+        """Misma firma que DataBuffer.add_ticks (callback on_batch del cliente WS)"""
+        symbol_key = symbol.upper()
+        ring = self.rings.get(symbol_key)
+        if ring is None:
+            return 0
+        mask = self.validator.filter(symbol_key, timestamps, prices, trade_ids)
+        accepted = np.flatnonzero(mask).tolist()
+        if len(accepted) < len(prices):
+            if DEBUG:
+                print(f"Rejected {len(prices) - len(accepted)} ticks for {symbol_key}")
+            timestamps = [timestamps[i] for i in accepted]
+            prices = [prices[i] for i in accepted]
+            qtys = None if qtys is None else [qtys[i] for i in accepted]
+            sides = None if sides is None else [sides[i] for i in accepted]
+        if accepted:
+            ring.extend(timestamps, prices, qtys, sides)
+        return len(accepted)
+
+
+def _shard_worker(symbols, ring_names, url_base, stop_event):
+    """Proceso de un shard: conexión WS propia escribiendo en rings compartidos"""
+    from ws_client import BinanceWSClient
+
+    rings = {symbol: SharedTickRing.attach(name) for symbol, name in ring_names.items()}
+    writer = RingWriter(rings)
+
+    # El libro de órdenes vive en el proceso principal (ver ShardedIngest._start_processes)
+    client = BinanceWSClient(symbols=symbols, url_base=url_base, on_batch=writer.add_ticks, depth=False)
+    client.start()
+    stop_event.wait()
+    client.stop()
+    client.thread.join(10)
+    for ring in rings.values():
+        ring.close()
+
+
+class ShardedIngest:
+    """
+    Reparte los símbolos entre N conexiones WebSocket, cada una con su
+    propio backoff de reconexión.
+
+    En modo hilos cada shard es un BinanceWSClient que escribe en el
+    DataBuffer global. En modo procesos cada shard corre en su propio
+    proceso y escribe en un SharedTickRing por símbolo; el DataBuffer del
+    proceso principal usa esos rings directamente (lecturas sin copia, o
+    copiados a un ring local tras DataBuffer.copy_shared) y un hilo
+    sincroniza indicadores y estadísticas con los ticks nuevos.
+    Con profundidad (`depth`), en modo procesos el proceso principal abre
+    además una conexión sólo de diffs para que el libro sea legible aquí.
+    """
+
+    def __init__(self, symbols=None, shards=WS_SHARDS, processes=WS_SHARD_PROCESSES,
+                 url_base=BINANCE_WS_URL, buffer=None, capacity=None, depth=DEPTH_ENABLED):
+        self.symbols = [s.upper() for s in (symbols or TOP_SYMBOLS)]
+        self.groups = split_symbols(self.symbols, shards)
+        self.processes = processes
+        self.depth = depth
+        self.url_base = url_base
+        self.buffer = buffer or global_data_buffer
+        self.capacity = capacity or self.buffer.maxlen
+        self.clients = []
+        self.workers = []
+        self.rings = {}
+        self.running = False
+
+    def start(self):
+        self.running = True
+        if self.processes:
+            self._start_processes()
+        else:
+            self._start_threads()
+        return self
+
+    def _start_threads(self):
+        from ws_client import BinanceWSClient
+
+        for group in self.groups:
+            client = BinanceWSClient(symbols=group, url_base=self.url_base, on_batch=self.buffer.add_ticks,
+                                     depth=self.depth)
+            client.start()
+            self.clients.append(client)
+
+    def _start_processes(self):
+        ctx = mp.get_context('spawn')
+        self.stop_event = ctx.Event()
+        prefix = f"fst5_{os.getpid()}"
+        for symbol in self.symbols:
+            ring = SharedTickRing.create(f"{prefix}_{symbol}", self.capacity)
+            self.rings[symbol] = ring
+            self.buffer.attach_ring(symbol, ring)
+
+        for group in self.groups:
+            names = {symbol: self.rings[symbol].shm.name for symbol in group}
+            worker = ctx.Process(
+                target=_shard_worker,
+                args=(group, names, self.url_base, self.stop_event),
+                daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+        self.sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self.sync_thread.start()
+
+        if self.depth:
+            from ws_client import BinanceWSClient
+
+            client = BinanceWSClient(symbols=self.symbols, url_base=self.url_base, trades=False, depth=True)
+            client.start()
+            self.clients.append(client)
+
+    def _sync_loop(self):
+        while self.running:
+            try:
+                self.buffer.sync_shared()
+            except Exception as e:
+                if DEBUG:
+                    print(f"Error syncing shared rings: {e}")
+            time.sleep(SYNC_INTERVAL)
+
+    def stop(self):
+        self.running = False
+        for client in self.clients:
+            client.stop()
+        if self.workers:
+            self.stop_event.set()
+            for worker in self.workers:
+                worker.join(10)
+                if worker.is_alive():
+                    worker.terminate()
+            self.sync_thread.join(5)
+            self.buffer.sync_shared()
+        for symbol, ring in self.rings.items():
+            self.buffer.detach_ring(symbol)
+            ring.close()
+        self.rings = {}
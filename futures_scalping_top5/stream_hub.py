@@ -0,0 +1,112 @@
+# stream_hub.py
+
+from collections import OrderedDict
+import math
+import threading
+
+import fastjson
+from config import STREAM_MAX_TICKS
+
+# Frames codificados que se conservan para reutilizarlos entre clientes
+FRAME_CACHE_SIZE = 256
+
+
+class StreamHub:
+    """
+    Construye los deltas que se envían a los clientes en streaming.
+
+    El cursor de un cliente es (secuencia de ticks, secuencia de
+    predicciones) de un símbolo. Un delta contiene sólo lo ocurrido desde
+    ese cursor: ticks nuevos en columnas, predicciones añadidas o
+    emparejadas y los indicadores actuales. Cada frame se codifica una vez
+    y se comparte entre todos los clientes que están en el mismo cursor.
+    """
+
+    def __init__(self, buffer, predictions=None, max_ticks=STREAM_MAX_TICKS):
+        self.buffer = buffer
+        self.predictions = predictions
+        self.max_ticks = max_ticks
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def cursor(self, symbol):
+        symbol = symbol.upper()
+        pred_seq = self.predictions.get_sequence(symbol) if self.predictions is not None else 0
+        return self.buffer.get_sequence(symbol), pred_seq
+
+    def delta(self, symbol, since=0, pred_since=0):
+        """
+        Devuelve (cursor, frame) con el frame JSON codificado en bytes, o
+        (cursor, None) si no hay nada nuevo desde (since, pred_since).
+        """
+        symbol = symbol.upper()
+        cursor = self.cursor(symbol)
+        if cursor == (since, pred_since):
+            return cursor, None
+
+        key = (symbol, since, pred_since)
+        with self.lock:
+            cached = self.frames.get(key)
+            if cached is not None and cached[0] == cursor:
+                self.frames.move_to_end(key)
+                return cached
+
+        cursor, frame = self._build(symbol, since, pred_since)
+        encoded = fastjson.dumps(frame)
+        with self.lock:
+            self.frames[key] = (cursor, encoded)
+            self.frames.move_to_end(key)
+            while len(self.frames) > FRAME_CACHE_SIZE:
+                self.frames.popitem(last=False)
+        return cursor, encoded
+
+    def _build(self, symbol, since, pred_since):
+        seq = self.buffer.get_sequence(symbol)
+        current_pred = self.predictions.get_sequence(symbol) if self.predictions is not None else 0
+        # Un cursor (de ticks o de predicciones) del futuro viene de otra
+        # ejecución del servidor: empezar de cero
+        reset = since > seq or pred_since > current_pred
+        if reset:
+            since, pred_since = 0, 0
+
+        ticks = None
+        gap = False
+        if seq > since:
+            seq, window = self.buffer.get_snapshot(symbol, min(seq - since, self.max_ticks))
+            new = seq - since
+            gap = new > len(window)
+            window = window[max(len(window) - new, 0):]
+            ticks = {'timestamp': window.timestamp, 'price': window.price}
+
+        pred_seq, predictions, pred_gap = 0, [], False
+        if self.predictions is not None:
+            pred_seq, predictions, pred_gap = self.predictions.changes_since(symbol, pred_since)
+
+        frame = {
+            'symbol': symbol,
+            'seq': seq,
+            'pred_seq': pred_seq,
+            'reset': reset,
+            'gap': gap or pred_gap
+        }
+        if ticks is not None:
+            frame['ticks'] = ticks
+            indicators = self.buffer.get_indicators(symbol)
+            if indicators is not None:
+                # NaN no es JSON válido
+                frame['indicators'] = {
+                    k: (None if isinstance(v, float) and math.isnan(v) else v)
+                    for k, v in indicators.items()
+                }
+        if predictions:
+            frame['predictions'] = predictions
+        return (seq, pred_seq), frame
+
+
+def parse_event_id(event_id):
+    """Convierte un id SSE 'seq:pred_seq' en cursor; (0, 0) si no es válido"""
+    try:
+        seq, pred_seq = event_id.split(':')
+        return int(seq), int(pred_seq)
+    except (AttributeError, ValueError):
+        return 0, 0
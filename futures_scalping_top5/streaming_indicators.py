@@ -0,0 +1,281 @@
+# streaming_indicators.py
+
+from collections import deque
+import math
+import threading
+import time
+
+try:
+    from config import RSI_PERIOD, BOLLINGER_WINDOW, BOLLINGER_STD, EMA_PERIOD, ATR_PERIOD
+except ImportError:
+    RSI_PERIOD = 14
+    BOLLINGER_WINDOW = 20
+    BOLLINGER_STD = 2
+    EMA_PERIOD = 20
+    ATR_PERIOD = 14
+
+MS_PER_DAY = 86_400_000
+
+
+class WilderRSI:
+    """RSI de Wilder actualizado en O(1) por tick"""
+
+    def __init__(self, period=RSI_PERIOD):
+        self.period = period
+        self.prev_price = None
+        self.count = 0  # Número de deltas vistos
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def update(self, price):
+        if self.prev_price is None:
+            self.prev_price = price
+            return
+        delta = price - self.prev_price
+        self.prev_price = price
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        self.count += 1
+        if self.count <= self.period:
+            # Semilla: media simple de los primeros `period` deltas
+            self.avg_gain += gain / self.period
+            self.avg_loss += loss / self.period
+        else:
+            self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+
+    @property
+    def value(self):
+        if self.count < self.period:
+            return math.nan
+        if self.avg_loss < 1e-10:  # Evitar división por cero
+            return 100.0 if self.avg_gain > 0 else 50.0
+        rs = self.avg_gain / self.avg_loss
+        return 100.0 - (100.0 / (1.0 + rs))
+
+
+class RollingStats:
+    """Media y varianza poblacional de una ventana móvil (Welford)"""
+
+    # Recalcular desde la ventana cada N actualizaciones para acotar el error acumulado
+    RESYNC_EVERY = 10_000
+
+    def __init__(self, window=BOLLINGER_WINDOW):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+
+    def update(self, x):
+        n = len(self.values)
+        if n < self.window:
+            self.values.append(x)
+            delta = x - self.mean
+            self.mean += delta / (n + 1)
+            self.m2 += delta * (x - self.mean)
+        else:
+            old = self.values[0]
+            self.values.append(x)
+            old_mean = self.mean
+            self.mean += (x - old) / n
+            self.m2 += (x - old) * (x - self.mean + old - old_mean)
+        self.updates += 1
+        if self.updates % self.RESYNC_EVERY == 0:
+            self._resync()
+
+    def _resync(self):
+        n = len(self.values)
+        self.mean = sum(self.values) / n
+        self.m2 = sum((v - self.mean) ** 2 for v in self.values)
+
+    @property
+    def variance(self):
+        n = len(self.values)
+        if n == 0:
+            return math.nan
+        return max(self.m2, 0.0) / n
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def ready(self):
+        return len(self.values) >= self.window
+
+    def bollinger(self, num_std=BOLLINGER_STD):
+        if not self.ready:
+            return (math.nan, math.nan, math.nan)
+        std = self.std
+        return (self.mean - num_std * std, self.mean, self.mean + num_std * std)
+
+
+class EMA:
+    """Media móvil exponencial sembrada con el primer valor"""
+
+    def __init__(self, period=EMA_PERIOD):
+        self.alpha = 2.0 / (period + 1)
+        self.value = math.nan
+
+    def update(self, x):
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+
+
+class VWAP:
+    """VWAP acumulado que se reinicia en cada día UTC"""
+
+    def __init__(self):
+        self.day = None
+        self.pv = 0.0
+        self.volume = 0.0
+
+    def update(self, price, qty, timestamp):
+        day = timestamp // MS_PER_DAY
+        if day != self.day:
+            self.day = day
+            self.pv = 0.0
+            self.volume = 0.0
+        self.pv += price * qty
+        self.volume += qty
+
+    @property
+    def value(self):
+        if self.volume <= 0:
+            return math.nan
+        return self.pv / self.volume
+
+
+class ATR:
+    """ATR de Wilder sobre el rango verdadero entre ticks consecutivos"""
+
+    def __init__(self, period=ATR_PERIOD):
+        self.period = period
+        self.prev_price = None
+        self.count = 0
+        self.value_ = 0.0
+
+    def update(self, price):
+        if self.prev_price is None:
+            self.prev_price = price
+            return
+        tr = abs(price - self.prev_price)
+        self.prev_price = price
+        self.count += 1
+        if self.count <= self.period:
+            self.value_ += tr / self.period
+        else:
+            self.value_ = (self.value_ * (self.period - 1) + tr) / self.period
+
+    @property
+    def value(self):
+        return self.value_ if self.count >= self.period else math.nan
+
+
+class SymbolIndicators:
+    """
+    Estado de todos los indicadores de un símbolo.
+    `version` funciona como seqlock: es impar mientras se actualiza, así que
+    los lectores obtienen snapshots consistentes sin bloquear al escritor.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.rsi = WilderRSI()
+        self.stats = RollingStats()
+        self.ema = EMA()
+        self.vwap = VWAP()
+        self.atr = ATR()
+        self.last_price = math.nan
+        self.last_timestamp = None
+        self.ticks = 0
+        self.last_snapshot = None  # Último snapshot consistente leído
+
+    def update(self, timestamp, price, qty=None):
+        self.version += 1
+        self.rsi.update(price)
+        self.stats.update(price)
+        self.ema.update(price)
+        self.vwap.update(price, 1.0 if qty is None else qty, timestamp)
+        self.atr.update(price)
+        self.last_price = price
+        self.last_timestamp = timestamp
+        self.ticks += 1
+        self.version += 1
+
+    def snapshot(self, retries=100):
+        """
+        Lectura consistente de los indicadores. Si el escritor no deja leer
+        en `retries` intentos se devuelve el último snapshot consistente
+        (de un tick anterior), nunca una mezcla a medio actualizar.
+        """
+        for _ in range(retries):
+            version = self.version
+            if version % 2 == 0:
+                snap = self._read()
+                if self.version == version:
+                    self.last_snapshot = snap
+                    return snap
+            time.sleep(0)
+        if self.last_snapshot is None:
+            raise RuntimeError("SymbolIndicators.snapshot: el escritor no dejó leer un estado consistente")
+        return self.last_snapshot
+
+    def _read(self):
+        lower, middle, upper = self.stats.bollinger()
+        return {
+            'rsi': self.rsi.value,
+            'bb_lower': lower,
+            'bb_middle': middle,
+            'bb_upper': upper,
+            'ema': self.ema.value,
+            'vwap': self.vwap.value,
+            'atr': self.atr.value,
+            'last_price': self.last_price,
+            'timestamp': self.last_timestamp,
+            'ticks': self.ticks
+        }
+
+
+class IndicatorEngine:
+    """
+    Motor de indicadores incrementales por símbolo.
+
+    Cada tick aceptado por DataBuffer se pasa a update() y cuesta O(1);
+    los valores actuales se leen con get() sin recorrer el historial.
+    Los resultados coinciden con las funciones de indicators.py aplicadas
+    sobre toda la serie desde el primer tick (calculate_vwap con los
+    timestamps, para el mismo reinicio diario).
+    """
+
+    def __init__(self):
+        self.symbols = {}
+        self.lock = threading.Lock()  # Sólo para escritores
+
+    def _state(self, symbol_key):
+        state = self.symbols.get(symbol_key)
+        if state is None:
+            state = self.symbols[symbol_key] = SymbolIndicators()
+        return state
+
+    def update(self, symbol, timestamp, price, qty=None):
+        with self.lock:
+            self._state(symbol.upper()).update(timestamp, price, qty)
+
+    def update_many(self, symbol, timestamps, prices, qtys=None):
+        with self.lock:
+            state = self._state(symbol.upper())
+            if qtys is None:
+                for ts, price in zip(timestamps, prices):
+                    state.update(ts, price)
+            else:
+                for ts, price, qty in zip(timestamps, prices, qtys):
+                    state.update(ts, price, qty)
+
+    def get(self, symbol):
+        """Valores actuales de los indicadores o None si no hay datos"""
+        state = self.symbols.get(symbol.upper())
+        return state.snapshot() if state is not None else None
@@ -0,0 +1,194 @@
+# sweep.py
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import json
+import os
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import TOP_SYMBOLS, PREDICTION_INTERVAL, PREDICTION_HORIZON, DEBUG
+from backtest import fast_backtest, load_ticks, synthetic_ticks, _report
+from predictor import DEFAULT_PROFILE, PROFILES_PATH
+
+# Rejilla por defecto de los parámetros del predictor
+DEFAULT_GRID = {
+    'window_size': [50, 100, 200, 400],
+    'savgol_window': [11, 21, 51, 101],
+    'polyorder': [1, 2, 3],
+    'decay': [0.0, 1.0, 2.0, 4.0]
+}
+# Combinaciones por tarea enviada al pool (amortiza el coste de cada envío)
+TASK_SIZE = 8
+
+# Arrays de ticks del proceso worker, mapeados desde memoria compartida
+_shared = {}
+
+
+def _valid(params):
+    """Descarta combinaciones que savgol_filter no admite"""
+    window = min(params['savgol_window'], params['window_size'])
+    if window % 2 == 0:
+        window -= 1
+    return params['polyorder'] < window
+
+
+def grid_params(grid):
+    """Todas las combinaciones de la rejilla"""
+    keys = list(grid)
+    combos = (dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys)))
+    return [p for p in combos if _valid(p)]
+
+
+def random_params(grid, n, seed=0):
+    """n combinaciones al azar (sin repetir) tomadas de la rejilla"""
+    combos = grid_params(grid)
+    return random.Random(seed).sample(combos, min(n, len(combos)))
+
+
+class SharedTicks:
+    """
+    Ticks de todos los símbolos copiados una vez a memoria compartida.
+    Los workers los mapean por nombre en lugar de recibirlos serializados.
+    """
+
+    def __init__(self, data):
+        self.blocks = []
+        self.layout = {}
+        for symbol, (timestamps, prices) in data.items():
+            n = len(timestamps)
+            block = shared_memory.SharedMemory(create=True, size=max(16 * n, 1))
+            np.ndarray(n, dtype=np.int64, buffer=block.buf)[:] = timestamps
+            np.ndarray(n, dtype=np.float64, buffer=block.buf, offset=8 * n)[:] = prices
+            self.blocks.append(block)
+            self.layout[symbol] = (block.name, n)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+def _attach(layout):
+    """Inicializador del worker: mapea los bloques compartidos"""
+    for symbol, (name, n) in layout.items():
+        block = shared_memory.SharedMemory(name=name)
+        timestamps = np.ndarray(n, dtype=np.int64, buffer=block.buf)
+        prices = np.ndarray(n, dtype=np.float64, buffer=block.buf, offset=8 * n)
+        _shared[symbol] = (block, timestamps, prices)
+
+
+def _evaluate(symbol, combos, interval, horizon):
+    """Evalúa una lista de combinaciones sobre los ticks compartidos de `symbol`"""
+    _, timestamps, prices = _shared[symbol]
+    results = []
+    for params in combos:
+        t0 = time.perf_counter()
+        base, predicted, actual = fast_backtest(timestamps, prices, interval, horizon, **params)
+        result = _report(symbol, base, predicted, actual, time.perf_counter() - t0)
+        result['params'] = params
+        results.append(result)
+    return results
+
+
+def _score(result, metric):
+    """Menor es mejor"""
+    value = result[metric]
+    if value is None:
+        return float('inf')
+    return -value if metric == 'hit_rate' else value
+
+
+def run_sweep(data, combos, interval=PREDICTION_INTERVAL, horizon=PREDICTION_HORIZON,
+              workers=None, metric='mae'):
+    """
+    Evalúa `combos` para cada símbolo de `data` ({symbol: (timestamps,
+    prices)}) repartiendo el trabajo en un ProcessPoolExecutor.
+    Devuelve ({symbol: mejor resultado}, todos los resultados).
+    """
+    shared = SharedTicks(data)
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 initializer=_attach, initargs=(shared.layout,)) as pool:
+            futures = [
+                pool.submit(_evaluate, symbol, combos[i:i + TASK_SIZE], interval, horizon)
+                for symbol in data
+                for i in range(0, len(combos), TASK_SIZE)
+            ]
+            for future in futures:
+                results.extend(future.result())
+    finally:
+        shared.close()
+
+    best = {}
+    for result in results:
+        current = best.get(result['symbol'])
+        if current is None or _score(result, metric) < _score(current, metric):
+            best[result['symbol']] = result
+    return best, results
+
+
+def save_profiles(best, path=PROFILES_PATH):
+    """
+    Guarda el mejor perfil de cada símbolo (junto a sus métricas) y
+    conserva los de símbolos no barridos.
+    """
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = json.load(f)
+    for symbol, result in best.items():
+        profile = dict(DEFAULT_PROFILE, **result['params'])
+        profile['metrics'] = {k: result[k] for k in ('predictions', 'mae', 'hit_rate')}
+        profiles[symbol] = profile
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp, path)
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Barrido de parámetros del predictor por símbolo")
+    parser.add_argument('--symbols', nargs='*', default=TOP_SYMBOLS)
+    parser.add_argument('--synthetic-hours', type=float, help="Usar ticks sintéticos en vez de DATA_DIR")
+    parser.add_argument('--since', type=int, help="Inicio en ms (ticks grabados)")
+    parser.add_argument('--until', type=int, help="Fin en ms (ticks grabados)")
+    parser.add_argument('--interval', type=float, default=PREDICTION_INTERVAL)
+    parser.add_argument('--horizon', type=int, default=PREDICTION_HORIZON)
+    parser.add_argument('--random', type=int, help="Probar N combinaciones al azar en vez de toda la rejilla")
+    parser.add_argument('--grid', help="Fichero JSON con la rejilla {parámetro: [valores]}")
+    parser.add_argument('--metric', choices=['mae', 'mape', 'hit_rate'], default='mae')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default=PROFILES_PATH, help="Fichero de perfiles")
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    combos = random_params(grid, args.random) if args.random else grid_params(grid)
+
+    if args.synthetic_hours:
+        data = synthetic_ticks(args.symbols, args.synthetic_hours)
+    else:
+        from tick_store import TickStore
+        data = load_ticks(TickStore(), args.symbols, args.since, args.until)
+
+    t0 = time.perf_counter()
+    best, results = run_sweep(data, combos, args.interval, args.horizon, args.workers, args.metric)
+    if DEBUG:
+        print(f"Evaluated {len(results)} runs in {time.perf_counter() - t0:.1f}s")
+    for symbol, result in best.items():
+        print(json.dumps({'symbol': symbol, 'params': result['params'], args.metric: result[args.metric]}))
+    save_profiles(best, args.output)
+
+
+if __name__ == '__main__':
+    main()
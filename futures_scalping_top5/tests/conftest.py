@@ -0,0 +1,7 @@
+# conftest.py
+
+import os
+import sys
+
+# Los módulos del proyecto se importan planos (from config import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+# test_backtest.py
+
+import numpy as np
+
+from alert_engine import AlertEngine, AlertRule
+from backtest import replay_backtest, run_backtest, synthetic_ticks
+
+
+def test_replay_fires_alerts_at_tick_times():
+    timestamps = 1_700_000_000_000 + np.arange(600) * 100
+    prices = np.full(600, 100.0)
+    prices[200:300] = 102.0    # Sube en el tick 200 y vuelve en el 300
+    prices[450:] = 103.0
+    engine = AlertEngine(rules=[AlertRule('high', 'price', 'above', 101.0, cooldown=0)])
+
+    *_, events = replay_backtest(timestamps, prices, 'btcusdt', alerts=engine)
+
+    fired = [(e['kind'], e['timestamp']) for e in events]
+    assert fired == [('triggered', timestamps[200]), ('cleared', timestamps[300]),
+                     ('triggered', timestamps[450])]
+    assert all(e['symbol'] == 'BTCUSDT' for e in events)
+
+
+def test_replay_report_has_alerts_per_symbol():
+    data = synthetic_ticks(['BTCUSDT', 'ETHUSDT'], hours=0.05)
+
+    results = run_backtest(data, mode='replay')
+
+    assert [r['symbol'] for r in results] == ['BTCUSDT', 'ETHUSDT']
+    for result in results:
+        assert result['alerts'] == len(result['alert_times']) == sum(result['alerts_by_rule'].values())
+        assert result['alert_times'] == sorted(result['alert_times'])
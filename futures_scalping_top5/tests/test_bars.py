@@ -0,0 +1,50 @@
+# test_bars.py
+
+import threading
+
+import numpy as np
+import pytest
+
+from bars import BarEngine, BarSeries
+
+
+def test_reads_see_every_tick_without_the_writer_lock():
+    engine = BarEngine(intervals={'1s': 1000}, ticks=10, volume_sizes={})
+    engine.update_many('BTCUSDT', [0, 400, 1200], [100.0, 101.0, 99.0], [1.0, 1.0, 1.0])
+    engine.update('BTCUSDT', 1500, 102.0, 2.0)
+
+    result = []
+    with engine.lock:
+        # Con el lock tomado por un escritor, la lectura no se bloquea
+        reader = threading.Thread(target=lambda: result.append(engine.get('BTCUSDT', '1s')))
+        reader.start()
+        reader.join(5)
+    assert not reader.is_alive()
+    bars = result[0]
+    assert bars['time'].tolist() == [0, 1000]
+    assert bars['close'].tolist() == [101.0, 102.0]
+    assert bars['volume'].tolist() == [2.0, 3.0]
+    assert engine.get('BTCUSDT', '10t')['trades'].tolist() == [4]
+
+
+def test_batch_equals_tick_by_tick():
+    rng = np.random.default_rng(3)
+    timestamps = np.cumsum(rng.integers(0, 300, 500))
+    prices = 100.0 + np.cumsum(rng.normal(0, 0.1, 500))
+    qtys = rng.uniform(0.1, 2.0, 500)
+    batch, single = BarSeries('volume', 5.0), BarSeries('volume', 5.0)
+    batch.update_many(timestamps, prices, qtys)
+    for t, p, q in zip(timestamps.tolist(), prices.tolist(), qtys.tolist()):
+        single.update(t, p, q)
+    a, b = batch.window(), single.window()
+    for field in ('time', 'close_time', 'open', 'high', 'low', 'close', 'trades'):
+        assert a[field].tolist() == b[field].tolist()
+    assert a['volume'] == pytest.approx(b['volume'])
+
+
+def test_window_never_returns_a_torn_read():
+    series = BarSeries('time', 1000)
+    series.update(0, 100.0)
+    series.version += 1    # Escritor a medio actualizar
+    with pytest.raises(RuntimeError):
+        series.window(retries=3)
@@ -0,0 +1,106 @@
+# test_historical_data.py
+
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+import fake_binance
+import historical_data
+from data_buffer import DataBuffer
+from fake_binance import FakeBinanceREST, synthetic_agg_trades
+from historical_data import (PAGE_LIMIT, MAX_TIME_WINDOW_MS, RateLimiter, backfill, backfill_symbol, buffer_sink,
+                             store_sink)
+from tick_store import TickStore
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT']
+
+
+def _range(columns, last=None):
+    """Rango que empieza dos horas antes del primer trade (varias ventanas vacías) y acaba en el trade `last`"""
+    end = int(columns['T'][-1 if last is None else last])
+    return int(columns['T'][0]) - 2 * MAX_TIME_WINDOW_MS, end
+
+
+def test_backfill_pages_by_from_id_through_429(tmp_path):
+    n = 2 * PAGE_LIMIT + 500
+    data = synthetic_agg_trades(SYMBOLS, n)
+    # Una de cada 4 peticiones recibe 429 con Retry-After
+    server = FakeBinanceREST(data, throttle_every=4, retry_after=0.5).start()
+    try:
+        ranges = {s: _range(data[s], last=n - 300) for s in SYMBOLS}
+        store = TickStore(str(tmp_path))
+        started = time.monotonic()
+        totals = backfill(ranges, store_sink(store), base_url=server.url)
+        elapsed = time.monotonic() - started
+    finally:
+        server.stop()
+
+    assert server.throttled > 0
+    assert elapsed >= 0.5
+    for symbol in SYMBOLS:
+        columns = data[symbol]
+        # El trade `last` comparte milisegundo con los siguientes: entran todos los de T <= fin
+        expected = columns['a'][columns['T'] <= ranges[symbol][1]]
+        records = store.read(symbol)
+        assert totals[symbol] == len(expected)
+        # Sin huecos ni repetidos entre páginas
+        assert np.array_equal(records['trade_id'], expected)
+        assert np.array_equal(records['timestamp'], columns['T'][:len(expected)])
+        assert np.allclose(records['price'], np.round(columns['p'][:len(expected)], 4))
+    store.stop()
+
+
+def test_backfill_into_buffer():
+    n = PAGE_LIMIT + 10
+    data = synthetic_agg_trades(SYMBOLS, n, seed=3)
+    server = FakeBinanceREST(data).start()
+    buffer = DataBuffer(maxlen=2 * n)
+    try:
+        totals = backfill({s: _range(data[s]) for s in SYMBOLS}, buffer_sink(buffer), base_url=server.url)
+    finally:
+        server.stop()
+    for symbol in SYMBOLS:
+        assert totals[symbol] == n
+        assert buffer.get_sequence(symbol) == n
+        assert np.array_equal(buffer.get_window(symbol).timestamp, data[symbol]['T'])
+
+
+class FakeClock:
+    """Reloj desplazado para que el siguiente minuto empiece en `lead` segundos"""
+
+    def __init__(self, lead):
+        now = time.time()
+        self.boundary = (int(now) // 60 + 2) * 60
+        self.offset = self.boundary - lead - now
+
+    def time(self):
+        return time.time() + self.offset
+
+
+def test_used_weight_pauses_until_next_minute(monkeypatch):
+    n = 2 * PAGE_LIMIT + 500
+    data = synthetic_agg_trades(['BTCUSDT'], n)
+    clock = FakeClock(lead=0.3)
+    # El servidor también cuenta el peso por minutos de este reloj
+    monkeypatch.setattr(historical_data, 'time', clock)
+    monkeypatch.setattr(fake_binance, 'time', clock)
+    # Tres páginas de peso 2: la segunda llega al límite y la tercera espera al minuto siguiente
+    server = FakeBinanceREST(data, weight=2).start()
+    pages = []
+
+    async def run():
+        limiter = RateLimiter(concurrency=2, max_weight=4)
+        async with httpx.AsyncClient(base_url=server.url) as client:
+            columns = data['BTCUSDT']
+            return await backfill_symbol(client, limiter, 'BTCUSDT', int(columns['T'][0]), int(columns['T'][-1]),
+                                         lambda symbol, ts, *_: pages.append((clock.time(), len(ts))))
+
+    try:
+        total = asyncio.run(run())
+    finally:
+        server.stop()
+    assert total == n
+    assert [size for _, size in pages] == [PAGE_LIMIT, PAGE_LIMIT, 500]
+    assert pages[1][0] < clock.boundary <= pages[2][0]
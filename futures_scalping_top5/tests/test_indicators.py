@@ -0,0 +1,44 @@
+# test_indicators.py
+
+import numpy as np
+import pytest
+
+from indicators import calculate_vwap
+from streaming_indicators import IndicatorEngine, MS_PER_DAY
+
+
+@pytest.mark.parametrize('with_qty', [True, False])
+def test_vwap_matches_streaming_across_midnight(with_qty):
+    rng = np.random.default_rng(2)
+    n = 2000
+    # La serie cruza la medianoche UTC a mitad de camino
+    timestamps = 19_700 * MS_PER_DAY - 1000 * (n // 2) + np.arange(n) * 1000
+    prices = 100.0 + np.cumsum(rng.normal(0, 0.05, n))
+    qtys = rng.uniform(0.1, 5.0, n) if with_qty else None
+
+    for end in (n // 2 - 1, n // 2, n // 2 + 1, n):
+        engine = IndicatorEngine()
+        engine.update_many('BTCUSDT', timestamps[:end].tolist(), prices[:end].tolist(),
+                           None if qtys is None else qtys[:end].tolist())
+        expected = calculate_vwap(prices[:end], None if qtys is None else qtys[:end], timestamps[:end])
+        assert engine.get('BTCUSDT')['vwap'] == pytest.approx(expected, rel=1e-12)
+
+    # Tras la medianoche sólo cuentan los ticks del nuevo día
+    day = slice(n // 2, n)
+    assert expected == pytest.approx(calculate_vwap(prices[day], None if qtys is None else qtys[day]))
+
+
+def test_snapshot_never_returns_a_torn_read():
+    engine = IndicatorEngine()
+    engine.update_many('BTCUSDT', [1, 2, 3], [100.0, 101.0, 102.0])
+    state = engine.symbols['BTCUSDT']
+    before = engine.get('BTCUSDT')
+
+    # Escritor a medio actualizar: el estado ya tiene el tick nuevo pero la versión es impar
+    state.version += 1
+    state.last_price, state.ticks = 103.0, 4
+    assert state.snapshot(retries=3) == before
+
+    state.last_snapshot = None
+    with pytest.raises(RuntimeError):
+        state.snapshot(retries=3)
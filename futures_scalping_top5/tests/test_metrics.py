@@ -0,0 +1,35 @@
+# test_metrics.py
+
+import numpy as np
+
+from metrics import Histogram, VECTOR_MIN_BATCH
+
+
+def test_negative_values_count_as_zero():
+    histogram = Histogram()
+    histogram.record(-0.004)
+    assert histogram.counts[0] == 1
+    assert histogram.sum == 0.0
+    assert histogram.quantile(0.5) == histogram.lowest
+
+
+def test_negative_values_vectorized_match_scalar():
+    values = np.r_[-0.004, -1e-9, 0.0, 5e-7, 0.002, 0.5, -3.0, 200.0]
+    values = np.tile(values, VECTOR_MIN_BATCH)
+    scalar, vector = Histogram(), Histogram()
+    for value in values:
+        scalar.record(float(value))
+    vector.record_many(values)
+    assert vector.counts == scalar.counts
+    assert vector.count == scalar.count == len(values)
+    assert np.isclose(vector.sum, scalar.sum)
+    assert vector.sum >= 0
+
+
+def test_quantiles_within_relative_error():
+    values = np.random.default_rng(0).lognormal(-7, 1, 10_000)
+    histogram = Histogram()
+    histogram.record_many(values)
+    for q in (0.5, 0.9, 0.99):
+        exact = np.quantile(values, q)
+        assert exact <= histogram.quantile(q) <= exact * 1.07
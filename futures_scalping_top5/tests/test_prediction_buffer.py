@@ -0,0 +1,49 @@
+# test_prediction_buffer.py
+
+import numpy as np
+
+from backtest import _match_indices
+from prediction_buffer import PredictionBuffer, MATCH_WINDOW_MS
+
+
+def _setup(seed=5, n=3000, predictions=400):
+    rng = np.random.default_rng(seed)
+    # Huecos ocasionales más largos que la ventana de emparejamiento
+    gaps = np.where(rng.random(n) < 0.002, MATCH_WINDOW_MS + 5000, rng.integers(0, 200, n))
+    timestamps = 1_700_000_000_000 + np.cumsum(gaps)
+    prices = 100.0 + np.cumsum(rng.normal(0, 0.01, n))
+    targets = np.sort(rng.integers(timestamps[0] - 1000, timestamps[-1] + 1000, predictions))
+    buffers = []
+    for _ in range(2):
+        buffer = PredictionBuffer(maxlen=10 * predictions)
+        for i, target in enumerate(targets.tolist()):
+            buffer.add_prediction(target, float(i), 'BTCUSDT')
+        buffers.append(buffer)
+    return rng, timestamps, prices, targets, buffers
+
+
+def test_batch_match_equals_tick_by_tick_and_backtest():
+    rng, timestamps, prices, targets, (scalar, batched) = _setup()
+    for t, p in zip(timestamps.tolist(), prices.tolist()):
+        scalar.match_actual_price({'symbol': 'BTCUSDT', 'timestamp': t, 'price': p})
+
+    bounds = np.r_[0, np.sort(rng.choice(np.arange(1, len(timestamps)), 60, replace=False)), len(timestamps)]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        batched.match_actual_prices('BTCUSDT', timestamps[lo:hi], prices[lo:hi])
+
+    actual = [e['actual_price'] for e in batched.get_predictions('BTCUSDT')]
+    assert actual == [e['actual_price'] for e in scalar.get_predictions('BTCUSDT')]
+    assert batched.get_sequence('BTCUSDT') == scalar.get_sequence('BTCUSDT')
+
+    match = _match_indices(timestamps, targets)
+    expected = [float(prices[j]) if j >= 0 else None for j in match.tolist()]
+    assert actual == expected
+    assert any(a is None for a in actual) and any(a is not None for a in actual)
+
+
+def test_batch_match_uses_first_tick_after_target():
+    buffer = PredictionBuffer()
+    buffer.add_prediction(1_000, 0.0, 'ETHUSDT')
+    buffer.add_prediction(1_500, 0.0, 'ETHUSDT')
+    matched = buffer.match_actual_prices('ETHUSDT', [900, 1_000, 1_200, 2_000], [1.0, 2.0, 3.0, 4.0])
+    assert [e['actual_price'] for e in matched] == [2.0, 4.0]
@@ -0,0 +1,111 @@
+# test_rest_api.py
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+import websockets
+from fastapi.testclient import TestClient
+
+import fastjson
+import rest_api
+from data_buffer import DataBuffer
+from prediction_buffer import PredictionBuffer
+from stream_hub import StreamHub
+
+
+def _buffer(start_price, n=50):
+    buffer = DataBuffer(maxlen=1000)
+    timestamps = 1_700_000_000_000 + np.arange(n) * 10
+    buffer.add_ticks('BTCUSDT', timestamps.tolist(), (start_price + np.arange(n) * 0.01).tolist())
+    return buffer
+
+
+@pytest.mark.parametrize('path', ['/ticks/BTCUSDT', '/price_stats/BTCUSDT'])
+def test_etag_does_not_survive_a_new_buffer(monkeypatch, path):
+    client = TestClient(rest_api.app)
+    monkeypatch.setattr(rest_api, 'data_buffer', _buffer(100.0))
+    first = client.get(path)
+    assert first.status_code == 200
+    etag = first.headers['etag']
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+
+    # Reinicio: otro buffer con la misma secuencia pero otros datos
+    monkeypatch.setattr(rest_api, 'data_buffer', _buffer(200.0))
+    second = client.get(path, headers={'If-None-Match': etag})
+    assert second.status_code == 200
+    assert second.headers['etag'] != etag
+    assert second.content != first.content
+
+
+class CountingHub(StreamHub):
+    """StreamHub que cuenta las llamadas a delta (una por vuelta del bucle de envío)"""
+
+    calls = 0
+
+    def delta(self, symbol, since=0, pred_since=0):
+        CountingHub.calls += 1
+        return super().delta(symbol, since, pred_since)
+
+
+class CountingChart(rest_api.ChartStream):
+    calls = 0
+
+    def frame(self):
+        CountingChart.calls += 1
+        return super().frame()
+
+
+@pytest.fixture
+def api_server():
+    """API servida por uvicorn en un puerto libre (TestClient cancela el handler al cerrar y no sirve aquí)"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(rest_api.app, host='127.0.0.1', port=0, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.02)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"ws://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(10)
+
+
+@pytest.mark.parametrize('path, counter', [('/stream/QUIETUSDT', CountingHub),
+                                           ('/stream/QUIETUSDT/chart', CountingChart)])
+def test_stream_ends_when_quiet_client_drops(monkeypatch, api_server, path, counter):
+    monkeypatch.setattr(rest_api, 'STREAM_PUSH_INTERVAL', 0.02)
+    monkeypatch.setattr(rest_api, 'STREAM_HANDSHAKE_TIMEOUT', 0.02)
+    monkeypatch.setattr(rest_api, 'stream_hub', CountingHub(DataBuffer()))
+    monkeypatch.setattr(rest_api, 'ChartStream', CountingChart)
+    counter.calls = 0
+
+    async def drop():
+        websocket = await websockets.connect(api_server + path)
+        await asyncio.sleep(0.2)
+        # Corte sin frame de cierre
+        websocket.transport.abort()
+
+    asyncio.run(drop())
+    time.sleep(0.2)
+    # Sin ticks nunca se envía nada: el bucle sólo se detiene si lee la desconexión
+    calls = counter.calls
+    assert calls > 0
+    time.sleep(0.3)
+    assert counter.calls == calls
+
+
+def test_stream_hub_resets_on_prediction_cursor_ahead():
+    buffer = _buffer(100.0)
+    predictions = PredictionBuffer()
+    predictions.add_prediction(1_700_000_000_100, 100.0, 'BTCUSDT')
+    hub = StreamHub(buffer, predictions)
+    seq = buffer.get_sequence('BTCUSDT')
+    (_, pred_seq), frame = hub.delta('BTCUSDT', seq, 50)
+    frame = fastjson.loads(frame)
+    assert frame['reset'] and pred_seq == 1
+    assert len(frame['predictions']) == 1 and len(frame['ticks']['timestamp']) == seq
@@ -0,0 +1,172 @@
+# test_ring_buffer.py
+
+import numpy as np
+import pytest
+
+from ring_buffer import TickRing, SharedTickRing
+
+
+class CheckedRing(TickRing):
+    """TickRing que comprueba, cada vez que se publica la secuencia, que los datos ya están escritos"""
+
+    def __init__(self, capacity, expected, guard=None):
+        self.expected = expected   # Precio esperado del tick con secuencia i (timestamp = i)
+        self.published = []
+        self._written = 0
+        super().__init__(capacity, guard)
+
+    @property
+    def written(self):
+        return self._written
+
+    @written.setter
+    def written(self, value):
+        if value:
+            window = self.window(written=value)
+            seqs = np.arange(value - len(window), value)
+            assert np.array_equal(window.timestamp, seqs)
+            assert np.array_equal(window.price, self.expected[seqs])
+        self.published.append(value)
+        self._written = value
+
+
+def _ticks(lo, hi):
+    timestamps = np.arange(lo, hi, dtype=np.int64)
+    return timestamps, timestamps * 0.5 + 100.0
+
+
+def test_extend_publishes_sequence_after_data():
+    expected = np.arange(10_000) * 0.5 + 100.0
+    ring = CheckedRing(100, expected, guard=16)
+    ring.extend(*_ticks(0, 30))
+    ring.extend(*_ticks(30, 530))      # Más que la capacidad: sólo sobreviven los últimos 100
+    ring.extend(*_ticks(530, 600))
+    assert ring.published == [0, 30, 530, 600]
+    assert np.array_equal(ring.window().timestamp, np.arange(500, 600))
+
+
+def test_shared_extend_larger_than_capacity():
+    ring = SharedTickRing.create(f"test_ring_{np.random.randint(1 << 30)}", 100, guard=16)
+    reader = SharedTickRing.attach(ring.shm.name)
+    try:
+        ring.extend(*_ticks(0, 250), qty=np.ones(250), side=np.ones(250, dtype=np.int8))
+        seq, window = reader.snapshot()
+        assert seq == 250
+        assert np.array_equal(window.timestamp, np.arange(150, 250))
+        assert np.array_equal(window.price, np.arange(150, 250) * 0.5 + 100.0)
+    finally:
+        reader.close()
+        ring.close()
+
+
+class RacingRing(TickRing):
+    """TickRing cuyo escritor avanza `burst` ticks mientras el lector copia (las `races` primeras veces)"""
+
+    def __init__(self, capacity, guard, burst, races):
+        super().__init__(capacity, guard)
+        self.burst = burst
+        self.races = races
+        self.copies = 0
+
+    def window(self, count=None, written=None):
+        window = super().window(count, written)
+        if written is not None:
+            self.copies += 1
+            if self.races:
+                self.races -= 1
+                self.extend(*_ticks(self.written, self.written + self.burst))
+        return window
+
+
+def test_snapshot_retries_when_writer_laps_the_copy():
+    ring = RacingRing(100, guard=16, burst=50, races=2)
+    ring.extend(*_ticks(0, 100))
+    seq, window = ring.snapshot()
+    assert ring.copies == 3
+    assert seq == 200
+    assert np.array_equal(window.timestamp, np.arange(100, 200))
+    assert np.array_equal(window.price, np.arange(100, 200) * 0.5 + 100.0)
+
+
+def test_snapshot_tolerates_writes_within_guard():
+    ring = RacingRing(100, guard=16, burst=10, races=1)
+    ring.extend(*_ticks(0, 100))
+    seq, window = ring.snapshot()
+    # El escritor no llegó a pisar la ventana copiada: no hace falta reintentar
+    assert ring.copies == 1
+    assert seq == 100
+    assert np.array_equal(window.timestamp, np.arange(0, 100))
+
+
+def test_snapshot_gives_up_after_retries():
+    ring = RacingRing(100, guard=16, burst=50, races=100)
+    ring.extend(*_ticks(0, 100))
+    with pytest.raises(RuntimeError):
+        ring.snapshot(retries=3)
+    assert ring.copies == 3
+
+
+class HookedArray(np.ndarray):
+    """Array que llama a `hook` tras la primera escritura (a mitad de un extend)"""
+
+    hook = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        hook, self.hook = self.hook, None
+        if hook is not None:
+            hook()
+
+
+def _hook_first_store(ring, hook):
+    """Ejecuta `hook` justo después de la primera escritura de timestamps, con los precios aún sin escribir"""
+    ring.timestamp = ring.timestamp.view(HookedArray)
+    ring.timestamp.hook = hook
+
+
+def _shared_ring(capacity, guard):
+    return SharedTickRing.create(f"test_ring_{np.random.randint(1 << 30)}", capacity, guard=guard)
+
+
+@pytest.mark.parametrize('make_ring', [TickRing, _shared_ring], ids=['local', 'shared'])
+def test_snapshot_rejects_copy_during_large_extend(make_ring):
+    ring = make_ring(100, guard=16)
+    try:
+        ring.extend(*_ticks(0, 100))
+        results = []
+
+        def read():
+            try:
+                results.append(ring.snapshot(retries=3))
+            except RuntimeError as e:
+                results.append(e)
+            try:
+                results.append(ring.snapshot_between(since=0, retries=3))
+            except RuntimeError as e:
+                results.append(e)
+
+        # Un extend mayor que `guard` pisa la ventana visible antes de publicar `written`
+        _hook_first_store(ring, read)
+        ring.extend(*_ticks(100, 180))
+        assert all(isinstance(r, RuntimeError) for r in results) and len(results) == 2
+
+        # Terminado el extend, la copia vuelve a ser consistente
+        seq, window = ring.snapshot()
+        assert seq == 180
+        assert np.array_equal(window.price, window.timestamp * 0.5 + 100.0)
+    finally:
+        if isinstance(ring, SharedTickRing):
+            ring.close()
+
+
+def test_snapshot_during_extend_within_guard():
+    ring = TickRing(100, guard=16)
+    ring.extend(*_ticks(0, 100))
+    results = []
+    _hook_first_store(ring, lambda: results.append(ring.snapshot(retries=1)))
+    ring.extend(*_ticks(100, 110))
+    # La escritura en curso no alcanza la ventana visible: la copia es la anterior, sin reintentos
+    seq, window = results[0]
+    assert seq == 100
+    assert np.array_equal(window.timestamp, np.arange(0, 100))
+    assert np.array_equal(window.price, window.timestamp * 0.5 + 100.0)
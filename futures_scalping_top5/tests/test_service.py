@@ -0,0 +1,97 @@
+# test_service.py
+
+import time
+
+import numpy as np
+import pytest
+
+from data_buffer import DataBuffer
+from fake_binance import FakeBinanceREST, FakeBinanceServer, synthetic_agg_trades, synthetic_trades
+from service import IngestGate, start_ingest
+from tick_store import TickStore
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT']
+REST_TRADES = 3000
+WS_TRADES = 500
+
+
+def _wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def _sources():
+    """Histórico REST de los últimos minutos y un stream WS que empieza antes de que acabe el histórico"""
+    now_ms = int(time.time() * 1000)
+    rest = synthetic_agg_trades(SYMBOLS, REST_TRADES, start_ms=now_ms - 120_000, step_ms=20)
+    ws_start = int(rest[SYMBOLS[0]]['T'][2000])
+    trades = synthetic_trades(SYMBOLS, WS_TRADES, start_ms=ws_start)
+    for trade in trades:
+        # Continuar el precio del histórico para que la validación no lo tome por un salto
+        k = SYMBOLS.index(trade['s'])
+        columns = rest[trade['s']]
+        level = columns['p'][np.searchsorted(columns['T'], ws_start)] / (100.0 * (k + 1))
+        trade['p'] = f"{float(trade['p']) * level:.4f}"
+    return rest, trades
+
+
+@pytest.mark.parametrize('processes', [False, True], ids=['threads', 'processes'])
+@pytest.mark.parametrize('persist', [True, False], ids=['persist', 'memory'])
+def test_backfill_ends_at_first_ws_tick(tmp_path, processes, persist):
+    rest, trades = _sources()
+    ws = FakeBinanceServer(trades).start()
+    api = FakeBinanceREST(rest).start()
+    store = TickStore(str(tmp_path))
+    buffer = DataBuffer(maxlen=2 * REST_TRADES)
+    last_ws = {s: max(t['T'] for t in trades if t['s'] == s) for s in SYMBOLS}
+    ingest = None
+    try:
+        ingest = start_ingest(store, SYMBOLS, buffer, persist=persist, url_base=ws.url, rest_url=api.url,
+                              processes=processes)
+        assert _wait_for(lambda: all(
+            buffer.get_sequence(s) and buffer.get_last_tick(s)['timestamp'] == last_ws[s] for s in SYMBOLS
+        ))
+        if persist:
+            assert _wait_for(lambda: all(
+                len(store.read(s)) and store.read(s)['timestamp'][-1] == last_ws[s] for s in SYMBOLS
+            ))
+    finally:
+        if ingest is not None:
+            ingest.stop()
+        ws.stop()
+        api.stop()
+
+    for symbol in SYMBOLS:
+        live = [t for t in trades if t['s'] == symbol]
+        first = live[0]['T']
+        history = rest[symbol]['T'][rest[symbol]['T'] < first]
+        expected = np.r_[history, [t['T'] for t in live]]
+        # Histórico hasta justo antes del primer tick WS y después todo el WS, sin huecos ni solapes
+        if persist:
+            assert np.array_equal(store.read(symbol)['timestamp'], expected)
+        assert np.array_equal(buffer.get_window(symbol).timestamp, expected)
+        assert buffer.get_indicators(symbol)['ticks'] == len(expected)
+        assert sum(buffer.validator.stats(symbol)['rejected'].values()) == 0
+    store.stop()
+
+
+def test_gate_drops_oldest_past_limit_and_reports_gap():
+    buffer = DataBuffer()
+    gate = IngestGate(buffer, max_ticks=6)
+    for start in (0, 3, 6):
+        gate.add_ticks('BTCUSDT', [start, start + 1, start + 2], [100.0] * 3)
+    gate.add_ticks('ETHUSDT', [4, 5], [10.0] * 2)
+
+    # Al pasar de 6 retenidos se descartan los dos lotes más antiguos de BTCUSDT
+    assert gate.held_ticks == 5 and gate.dropped == 6
+    assert gate.first == {'BTCUSDT': 0, 'ETHUSDT': 4}
+    assert gate.take_gaps() == {'BTCUSDT': (0, 5)}
+    assert gate.take_gaps() == {}
+
+    gate.release()
+    assert buffer.get_window('BTCUSDT').timestamp.tolist() == [6, 7, 8]
+    assert buffer.get_sequence('ETHUSDT') == 2
@@ -0,0 +1,67 @@
+# test_sharded_ingest.py
+
+import time
+
+import pytest
+
+from data_buffer import DataBuffer
+from fake_binance import FakeBinanceServer, synthetic_trades
+from ring_buffer import TickRing
+from sharded_ingest import RingWriter, ShardedIngest, split_symbols
+
+SYMBOLS = ['ETHUSDT', 'BTCUSDT', 'BNBUSDT', 'XRPUSDT', 'ADAUSDT']
+TRADES_PER_SYMBOL = 400
+
+
+def _wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def test_split_symbols_covers_every_symbol_once():
+    groups = split_symbols(SYMBOLS, 2)
+    assert len(groups) == 2
+    assert sorted(s for group in groups for s in group) == sorted(SYMBOLS)
+    assert split_symbols(SYMBOLS, 10) == [[s] for s in SYMBOLS]
+
+
+@pytest.mark.parametrize('processes', [False, True], ids=['threads', 'processes'])
+def test_replay_through_shards(processes):
+    trades = synthetic_trades([s.lower() for s in SYMBOLS], TRADES_PER_SYMBOL)
+    server = FakeBinanceServer(trades).start()
+    buffer = DataBuffer()
+    ingest = ShardedIngest(SYMBOLS, shards=2, processes=processes, url_base=server.url, buffer=buffer,
+                           capacity=TRADES_PER_SYMBOL * 2, depth=False)
+    try:
+        ingest.start()
+        assert _wait_for(lambda: all(buffer.get_sequence(s) >= TRADES_PER_SYMBOL for s in SYMBOLS))
+    finally:
+        ingest.stop()
+        server.stop()
+
+    assert server.connections == 2
+    for symbol in SYMBOLS:
+        assert buffer.get_sequence(symbol) == TRADES_PER_SYMBOL
+        # Mismo orden en el que el servidor los envió
+        expected = [(t['T'], float(t['p'])) for t in trades if t['s'] == symbol]
+        window = buffer.get_window(symbol)
+        assert window.timestamp.tolist() == [t for t, _ in expected]
+        assert window.price.tolist() == [p for _, p in expected]
+
+
+def test_ring_writer_validates_into_ring_and_consumer_derives():
+    ring = TickRing(64)
+    writer = RingWriter({'BTCUSDT': ring})
+    # El trade 2 repetido se descarta
+    assert writer.add_ticks('btcusdt', [1, 2, 2, 3], [100.0, 100.5, 100.5, 101.0], trade_ids=[1, 2, 2, 3]) == 3
+    assert writer.add_ticks('ETHUSDT', [1], [10.0]) == 0
+    assert ring.written == 3
+
+    buffer = DataBuffer()
+    buffer.attach_ring('BTCUSDT', ring)
+    assert buffer.sync_shared() == 3
+    assert buffer.get_indicators('BTCUSDT')['ticks'] == 3
@@ -0,0 +1,66 @@
+# test_tick_store.py
+
+import os
+
+import numpy as np
+
+from tick_store import TickStore, RECORD_SIZE, INDEX_STRIDE, MS_PER_DAY, SEGMENT_SUFFIX, _day_key
+
+DAY_START = 19_700 * MS_PER_DAY
+
+
+def _ticks(n, start=DAY_START, step=5):
+    timestamps = start + step * np.arange(n, dtype=np.int64)
+    return timestamps, 100.0 + np.arange(n) * 0.01
+
+
+def _segment_path(root, symbol, timestamp):
+    return os.path.join(root, symbol, _day_key(timestamp // MS_PER_DAY) + SEGMENT_SUFFIX)
+
+
+def test_read_range_and_tail_across_days(tmp_path):
+    store = TickStore(str(tmp_path))
+    timestamps, prices = _ticks(3 * INDEX_STRIDE, start=DAY_START + MS_PER_DAY - 5 * INDEX_STRIDE)
+    store.append_many('ETHUSDT', timestamps, prices)
+    records = store.read('ETHUSDT')
+    assert np.array_equal(records['timestamp'], timestamps)
+    lo, hi = int(timestamps[1000]), int(timestamps[9000])
+    assert np.array_equal(store.read('ETHUSDT', since=lo, until=hi)['timestamp'], timestamps[1000:9001])
+    assert np.array_equal(store.tail('ETHUSDT', 7000)['price'], prices[-7000:])
+    store.stop()
+
+
+def test_reopen_after_truncated_tail(tmp_path):
+    root = str(tmp_path)
+    n = 2 * INDEX_STRIDE + 100
+    timestamps, prices = _ticks(n)
+    store = TickStore(root)
+    store.append_many('ETHUSDT', timestamps, prices)
+    store.stop()
+
+    # Caída a mitad de escritura: el último registro queda a medias y se pierde
+    # también el tramo al que apuntaba la última entrada del índice
+    path = _segment_path(root, 'ETHUSDT', DAY_START)
+    kept = 2 * INDEX_STRIDE - 10
+    with open(path, 'r+b') as f:
+        f.truncate(kept * RECORD_SIZE + RECORD_SIZE // 2)
+
+    store = TickStore(root)
+    records = store.read('ETHUSDT')
+    assert np.array_equal(records['timestamp'], timestamps[:kept])
+    since = int(timestamps[kept - 50])
+    assert np.array_equal(store.read('ETHUSDT', since=since)['timestamp'], timestamps[kept - 50:kept])
+    assert np.array_equal(store.tail('ETHUSDT', 5)['timestamp'], timestamps[kept - 5:kept])
+
+    # Al volver a escribir se descarta el registro incompleto y se sigue detrás del último completo
+    more, more_prices = _ticks(INDEX_STRIDE, start=int(timestamps[-1]) + 5)
+    store.append_many('ETHUSDT', more, more_prices)
+    store.flush()
+    assert os.path.getsize(path) % RECORD_SIZE == 0
+    expected = np.r_[timestamps[:kept], more]
+    assert np.array_equal(store.read('ETHUSDT')['timestamp'], expected)
+    for i in (0, kept - 1, kept, kept + 3000, len(expected) - 1):
+        since = int(expected[i])
+        assert np.array_equal(store.read('ETHUSDT', since=since)['timestamp'], expected[i:])
+        assert np.array_equal(store.read('ETHUSDT', until=since)['timestamp'], expected[:i + 1])
+    store.stop()
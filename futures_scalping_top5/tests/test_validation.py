@@ -0,0 +1,69 @@
+# test_validation.py
+
+import numpy as np
+import pytest
+
+from validation import TickValidator, VECTOR_MIN_BATCH, VALIDATION_BLOCK
+
+
+def _stream(n=5000, seed=7):
+    """Paseo aleatorio con ticks inválidos, duplicados, desordenados, outliers aislados y un salto de nivel"""
+    rng = np.random.default_rng(seed)
+    prices = 100.0 * np.exp(np.cumsum(rng.normal(0, 2e-4, n)))
+    timestamps = 1_700_000_000_000 + np.cumsum(rng.integers(0, 3, n))
+    ids = np.arange(1, n + 1, dtype=np.int64)
+
+    # Salto real: el precio se queda en el nuevo nivel
+    prices[3000:] *= 1.2
+    spikes = rng.choice(np.r_[100:2900, 3200:n], 30, replace=False)
+    prices[spikes] *= np.where(spikes % 2, 1.5, 0.6)
+    prices[rng.choice(np.arange(100, n), 20, replace=False)] *= -1
+    prices[rng.choice(np.arange(100, n), 5, replace=False)] = np.nan
+
+    # filter() comprueba el orden antes que los outliers: los duplicados y
+    # desordenados se refieren sólo a ticks que no son outliers
+    clean = np.setdiff1d(np.r_[200:2900, 3200:n], np.r_[spikes, spikes + 1, spikes + 3])
+    picks = rng.choice(clean, 75, replace=False)
+    for i in picks[:25]:
+        ids[i] = ids[i - 1]
+    for i in picks[25:50]:
+        ids[i] = ids[i - 3]
+    for i in picks[50:]:
+        timestamps[i] = timestamps[i - 1] - 50
+    return timestamps, prices, ids
+
+
+def _batches(n, seed=11):
+    """Cortes de lote variados: por debajo de VECTOR_MIN_BATCH y varios bloques de VALIDATION_BLOCK"""
+    rng = np.random.default_rng(seed)
+    sizes = rng.choice([1, VECTOR_MIN_BATCH - 1, VECTOR_MIN_BATCH, 100, VALIDATION_BLOCK + 7, 1000], size=n)
+    bounds = np.cumsum(sizes)
+    return np.r_[0, bounds[bounds < n], n]
+
+
+@pytest.mark.parametrize('with_ids', [True, False])
+def test_filter_matches_check(with_ids):
+    timestamps, prices, ids = _stream()
+    scalar, batched = TickValidator(), TickValidator()
+
+    expected = np.array([
+        scalar.check('BTCUSDT', int(t), float(p), int(i) if with_ids else None) is None
+        for t, p, i in zip(timestamps, prices, ids)
+    ])
+    bounds = _batches(len(prices))
+    mask = np.concatenate([
+        batched.filter('BTCUSDT', timestamps[lo:hi], prices[lo:hi], ids[lo:hi] if with_ids else None)
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ])
+
+    assert np.array_equal(mask, expected)
+    got, want = batched.stats('BTCUSDT'), scalar.stats('BTCUSDT')
+    assert got['accepted'] == want['accepted']
+    assert got['rejected'] == want['rejected']
+    for reason in ('invalid', 'outlier', 'out_of_order'):
+        assert want['rejected'][reason] > 0
+    assert (want['rejected']['duplicate'] > 0) == with_ids
+    # El salto de nivel se acepta tras la racha de outliers
+    assert mask[3000 + 2 * 50:].mean() > 0.9
+    # Media y MAD se actualizan por bloques: iguales salvo redondeo del peso por bloque
+    assert got['mean'] == pytest.approx(want['mean'], rel=1e-3)
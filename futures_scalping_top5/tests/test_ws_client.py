@@ -0,0 +1,31 @@
+# test_ws_client.py
+
+import asyncio
+
+import websockets
+
+from fake_binance import FakeBinanceServer, synthetic_trades
+from ws_client import BinanceWSClient
+
+
+def test_drain_batches_queued_messages():
+    n = 2000
+    trades = synthetic_trades(['BTCUSDT'], n)
+    server = FakeBinanceServer(trades).start()
+    client = BinanceWSClient(symbols=['BTCUSDT'], url_base=server.url, max_batch=300, depth=False)
+    sizes = []
+
+    async def run():
+        async with websockets.connect(client._build_stream_url()) as websocket:
+            await asyncio.sleep(0.5)
+            while sum(sizes) < n:
+                sizes.append(len(await client._drain(websocket)))
+
+    try:
+        asyncio.run(asyncio.wait_for(run(), 10))
+    finally:
+        server.stop()
+    assert sum(sizes) == n
+    # Los mensajes ya recibidos se agrupan (la cola de websockets es corta, así que no todos los lotes se llenan)
+    assert max(sizes) == 300
+    assert len(sizes) <= n // 50
@@ -0,0 +1,98 @@
+# tick_codecs.py
+
+import numpy as np
+
+import fastjson
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+JSON = 'application/json'
+COLUMNAR_JSON = 'application/vnd.ticks.columnar+json'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+RAW_BINARY = 'application/octet-stream'
+
+# Formato binario crudo: todos los timestamps y después todos los precios
+RAW_LAYOUT = 'timestamp:int64le,price:float64le'
+
+
+def available_types():
+    """Tipos de contenido soportados, en orden de preferencia del servidor"""
+    types = [JSON, COLUMNAR_JSON, RAW_BINARY]
+    if pa is not None:
+        types.append(ARROW_STREAM)
+    return types
+
+
+def negotiate(accept, offered=None):
+    """
+    Elige el tipo de contenido según la cabecera Accept (con valores q).
+    Devuelve None si ningún tipo ofrecido es aceptable.
+    """
+    offered = offered or available_types()
+    if not accept:
+        return offered[0]
+
+    ranges = []
+    for i, part in enumerate(accept.split(',')):
+        fields = part.strip().split(';')
+        media = fields[0].strip().lower()
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((-q, i, media))
+    ranges.sort()
+
+    for neg_q, _, media in ranges:
+        if neg_q >= 0:
+            continue
+        if media in ('*/*', 'application/*'):
+            return offered[0]
+        if media in offered:
+            return media
+    return None
+
+
+def encode_ticks(symbol, window, media_type):
+    """Codifica una TickWindow en el formato indicado; devuelve (bytes, cabeceras)"""
+    count = len(window)
+    headers = {'X-Symbol': symbol, 'X-Count': str(count)}
+
+    if media_type == COLUMNAR_JSON:
+        body = fastjson.dumps({
+            'symbol': symbol,
+            'count': count,
+            'timestamp': window.timestamp,
+            'price': window.price
+        })
+    elif media_type == RAW_BINARY:
+        headers['X-Layout'] = RAW_LAYOUT
+        body = (np.ascontiguousarray(window.timestamp, dtype='<i8').tobytes()
+                + np.ascontiguousarray(window.price, dtype='<f8').tobytes())
+    elif media_type == ARROW_STREAM:
+        table = pa.table({
+            'timestamp': pa.array(window.timestamp, type=pa.int64()),
+            'price': pa.array(window.price, type=pa.float64())
+        })
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        body = sink.getvalue().to_pybytes()
+    else:
+        body = fastjson.dumps({'symbol': symbol, 'ticks': window.to_dicts(), 'count': count})
+    return body, headers
+
+
+def decode_raw(body):
+    """Decodifica el formato binario crudo en (timestamps, precios)"""
+    count = len(body) // 16
+    timestamps = np.frombuffer(body, dtype='<i8', count=count)
+    prices = np.frombuffer(body, dtype='<f8', count=count, offset=count * 8)
+    return timestamps, prices
@@ -0,0 +1,282 @@
+# tick_store.py
+
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from config import DATA_DIR, DEBUG
+
+# Registro de ancho fijo (32 bytes, little-endian)
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('price', '<f8'),
+    ('qty', '<f8'),
+    ('trade_id', '<i8')
+])
+RECORD_SIZE = RECORD_DTYPE.itemsize
+_RECORD = struct.Struct('<qddq')
+
+# Índice temporal disperso: una entrada (timestamp, nº de registro) cada N registros
+INDEX_STRIDE = 4096
+_INDEX = struct.Struct('<qq')
+
+MS_PER_DAY = 86_400_000
+SEGMENT_SUFFIX = '.ticks'
+INDEX_SUFFIX = '.idx'
+
+
+def _day_key(day):
+    return datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime('%Y%m%d')
+
+
+def _key_day(key):
+    return int(datetime.strptime(key, '%Y%m%d').replace(tzinfo=timezone.utc).timestamp()) // 86400
+
+
+class _Segment:
+    """Fichero de un símbolo y un día UTC abierto para añadir registros"""
+
+    def __init__(self, path):
+        self.path = path
+        # Descartar un registro final incompleto (p.ej. tras una caída)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size % RECORD_SIZE:
+            with open(path, 'r+b') as f:
+                f.truncate(size - size % RECORD_SIZE)
+            size -= size % RECORD_SIZE
+        self.records = size // RECORD_SIZE
+        # y las entradas del índice que apuntan a registros perdidos, que al
+        # seguir escribiendo señalarían a ticks de otro instante
+        index_path = path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        if os.path.exists(index_path):
+            index = np.fromfile(index_path, dtype='<i8')
+            index = index[:len(index) - len(index) % 2].reshape(-1, 2)
+            valid = int(np.searchsorted(index[:, 1], self.records, side='left'))
+            if os.path.getsize(index_path) != valid * _INDEX.size:
+                with open(index_path, 'r+b') as f:
+                    f.truncate(valid * _INDEX.size)
+        self.file = open(path, 'ab')
+        self.index = open(index_path, 'ab')
+
+    def append(self, timestamp, price, qty, trade_id):
+        if self.records % INDEX_STRIDE == 0:
+            self.index.write(_INDEX.pack(timestamp, self.records))
+        self.file.write(_RECORD.pack(timestamp, price, qty, trade_id))
+        self.records += 1
+
+    def append_block(self, records):
+        n = len(records)
+        first = (-self.records) % INDEX_STRIDE
+        for i in range(first, n, INDEX_STRIDE):
+            self.index.write(_INDEX.pack(int(records['timestamp'][i]), self.records + i))
+        self.file.write(records.tobytes())
+        self.records += n
+
+    def flush(self):
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class TickLog:
+    """
+    Registro de ticks append-only de un símbolo: un segmento por día UTC
+    con registros binarios de ancho fijo y un índice temporal disperso.
+    Las lecturas mapean los segmentos en memoria (np.memmap) sin copiarlos.
+    """
+
+    def __init__(self, symbol, root=DATA_DIR):
+        self.symbol = symbol.upper()
+        self.directory = os.path.join(root, self.symbol)
+        os.makedirs(self.directory, exist_ok=True)
+        self.segments = {}
+        self.lock = threading.Lock()
+
+    def _path(self, day):
+        return os.path.join(self.directory, _day_key(day) + SEGMENT_SUFFIX)
+
+    def _segment(self, day):
+        segment = self.segments.get(day)
+        if segment is None:
+            # Sólo se escribe en el día actual: cerrar los anteriores
+            for old in [d for d in self.segments if d < day]:
+                self.segments.pop(old).close()
+            segment = self.segments[day] = _Segment(self._path(day))
+        return segment
+
+    def append(self, timestamp, price, qty=0.0, trade_id=-1):
+        """Añade un tick (queda en el buffer del fichero hasta flush())"""
+        with self.lock:
+            self._segment(timestamp // MS_PER_DAY).append(timestamp, price, qty, trade_id)
+
+    def append_many(self, timestamps, prices, qty=None, trade_ids=None):
+        """Añade un bloque de ticks en orden cronológico"""
+        n = len(timestamps)
+        if n == 0:
+            return
+        records = np.empty(n, dtype=RECORD_DTYPE)
+        records['timestamp'] = timestamps
+        records['price'] = prices
+        records['qty'] = 0.0 if qty is None else qty
+        records['trade_id'] = -1 if trade_ids is None else trade_ids
+        days = records['timestamp'] // MS_PER_DAY
+        with self.lock:
+            # Partir el bloque en los cambios de día
+            bounds = np.flatnonzero(np.diff(days)) + 1
+            for chunk in np.split(records, bounds):
+                self._segment(int(chunk['timestamp'][0]) // MS_PER_DAY).append_block(chunk)
+
+    def flush(self):
+        with self.lock:
+            for segment in self.segments.values():
+                segment.flush()
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments.values():
+                segment.close()
+            self.segments = {}
+
+    def days(self):
+        """Días con datos en disco, en orden"""
+        days = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                days.append(_key_day(name[:-len(SEGMENT_SUFFIX)]))
+        return sorted(days)
+
+    def _map(self, day):
+        path = self._path(day)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        count = size // RECORD_SIZE
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+    def _index(self, day):
+        path = self._path(day)[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        if not os.path.exists(path):
+            return np.empty((0, 2), dtype=np.int64)
+        index = np.fromfile(path, dtype='<i8')
+        return index[:len(index) - len(index) % 2].reshape(-1, 2)
+
+    def _slice(self, day, since=None, until=None):
+        records = self._map(day)
+        if len(records) == 0:
+            return records
+        # El índice disperso acota el tramo antes de la búsqueda binaria fina
+        index = self._index(day)
+        # Ignorar entradas por delante de los datos (segmento truncado aún sin reabrir)
+        index = index[:int(np.searchsorted(index[:, 1], len(records), side='left'))]
+        lo, hi = 0, len(records)
+        if len(index):
+            if since is not None:
+                k = int(np.searchsorted(index[:, 0], since, side='left')) - 1
+                lo = int(index[k, 1]) if k >= 0 else 0
+            if until is not None:
+                k = int(np.searchsorted(index[:, 0], until, side='right'))
+                hi = int(index[k, 1]) if k < len(index) else len(records)
+        timestamps = records['timestamp'][lo:hi]
+        start = lo + (0 if since is None else int(np.searchsorted(timestamps, since, side='left')))
+        end = lo + (len(timestamps) if until is None else int(np.searchsorted(timestamps, until, side='right')))
+        return records[start:end]
+
+    def read(self, since=None, until=None):
+        """
+        Registros con since <= timestamp <= until. Con un único segmento
+        devuelve una vista del memmap; si abarca varios días, una copia.
+        """
+        self.flush()
+        days = self.days()
+        if since is not None:
+            days = [d for d in days if d >= since // MS_PER_DAY]
+        if until is not None:
+            days = [d for d in days if d <= until // MS_PER_DAY]
+        parts = [self._slice(day, since, until) for day in days]
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def tail(self, count):
+        """Últimos `count` registros en disco"""
+        self.flush()
+        parts = []
+        remaining = count
+        for day in reversed(self.days()):
+            records = self._map(day)
+            if len(records) == 0:
+                continue
+            parts.append(records[-remaining:])
+            remaining -= len(parts[-1])
+            if remaining <= 0:
+                break
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts[::-1])
+
+
+class TickStore:
+    """Registros persistentes de todos los símbolos en DATA_DIR"""
+
+    def __init__(self, root=DATA_DIR, flush_interval=1.0):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.logs = {}
+        self.lock = threading.Lock()
+        self.running = False
+
+    def log(self, symbol):
+        symbol_key = symbol.upper()
+        log = self.logs.get(symbol_key)
+        if log is None:
+            with self.lock:
+                log = self.logs.get(symbol_key)
+                if log is None:
+                    log = self.logs[symbol_key] = TickLog(symbol_key, self.root)
+        return log
+
+    def append(self, symbol, timestamp, price, qty=0.0, trade_id=-1):
+        self.log(symbol).append(timestamp, price, qty, trade_id)
+
+    def append_many(self, symbol, timestamps, prices, qty=None, trade_ids=None):
+        self.log(symbol).append_many(timestamps, prices, qty, trade_ids)
+
+    def read(self, symbol, since=None, until=None):
+        return self.log(symbol).read(since, until)
+
+    def tail(self, symbol, count):
+        return self.log(symbol).tail(count)
+
+    def flush(self):
+        for log in list(self.logs.values()):
+            log.flush()
+
+    def start(self):
+        """Vuelca los buffers a disco cada flush_interval segundos en segundo plano"""
+        self.running = True
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def _flush_loop(self):
+        while self.running:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                if DEBUG:
+                    print(f"Error flushing tick store: {e}")
+
+    def stop(self):
+        self.running = False
+        for log in list(self.logs.values()):
+            log.flush()
+            log.close()
@@ -2,6 +2,8 @@
 
 from datetime import datetime
 
+import numpy as np
+
 def ms_to_datetime(ms):
     """Convierte timestamp en milisegundos a objeto datetime."""
     return datetime.fromtimestamp(ms / 1000.0)
@@ -18,4 +20,16 @@ def percent_change(old, new):
 
 def clamp(value, min_value, max_value):
     """Limita value entre min_value y max_value."""
-    return max(min_value, min(value, max_value))
\ No newline at end of file
+    return max(min_value, min(value, max_value))
+
+def ms_to_datetime64(ms):
+    """
+    Convierte un array de timestamps en ms a datetime64[ms] en hora local
+    (igual que ms_to_datetime) sin recorrerlo en Python.
+    """
+    ms = np.asarray(ms, dtype=np.int64)
+    if not len(ms):
+        return ms.astype('datetime64[ms]')
+    # Desfase horario local en el último instante (constante dentro de la ventana)
+    offset = datetime.fromtimestamp(int(ms[-1]) / 1000.0).astimezone().utcoffset()
+    return (ms + int(offset.total_seconds() * 1000)).astype('datetime64[ms]')
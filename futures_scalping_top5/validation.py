@@ -0,0 +1,259 @@
+# validation.py
+
+import math
+
+import numpy as np
+
+from config import (PRICE_VALIDATION_WINDOW, PRICE_VALIDATION_MAD_K, PRICE_VALIDATION_MIN_DEVIATION,
+                    PRICE_VALIDATION_MIN_SAMPLES, PRICE_VALIDATION_MAX_STREAK)
+
+# Por debajo de este tamaño de lote el bucle escalar es más barato que NumPy
+VECTOR_MIN_BATCH = 16
+# Ticks que se validan con las mismas estadísticas en la ruta vectorizada
+VALIDATION_BLOCK = 256
+
+REJECTION_REASONS = ('invalid', 'outlier', 'duplicate', 'out_of_order')
+
+_MIN_INT64 = np.iinfo(np.int64).min
+
+
+class SymbolStats:
+    """Estado de validación de un símbolo: media y MAD exponenciales, último trade y contadores"""
+
+    __slots__ = ('mean', 'mad', 'samples', 'streak', 'last_ts', 'last_id', 'accepted', 'rejected', 'version')
+
+    def __init__(self):
+        self.mean = 0.0
+        self.mad = 0.0
+        self.samples = 0
+        self.streak = 0           # Outliers seguidos
+        self.last_ts = None
+        self.last_id = None
+        self.accepted = 0
+        self.rejected = dict.fromkeys(REJECTION_REASONS, 0)
+        self.version = 0          # Crece con cada cambio del estado (caché de la API)
+
+
+class TickValidator:
+    """
+    Validación de ticks por símbolo en O(1).
+
+    Un precio es outlier si se aleja de la media exponencial más de `k`
+    veces la desviación absoluta media (MAD, también exponencial, con un
+    mínimo relativo `min_deviation` para series planas). Tras `max_streak`
+    outliers seguidos se asume un salto real de precio y las estadísticas
+    se reinician en el nuevo nivel. Se rechazan también precios no
+    positivos o no finitos, timestamps que retroceden y trade IDs
+    duplicados o desordenados.
+
+    Los lotes se validan con NumPy en bloques de VALIDATION_BLOCK ticks
+    que comparten la media/MAD del inicio del bloque.
+    """
+
+    def __init__(self, window=PRICE_VALIDATION_WINDOW, k=PRICE_VALIDATION_MAD_K,
+                 min_deviation=PRICE_VALIDATION_MIN_DEVIATION, min_samples=PRICE_VALIDATION_MIN_SAMPLES,
+                 max_streak=PRICE_VALIDATION_MAX_STREAK):
+        self.alpha = 2.0 / (window + 1)
+        self.k = k
+        self.min_deviation = min_deviation
+        self.min_samples = min_samples
+        self.max_streak = max_streak
+        self.symbols = {}
+
+    def _state(self, symbol_key):
+        state = self.symbols.get(symbol_key)
+        if state is None:
+            state = self.symbols[symbol_key] = SymbolStats()
+        return state
+
+    def _limit(self, state):
+        return self.k * max(state.mad, state.mean * self.min_deviation)
+
+    def _absorb(self, state, price):
+        """Actualiza media y MAD con un precio aceptado"""
+        if state.samples == 0:
+            state.mean = price
+        else:
+            # Durante el calentamiento, media simple de lo visto
+            alpha = max(self.alpha, 1.0 / (state.samples + 1))
+            deviation = abs(price - state.mean)
+            state.mean += alpha * (price - state.mean)
+            state.mad += alpha * (deviation - state.mad)
+        state.samples += 1
+
+    def _absorb_block(self, state, prices):
+        """Actualiza media y MAD con un bloque de precios aceptados (desviaciones respecto a la media inicial)"""
+        m = len(prices)
+        if m == 0:
+            return
+        decay = 1.0 - self.alpha
+        weights = self.alpha * decay ** np.arange(m - 1, -1, -1)
+        carry = decay ** m
+        deviations = np.abs(prices - state.mean)
+        state.mean = carry * state.mean + float(weights @ prices)
+        state.mad = carry * state.mad + float(weights @ deviations)
+        state.samples += m
+
+    def check(self, symbol_key, timestamp, price, trade_id=None):
+        """Valida un tick; devuelve None si se acepta o el motivo del rechazo"""
+        state = self._state(symbol_key)
+        reason = None
+        if not (price > 0 and math.isfinite(price)):
+            reason = 'invalid'
+        elif trade_id is not None and state.last_id is not None and trade_id <= state.last_id:
+            reason = 'duplicate' if trade_id == state.last_id else 'out_of_order'
+        elif state.last_ts is not None and timestamp < state.last_ts:
+            reason = 'out_of_order'
+        elif state.samples >= self.min_samples and abs(price - state.mean) > self._limit(state):
+            state.streak += 1
+            if state.streak < self.max_streak:
+                reason = 'outlier'
+            else:
+                # Salto real de precio: reiniciar las estadísticas en el nuevo nivel
+                state.mean, state.mad, state.samples = price, 0.0, 0
+
+        if reason is not None:
+            state.rejected[reason] += 1
+            state.version += 1
+            return reason
+        if trade_id is not None:
+            state.last_id = trade_id
+        state.streak = 0
+        state.last_ts = timestamp
+        state.accepted += 1
+        self._absorb(state, price)
+        state.version += 1
+        return None
+
+    def filter(self, symbol_key, timestamps, prices, trade_ids=None):
+        """
+        Valida un lote en orden. Devuelve una máscara booleana de los ticks
+        aceptados. Equivale a llamar a check() por tick salvo en que cada
+        bloque usa la media/MAD de su inicio y el orden se comprueba antes
+        que los outliers.
+        """
+        n = len(prices)
+        if n < VECTOR_MIN_BATCH:
+            ids = [None] * n if trade_ids is None else trade_ids
+            return np.array([
+                self.check(symbol_key, timestamps[i], prices[i], ids[i]) is None for i in range(n)
+            ], dtype=bool)
+
+        state = self._state(symbol_key)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        mask = np.isfinite(prices) & (prices > 0)
+        if not mask.all():
+            state.rejected['invalid'] += n - int(mask.sum())
+
+        if trade_ids is not None:
+            ids = np.asarray(trade_ids, dtype=np.int64)
+            first = ids[0] - 1 if state.last_id is None else state.last_id
+            # Caso habitual: IDs estrictamente crecientes, no hay nada que descartar
+            if not (ids[0] > first and (ids[1:] > ids[:-1]).all()):
+                seen = np.maximum.accumulate(np.r_[first, np.where(mask, ids, _MIN_INT64)])[:-1]
+                duplicate = mask & (ids == seen)
+                backwards = mask & (ids < seen)
+                state.rejected['duplicate'] += int(duplicate.sum())
+                state.rejected['out_of_order'] += int(backwards.sum())
+                mask &= ~(duplicate | backwards)
+
+        first = timestamps[0] if state.last_ts is None else state.last_ts
+        if not (timestamps[0] >= first and (timestamps[1:] >= timestamps[:-1]).all()):
+            latest = np.maximum.accumulate(np.r_[first, np.where(mask, timestamps, _MIN_INT64)])[:-1]
+            backwards = mask & (timestamps < latest)
+            state.rejected['out_of_order'] += int(backwards.sum())
+            mask &= ~backwards
+
+        i = 0
+        while i < n:
+            if state.samples < self.min_samples:
+                # Calentamiento tick a tick hasta tener estadísticas fiables
+                if mask[i]:
+                    mask[i] = self._check_price(state, prices[i])
+                i += 1
+                continue
+            end = min(i + VALIDATION_BLOCK, n)
+            self._check_block(state, prices[i:end], mask[i:end])
+            i = end
+
+        accepted = np.flatnonzero(mask)
+        if len(accepted):
+            state.accepted += len(accepted)
+            state.last_ts = int(timestamps[accepted[-1]])
+            if trade_ids is not None:
+                state.last_id = int(ids[accepted[-1]])
+        state.version += 1
+        return mask
+
+    def _check_price(self, state, price):
+        """Comprobación de outlier escalar de la ruta por lotes (el resto ya se validó)"""
+        if state.samples >= self.min_samples and abs(price - state.mean) > self._limit(state):
+            state.streak += 1
+            if state.streak < self.max_streak:
+                state.rejected['outlier'] += 1
+                return False
+            state.mean, state.mad, state.samples = price, 0.0, 0
+        state.streak = 0
+        self._absorb(state, price)
+        return True
+
+    def _check_block(self, state, prices, mask):
+        """Valida un bloque con las estadísticas de su inicio; actualiza `mask` en sitio"""
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return
+        outlier = np.abs(prices[candidates] - state.mean) > self._limit(state)
+        if outlier.any():
+            # Rachas de outliers (contando la que venía de antes) que llegan a max_streak
+            runs = np.diff(np.r_[0, np.flatnonzero(~outlier) + 1, len(outlier) + 1]) - 1
+            runs[0] += state.streak
+            if runs.max() >= self.max_streak:
+                for j in candidates:
+                    mask[j] = self._check_price(state, prices[j])
+                return
+            mask[candidates[outlier]] = False
+            state.rejected['outlier'] += int(outlier.sum())
+            state.streak = int(runs[-1])
+        else:
+            state.streak = 0
+        self._absorb_block(state, prices[mask])
+
+    def seed(self, symbol_key, timestamps, prices):
+        """Alimenta las estadísticas con ticks ya validados (disco, otros procesos) sin contarlos"""
+        n = len(prices)
+        if n == 0:
+            return
+        state = self._state(symbol_key)
+        # Sólo importan los ticks más recientes: el peso de los anteriores es despreciable
+        tail = np.asarray(prices, dtype=np.float64)[-int(8 / self.alpha):]
+        warmup = max(self.min_samples - state.samples, 0)
+        for price in tail[:warmup].tolist():
+            self._absorb(state, price)
+        for lo in range(warmup, len(tail), VALIDATION_BLOCK):
+            self._absorb_block(state, tail[lo:lo + VALIDATION_BLOCK])
+        last_ts = int(timestamps[-1])
+        state.last_ts = last_ts if state.last_ts is None else max(state.last_ts, last_ts)
+        state.version += 1
+
+    def version(self, symbol):
+        """Versión de las estadísticas del símbolo: cambia con cada tick validado o sembrado"""
+        state = self.symbols.get(symbol.upper())
+        return state.version if state is not None else 0
+
+    def stats(self, symbol):
+        """Estadísticas de validación del símbolo en O(1), o None si no hay"""
+        state = self.symbols.get(symbol.upper())
+        if state is None:
+            return None
+        limit = self._limit(state)
+        return {
+            'symbol': symbol.upper(),
+            'mean': float(state.mean),
+            'mad': float(state.mad),
+            'min_valid': float(state.mean - limit),
+            'max_valid': float(state.mean + limit),
+            'samples': state.samples,
+            'accepted': state.accepted,
+            'rejected': dict(state.rejected)
+        }
@@ -1,18 +1,93 @@
 # visualizations.py
 
 from datetime import datetime, timedelta
-import plotly.graph_objs as go
-from utils import ms_to_datetime
+import numpy as np
+from utils import ms_to_datetime, ms_to_datetime64
+from ring_buffer import as_window
 
 try:
-    from config import PLOT_HISTORY_SECONDS, PLOT_FUTURE_SECONDS
+    from config import PLOT_HISTORY_SECONDS, PLOT_FUTURE_SECONDS, PLOT_BUCKETS
 except ImportError:
     PLOT_HISTORY_SECONDS = 600
     PLOT_FUTURE_SECONDS = 120
+    PLOT_BUCKETS = 1000
+
+
+def bucket_width_ms(history_seconds=PLOT_HISTORY_SECONDS, buckets=PLOT_BUCKETS):
+    """Ancho en ms de una columna de píxel para la ventana de historial"""
+    return max(1, history_seconds * 1000 // buckets)
+
+
+def downsample_minmax(timestamps, prices, width_ms):
+    """
+    Reduce la serie a resolución de pantalla: por cada intervalo de
+    `width_ms` (alineado a múltiplos de width_ms) conserva el primer y el
+    último punto y los de mínimo y máximo precio, en su orden original.
+    Devuelve los índices conservados.
+    """
+    n = len(timestamps)
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+    buckets = np.asarray(timestamps) // width_ms
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    if n <= 4 * len(starts):
+        return np.arange(n)
+
+    counts = np.diff(np.r_[starts, n])
+    bucket_of = np.repeat(np.arange(len(starts)), counts)
+    prices = np.asarray(prices)
+    keep = [starts, starts + counts - 1]
+    for extreme in (np.minimum.reduceat(prices, starts), np.maximum.reduceat(prices, starts)):
+        hits = np.flatnonzero(prices == extreme[bucket_of])
+        # Primera aparición del extremo en cada intervalo
+        keep.append(hits[np.r_[True, bucket_of[hits][1:] != bucket_of[hits][:-1]]])
+    return np.unique(np.concatenate(keep))
+
+
+def _error_segments(timestamps, predicted, actual):
+    """Segmentos predicción→real de todas las predicciones en una sola traza separada por NaN"""
+    n = len(timestamps)
+    x = np.empty(3 * n, dtype=np.int64)
+    y = np.full(3 * n, np.nan)
+    x[0::3] = x[1::3] = x[2::3] = timestamps
+    y[0::3] = predicted
+    y[1::3] = actual
+    return x, y
+
+
+def split_predictions(predictions, min_ms, max_ms):
+    """
+    Separa las predicciones visibles en arrays: (pendientes, verificadas)
+    con pendientes = (timestamps, predicho) y verificadas =
+    (timestamps, predicho, real).
+    """
+    visible = [p for p in predictions if min_ms <= p['timestamp'] <= max_ms]
+    pending = [p for p in visible if p['actual_price'] is None]
+    verified = [p for p in visible if p['actual_price'] is not None]
+    return (
+        (np.array([p['timestamp'] for p in pending], dtype=np.int64),
+         np.array([p['predicted_price'] for p in pending], dtype=np.float64)),
+        (np.array([p['timestamp'] for p in verified], dtype=np.int64),
+         np.array([p['predicted_price'] for p in verified], dtype=np.float64),
+         np.array([p['actual_price'] for p in verified], dtype=np.float64))
+    )
+
+
+def _curve_arrays(curve, now_ms, last_price):
+    """Curva multi-horizonte como arrays (x, y, lower, upper) que parten del último precio"""
+    x = np.array([now_ms] + [e['timestamp'] for e in curve], dtype=np.int64)
+    y = np.array([last_price] + [e['predicted_price'] for e in curve])
+    lower = np.array([last_price] + [e.get('lower', e['predicted_price']) for e in curve])
+    upper = np.array([last_price] + [e.get('upper', e['predicted_price']) for e in curve])
+    return x, y, lower, upper
+
+
+def plot_price_and_prediction(ticks, predictions, window_seconds=60, curve=None):
+    import plotly.graph_objs as go  # Plotly sólo en la UI: la API usa ChartStream
 
-def plot_price_and_prediction(ticks, predictions, window_seconds=60):
     fig = go.Figure()
-    
+    ticks = as_window(ticks)
+
     # Manejar caso sin datos
     if not ticks:
         # Crear un gráfico vacío con rango de tiempo razonable
@@ -32,16 +107,19 @@ def plot_price_and_prediction(ticks, predictions, window_seconds=60):
             template='plotly_dark'
         )
         return fig
-    
+
     # Procesar datos históricos
-    now_ms = ticks[-1]['timestamp']
+    now_ms = int(ticks.timestamp[-1])
     history_ms = PLOT_HISTORY_SECONDS * 1000
-    relevant_ticks = [t for t in ticks if now_ms - t['timestamp'] <= history_ms]
-    
-    if relevant_ticks:
-        times = [ms_to_datetime(t['timestamp']) for t in relevant_ticks]
-        prices = [t['price'] for t in relevant_ticks]
-        
+    start = int(np.searchsorted(ticks.timestamp, now_ms - history_ms, side='left'))
+    relevant_ticks = ticks[start:]
+
+    if len(relevant_ticks):
+        # Reducir a resolución de pantalla: el coste no depende del nº de ticks
+        keep = downsample_minmax(relevant_ticks.timestamp, relevant_ticks.price, bucket_width_ms())
+        times = ms_to_datetime64(relevant_ticks.timestamp[keep])
+        prices = relevant_ticks.price[keep]
+
         fig.add_trace(go.Scatter(
             x=times,
             y=prices,
@@ -50,27 +128,19 @@ def plot_price_and_prediction(ticks, predictions, window_seconds=60):
             line=dict(color='#1f77b4', width=2),
             hovertemplate='%{y:.4f}<extra></extra>'
         ))
-    
+
     # Procesar predicciones
     if predictions:
-        now_ms = ticks[-1]['timestamp']
         max_future_ms = now_ms + PLOT_FUTURE_SECONDS * 1000
         min_past_ms = now_ms - PLOT_HISTORY_SECONDS * 1000
-        visible_predictions = [
-            p for p in predictions 
-            if min_past_ms <= p['timestamp'] <= max_future_ms
-        ]
-        
-        pending_predictions = [p for p in visible_predictions if p['actual_price'] is None]
-        verified_predictions = [p for p in visible_predictions if p['actual_price'] is not None]
-        
-        if pending_predictions:
-            pred_times = [ms_to_datetime(p['timestamp']) for p in pending_predictions]
-            pred_prices = [p['predicted_price'] for p in pending_predictions]
-            
+        (pending_ts, pending_prices), (verified_ts, pred_prices, actual_prices) = split_predictions(
+            predictions, min_past_ms, max_future_ms
+        )
+
+        if len(pending_ts):
             fig.add_trace(go.Scatter(
-                x=pred_times,
-                y=pred_prices,
+                x=ms_to_datetime64(pending_ts),
+                y=pending_prices,
                 mode='markers',
                 name='Future Predictions',
                 marker=dict(
@@ -80,17 +150,13 @@ def plot_price_and_prediction(ticks, predictions, window_seconds=60):
                 ),
                 hovertemplate='Predicted: %{y:.4f}<extra></extra>'
             ))
-        
-        if verified_predictions:
-            actual_times = [ms_to_datetime(p['timestamp']) for p in verified_predictions]
-            actual_prices = [p['actual_price'] for p in verified_predictions]
-            pred_prices = [p['predicted_price'] for p in verified_predictions]
-            
-            errors = [abs(pred - actual) for pred, actual in zip(pred_prices, actual_prices)]
-            colors = ['green' if e < 0.001 else 'red' for e in errors]
-            
+
+        if len(verified_ts):
+            errors = np.abs(pred_prices - actual_prices)
+            colors = np.where(errors < 0.001, 'green', 'red')
+
             fig.add_trace(go.Scatter(
-                x=actual_times,
+                x=ms_to_datetime64(verified_ts),
                 y=actual_prices,
                 mode='markers',
                 name='Verified Predictions',
@@ -101,22 +167,43 @@ def plot_price_and_prediction(ticks, predictions, window_seconds=60):
                 ),
                 hovertemplate='Actual: %{y:.4f}<extra></extra>'
             ))
-            
-            for prediction in verified_predictions:
-                pred_time = ms_to_datetime(prediction['timestamp'])
-                
-                fig.add_trace(go.Scatter(
-                    x=[pred_time, pred_time],
-                    y=[prediction['predicted_price'], prediction['actual_price']],
-                    mode='lines',
-                    line=dict(color='gray', width=1, dash='dot'),
-                    showlegend=False,
-                    hoverinfo='none'
-                ))
-    
+
+            # Todas las líneas de error en una sola traza
+            error_x, error_y = _error_segments(verified_ts, pred_prices, actual_prices)
+            fig.add_trace(go.Scatter(
+                x=ms_to_datetime64(error_x),
+                y=error_y,
+                mode='lines',
+                line=dict(color='gray', width=1, dash='dot'),
+                connectgaps=False,
+                showlegend=False,
+                hoverinfo='none'
+            ))
+
+    # Última curva de predicción con su banda de confianza
+    if curve:
+        x, y, lower, upper = _curve_arrays(curve, now_ms, float(ticks.price[-1]))
+        times = ms_to_datetime64(x)
+        fig.add_trace(go.Scatter(
+            x=times, y=upper, mode='lines', line=dict(width=0),
+            showlegend=False, hoverinfo='none'
+        ))
+        fig.add_trace(go.Scatter(
+            x=times, y=lower, mode='lines', line=dict(width=0),
+            fill='tonexty', fillcolor='rgba(255, 165, 0, 0.2)',
+            name='Confidence Band', hoverinfo='none'
+        ))
+        fig.add_trace(go.Scatter(
+            x=times, y=y, mode='lines+markers',
+            name='Prediction Curve',
+            line=dict(color='orange', width=2),
+            marker=dict(size=6),
+            hovertemplate='Predicted: %{y:.4f}<extra></extra>'
+        ))
+
     # Configuración del layout
     fig.update_layout(
-        title=f'Price & 1-Minute Predictions',
+        title='Price & Multi-Horizon Predictions',
         xaxis_title='Time',
         yaxis_title='Price (USD)',
         template='plotly_dark',
@@ -134,13 +221,97 @@ def plot_price_and_prediction(ticks, predictions, window_seconds=60):
             type='date'
         )
     )
-    
+
     # Ajustar rango temporal
-    if ticks:
-        last_time = ms_to_datetime(ticks[-1]['timestamp'])
+    if len(ticks):
+        last_time = ms_to_datetime(now_ms)
         fig.update_xaxes(
             range=[last_time - timedelta(seconds=PLOT_HISTORY_SECONDS),
                    last_time + timedelta(seconds=PLOT_FUTURE_SECONDS)]
         )
-    
-    return fig
\ No newline at end of file
+
+    return fig
+
+
+class ChartStream:
+    """
+    Actualizaciones incrementales del gráfico de precio de un cliente.
+
+    Los intervalos de píxel ya cerrados se reducen una sola vez y se envían
+    como puntos añadidos (para Plotly.extendTraces con `max_points`); el
+    intervalo abierto se envía aparte como `tail`, que el cliente
+    reemplaza en cada frame. Las predicciones se reenvían sólo si cambian.
+    Coordenadas x en ms epoch.
+
+    Sólo la usan los clientes de /stream/{symbol}/chart: st.plotly_chart no
+    admite añadir puntos a una figura ya enviada, así que la UI de
+    Streamlit vuelve a construir la figura (ya reducida) en cada redibujado.
+    """
+
+    def __init__(self, buffer, symbol, predictions=None,
+                 history_seconds=PLOT_HISTORY_SECONDS, buckets=PLOT_BUCKETS):
+        self.buffer = buffer
+        self.symbol = symbol.upper()
+        self.predictions = predictions
+        self.history_ms = history_seconds * 1000
+        self.width_ms = bucket_width_ms(history_seconds, buckets)
+        self.max_points = 4 * buckets
+        self.sent_until = None   # Inicio del intervalo abierto (lo anterior ya se envió)
+        self.seq = None
+        self.pred_seq = None
+
+    def frame(self):
+        """Siguiente frame como dict, o None si no hay nada nuevo"""
+        seq = self.buffer.get_sequence(self.symbol)
+        if seq == self.seq and not self._predictions_changed():
+            return None
+        last = self.buffer.get_last_tick(self.symbol)
+        if last is None:
+            return None
+        reset = self.sent_until is None or self.sent_until > last['timestamp']
+        if reset:
+            since = last['timestamp'] - self.history_ms
+        else:
+            since = self.sent_until
+        _, window = self.buffer.get_snapshot_between(self.symbol, since=since)
+        if not len(window):
+            return None
+
+        # Separar intervalos cerrados del intervalo abierto (el del último tick)
+        open_start = int(window.timestamp[-1]) // self.width_ms * self.width_ms
+        split = int(np.searchsorted(window.timestamp, open_start, side='left'))
+        closed, tail = window[:split], window[split:]
+        keep = downsample_minmax(closed.timestamp, closed.price, self.width_ms)
+
+        frame = {
+            'symbol': self.symbol,
+            'reset': reset,
+            'max_points': self.max_points,
+            'x': closed.timestamp[keep],
+            'y': closed.price[keep],
+            'tail': {'x': tail.timestamp, 'y': tail.price}
+        }
+        self.sent_until = open_start
+        self.seq = seq
+
+        if self.predictions is not None and (reset or self._predictions_changed()):
+            self.pred_seq = self.predictions.get_sequence(self.symbol)
+            now_ms = int(window.timestamp[-1])
+            (pending_ts, pending_prices), (verified_ts, pred_prices, actual_prices) = split_predictions(
+                self.predictions.get_predictions(self.symbol),
+                now_ms - self.history_ms, now_ms + PLOT_FUTURE_SECONDS * 1000
+            )
+            error_x, error_y = _error_segments(verified_ts, pred_prices, actual_prices)
+            frame['predictions'] = {
+                'pending': {'x': pending_ts, 'y': pending_prices},
+                'verified': {'x': verified_ts, 'y': actual_prices},
+                'errors': {'x': error_x, 'y': [None if np.isnan(v) else v for v in error_y.tolist()]}
+            }
+            curve = self.predictions.get_curve(self.symbol)
+            if curve:
+                x, y, lower, upper = _curve_arrays(curve, now_ms, float(window.price[-1]))
+                frame['predictions']['curve'] = {'x': x, 'y': y, 'lower': lower, 'upper': upper}
+        return frame
+
+    def _predictions_changed(self):
+        return self.predictions is not None and self.predictions.get_sequence(self.symbol) != self.pred_seq
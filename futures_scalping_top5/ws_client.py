@@ -1,24 +1,79 @@
 # ws_client.py
 
 import asyncio
+import random
 import websockets
-import json
 import threading
 import time
-from rest_api import add_tick_to_buffer
-from config import TOP_SYMBOLS, WS_RECONNECT_INTERVAL, DEBUG
+import fastjson
+from metrics import registry, ERRORS
+from data_buffer import add_ticks_to_buffer
+from order_book import order_books
+from config import (
+    TOP_SYMBOLS,
+    WS_RECONNECT_INTERVAL,
+    WS_MAX_BACKOFF,
+    WS_MAX_BATCH,
+    BINANCE_WS_URL,
+    DEPTH_ENABLED,
+    DEBUG
+)
+
+EXCHANGE_LATENCY = registry.histogram(
+    'predict_exchange_latency_seconds', "Retraso entre el trade en Binance (T) y su procesado", ('symbol',))
+TICKS_RECEIVED = registry.counter('predict_ticks_received_total', "Trades recibidos por WebSocket", ('symbol',))
+DISPATCH_SECONDS = registry.histogram(
+    'predict_ws_dispatch_seconds', "Tiempo de decodificar y entregar un lote de mensajes WS")
+RECONNECTS = registry.counter('predict_ws_reconnects_total', "Reconexiones del WebSocket de Binance")
+
+# Espera por cada mensaje extra de un lote si no hay asyncio.timeout (Python < 3.11)
+DRAIN_TIMEOUT = 0.001
+
+if hasattr(asyncio, 'timeout'):
+    async def _recv_ready(websocket):
+        """
+        Siguiente mensaje si ya está recibido; TimeoutError si habría que
+        esperarlo. Con plazo 0 la cancelación sólo llega si recv() se
+        suspende, y recv() admite cancelarse sin perder mensajes.
+        """
+        async with asyncio.timeout(0):
+            return await websocket.recv()
+else:
+    async def _recv_ready(websocket):
+        return await asyncio.wait_for(websocket.recv(), DRAIN_TIMEOUT)
 
 class BinanceWSClient:
-    def __init__(self, reconnect_interval=WS_RECONNECT_INTERVAL):
+    def __init__(self, reconnect_interval=WS_RECONNECT_INTERVAL, decoder=None, max_batch=WS_MAX_BATCH,
+                 symbols=None, url_base=BINANCE_WS_URL, on_batch=None, max_backoff=WS_MAX_BACKOFF,
+                 trades=True, depth=DEPTH_ENABLED, on_depth=None):
         self.reconnect_interval = reconnect_interval
+        self.max_backoff = max_backoff
         self.running = True
-        self.symbols = [s.lower() for s in TOP_SYMBOLS]
+        self.symbols = [s.lower() for s in (symbols or TOP_SYMBOLS)]
+        self.url_base = url_base.rstrip('/')
+        # Destino de cada lote (symbol, timestamps, prices, qtys, sides); por defecto el DataBuffer global
+        self.on_batch = on_batch or add_ticks_to_buffer
+        self.reconnects = 0
+        # Decodificador intercambiable (orjson/msgspec/json por defecto)
+        self.decode = decoder or fastjson.loads
+        self.max_batch = max_batch
+        # Destino de cada diff de profundidad (symbol, payload); por defecto los libros globales
+        self.on_depth = on_depth or order_books.on_depth
+        # Tablas precalculadas: nombre de stream -> símbolo en mayúsculas
+        self.trade_streams = {f"{sym}@trade": sym.upper() for sym in self.symbols} if trades else {}
+        self.depth_streams = {f"{sym}@depth@100ms": sym.upper() for sym in self.symbols} if depth else {}
 
     def _build_stream_url(self):
-        streams = [f"{sym}@trade" for sym in self.symbols]
-        return f"wss://fstream.binance.com/stream?streams={'/'.join(streams)}"
+        streams = list(self.trade_streams) + list(self.depth_streams)
+        return f"{self.url_base}/stream?streams={'/'.join(streams)}"
+
+    def _next_backoff(self, attempt):
+        """Backoff exponencial con jitter, propio de cada conexión"""
+        delay = min(self.max_backoff, self.reconnect_interval * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
 
     async def _ws_handler(self):
+        attempt = 0
         while self.running:
             try:
                 url = self._build_stream_url()
@@ -28,33 +83,75 @@ class BinanceWSClient:
                 async with websockets.connect(url, ping_interval=30, ping_timeout=10) as websocket:
                     if DEBUG:
                         print("WebSocket connection established")
+                    attempt = 0
                     
                     while self.running:
                         try:
-                            message = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                            data = json.loads(message)
-                            stream = data.get('stream', '')
-                            
-                            if '@trade' in stream:
-                                trade_data = data.get('data', {})
-                                symbol = trade_data.get('s', '').upper()
-                                price = float(trade_data.get('p', 0))
-                                timestamp = trade_data.get('T', 0)
-                                
-                                if symbol.lower() in self.symbols:
-                                    add_tick_to_buffer(
-                                        symbol, 
-                                        {'price': price, 'timestamp': timestamp}
-                                    )
+                            messages = await self._drain(websocket)
                         except asyncio.TimeoutError:
                             continue
-                        except Exception as e:
-                            if DEBUG:
-                                print(f"Error processing message: {str(e)[:100]}")
+                        self._dispatch(messages)
             except Exception as e:
+                if not self.running:
+                    break
+                delay = self._next_backoff(attempt)
+                attempt += 1
+                self.reconnects += 1
+                RECONNECTS.labels().inc()
+                ERRORS.labels('ws_connection').inc()
                 if DEBUG:
-                    print(f"WebSocket error: {str(e)[:100]} - Reconnecting in {self.reconnect_interval}s")
-                await asyncio.sleep(self.reconnect_interval)
+                    print(f"WebSocket error: {str(e)[:100]} - Reconnecting in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _drain(self, websocket):
+        """
+        Espera un mensaje y recoge también los que ya están en cola en el
+        socket (hasta max_batch), para despacharlos juntos.
+        """
+        messages = [await asyncio.wait_for(websocket.recv(), timeout=5.0)]
+        # Sólo con la API pública: cualquier otro error (p.ej. conexión cerrada) se propaga
+        while len(messages) < self.max_batch:
+            try:
+                messages.append(await _recv_ready(websocket))
+            except asyncio.TimeoutError:
+                break
+        return messages
+
+    def _dispatch(self, messages):
+        """Agrupa los trades por símbolo y los añade al buffer en un lote; los diffs de profundidad van al libro"""
+        started = time.perf_counter()
+        arrival_ms = time.time() * 1000
+        batches = {}
+        for message in messages:
+            try:
+                data = self.decode(message)
+                stream = data.get('stream')
+                symbol = self.trade_streams.get(stream)
+                if symbol is None:
+                    symbol = self.depth_streams.get(stream)
+                    if symbol is not None:
+                        self.on_depth(symbol, data['data'])
+                    continue
+                trade = data['data']
+                batch = batches.get(symbol)
+                if batch is None:
+                    batch = batches[symbol] = ([], [], [], [], [])
+                batch[0].append(trade['T'])
+                batch[1].append(float(trade['p']))
+                batch[2].append(float(trade['q']))
+                # m = el comprador es maker, es decir, venta agresora
+                batch[3].append(-1 if trade['m'] else 1)
+                batch[4].append(trade['t'])
+            except Exception as e:
+                ERRORS.labels('ws_decode').inc()
+                if DEBUG:
+                    print(f"Error processing message: {str(e)[:100]}")
+
+        for symbol, (timestamps, prices, qtys, sides, trade_ids) in batches.items():
+            TICKS_RECEIVED.labels(symbol).inc(len(timestamps))
+            EXCHANGE_LATENCY.labels(symbol).record_many([(arrival_ms - t) / 1000 for t in timestamps])
+            self.on_batch(symbol, timestamps, prices, qtys, sides, trade_ids)
+        DISPATCH_SECONDS.labels().record(time.perf_counter() - started)
 
     def start(self):
         self.thread = threading.Thread(target=self._run, daemon=True)